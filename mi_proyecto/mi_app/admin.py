@@ -1,8 +1,188 @@
 # Importa el módulo 'admin' de Django para gestionar el panel de administración
+from django.conf import settings
 from django.contrib import admin
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q
+from django.utils.functional import cached_property
 
 # Importa los modelos desde el archivo models.py
-from .models import Autor, Libro, Comentario
+from .models import Autor, FacetaLibro, Libro, Comentario
+from . import busqueda, paginacion
+from .cache_versionada import versiones
+
+# Modo "a escala" para los listados grandes (libros y comentarios), activo
+# salvo con MI_APP_ADMIN_A_ESCALA = False:
+#   - el total se estima (estadísticas del motor) o se cuenta solo hasta
+#     MI_APP_ADMIN_MAX_CONTEO filas, nunca un COUNT(*) de la tabla entera;
+#   - las páginas avanzan por cursor (keyset) sobre el orden fijo del listado
+#     en lugar de OFFSET, así que la página 1000 cuesta lo mismo que la 1;
+#   - los filtros laterales filtran por columnas indexadas y sus opciones salen
+#     de la tabla de facetas (ver facetas.py), una vez por versión de los datos
+#     (ver cache_versionada.py).
+PARAMETRO_CURSOR = 'desde'
+
+
+def _a_escala():
+    return getattr(settings, 'MI_APP_ADMIN_A_ESCALA', True)
+
+
+def _max_conteo():
+    return getattr(settings, 'MI_APP_ADMIN_MAX_CONTEO', 10000)
+
+
+def conteo_estimado(modelo, using='default'):
+    """Filas de la tabla según las estadísticas del motor, o None si no hay.
+
+    PostgreSQL: pg_class.reltuples (lo mantiene ANALYZE/autovacuum).
+    SQLite: sqlite_stat1 (lo rellenan ANALYZE y PRAGMA optimize).
+    """
+    conexion = connections[using]
+    tabla = modelo._meta.db_table
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)", [tabla])
+            fila = cursor.fetchone()
+            # -1: la tabla nunca se ha analizado
+            return fila[0] if fila and fila[0] >= 0 else None
+        if conexion.vendor == 'sqlite':
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'")
+            if cursor.fetchone() is None:
+                return None
+            cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [tabla])
+            fila = cursor.fetchone()
+            return int(fila[0].split()[0]) if fila else None
+    return None
+
+
+class PaginadorAcotado(Paginator):
+    """Paginador que no cuenta la tabla entera.
+
+    Sin filtros usa la estimación del motor si supera el máximo; en otro caso
+    cuenta como mucho ``MI_APP_ADMIN_MAX_CONTEO + 1`` filas. ``estimado``
+    indica que el total viene de las estadísticas del motor (puede quedarse
+    corto o pasarse) y ``acotado`` que el conteo llegó al tope, así que hay
+    más filas que el máximo.
+    """
+
+    acotado = False
+    estimado = False
+
+    @cached_property
+    def count(self):
+        maximo = _max_conteo()
+        consulta = self.object_list
+        if not consulta.query.where:
+            estimado = conteo_estimado(consulta.model, consulta.db)
+            if estimado is not None and estimado > maximo:
+                self.estimado = True
+                return estimado
+        total = consulta.order_by()[:maximo + 1].count()
+        self.acotado = total > maximo
+        return total
+
+
+class AdminAEscala(admin.ModelAdmin):
+    """Listado con total acotado y paginación por cursor sobre ``campos_cursor`` (descendente)."""
+
+    campos_cursor = ('id',)
+    show_full_result_count = False  # Evita el segundo COUNT(*) al filtrar o buscar
+    change_list_template = 'admin/mi_app/change_list_a_escala.html'
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        if not _a_escala():
+            return super().get_paginator(request, queryset, per_page, orphans, allow_empty_first_page)
+        return PaginadorAcotado(queryset, per_page, orphans, allow_empty_first_page)
+
+    def get_ordering(self, request):
+        if not _a_escala():
+            return super().get_ordering(request)
+        return tuple(f'-{campo}' for campo in self.campos_cursor)
+
+    def get_sortable_by(self, request):
+        # El cursor solo sirve para el orden fijo del listado
+        return () if _a_escala() else super().get_sortable_by(request)
+
+    def codificar_cursor(self, obj):
+        return str(obj.pk)
+
+    def filtro_cursor(self, cursor):
+        """``Q`` de las filas posteriores al cursor; None si no es válido."""
+        return Q(pk__lt=int(cursor)) if cursor.isdigit() else None
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        filtro = getattr(request, '_filtro_cursor_admin', None)
+        return queryset.filter(filtro) if filtro is not None else queryset
+
+    def changelist_view(self, request, extra_context=None):
+        if not _a_escala():
+            return super().changelist_view(request, extra_context)
+        # Los parámetros propios se quitan antes de que ChangeList los tome por filtros
+        request.GET = request.GET.copy()
+        cursor = request.GET.pop(PARAMETRO_CURSOR, [''])[-1]
+        request.GET.pop('p', None)
+        request._filtro_cursor_admin = self.filtro_cursor(cursor) if cursor else None
+        respuesta = super().changelist_view(request, extra_context)
+        contexto = getattr(respuesta, 'context_data', None)
+        if contexto is None or 'cl' not in contexto:
+            return respuesta
+        cl = contexto['cl']
+        filas = list(cl.result_list)
+        contexto['conteo_acotado'] = getattr(cl.paginator, 'acotado', False)
+        contexto['conteo_aproximado'] = getattr(cl.paginator, 'estimado', False)
+        contexto['url_primera'] = cl.get_query_string() if request._filtro_cursor_admin is not None else None
+        contexto['url_siguiente'] = (
+            cl.get_query_string({PARAMETRO_CURSOR: self.codificar_cursor(filas[-1])})
+            if filas and cl.result_count > len(filas) and not cl.show_all else None
+        )
+        return respuesta
+
+
+def opciones_en_cache(nombre, calcular):
+    """Opciones de un filtro de libros, calculadas una vez por versión de 'libro'."""
+    clave = f"mi_app:admin:filtro:{nombre}:{versiones(['libro'])['libro']}"
+    return cache.get_or_set(clave, calcular, None)
+
+
+class FiltroDecada(admin.SimpleListFilter):
+    title = 'década de publicación'
+    parameter_name = 'decada'
+
+    def lookups(self, request, model_admin):
+        def calcular():
+            decadas = (
+                FacetaLibro.objects.filter(anio__isnull=False).exclude(cuantos=0)
+                .annotate(decada=F('anio') / 10 * 10)
+                .order_by('decada').values_list('decada', flat=True).distinct()
+            )
+            return [(str(decada), f'{decada}s') for decada in decadas]
+
+        return opciones_en_cache(self.parameter_name, calcular)
+
+    def queryset(self, request, queryset):
+        if self.value() and self.value().isdigit():
+            # Rango sobre anio_publicacion: usa su índice
+            inicio = int(self.value())
+            return queryset.filter(anio_publicacion__gte=inicio, anio_publicacion__lt=inicio + 10)
+        return queryset
+
+
+class FiltroIdioma(admin.SimpleListFilter):
+    title = 'idioma'
+    parameter_name = 'idioma'
+
+    def lookups(self, request, model_admin):
+        def calcular():
+            idiomas = FacetaLibro.objects.exclude(cuantos=0).order_by('idioma').values_list('idioma', flat=True)
+            return [(idioma, idioma) for idioma in idiomas.distinct()]
+
+        return opciones_en_cache(self.parameter_name, calcular)
+
+    def queryset(self, request, queryset):
+        return queryset.filter(idioma=self.value()) if self.value() else queryset
+
 
 # Configura el panel de administración para los modelos
 @admin.register(Autor)
@@ -10,22 +190,73 @@ class AutorAdmin(admin.ModelAdmin):
     list_display = ('id', 'nombre')  # Muestra el ID y el nombre en la lista
     search_fields = ('nombre',)  # Permite buscar autores por nombre
 
+    def get_search_results(self, request, queryset, search_term):
+        # Usa el índice de texto completo en lugar de un LIKE '%q%'
+        if not search_term:
+            return queryset, False
+        return queryset.filter(busqueda.filtro_autores(search_term)), False
+
 
 @admin.register(Libro)
-class LibroAdmin(admin.ModelAdmin):
-    list_display = ('id', 'titulo', 'mostrar_autores', 'anio_publicacion', 'idioma')  # Campos a mostrar
+class LibroAdmin(AdminAEscala):
+    list_display = ('id', 'titulo', 'mostrar_autores', 'anio_publicacion', 'idioma', 'num_comentarios')  # Campos a mostrar
     search_fields = ('titulo', 'autores__nombre')  # Búsqueda por título y autores
-    list_filter = ('anio_publicacion', 'idioma')  # Filtros por año de publicación y idioma
+    list_filter = (FiltroDecada, FiltroIdioma)  # Filtros por década de publicación e idioma
+    autocomplete_fields = ('autores',)  # Sin un <select> con todos los autores
+
+    def get_search_results(self, request, queryset, search_term):
+        # Título y autores se buscan en el índice de texto completo, sin JOIN ni duplicados
+        if not search_term:
+            return queryset, False
+        return queryset.filter(busqueda.filtro_libros(search_term)), False
 
     def mostrar_autores(self, obj):
-        # Devuelve una lista de autores como un string separado por comas
-        return ", ".join([autor.nombre for autor in obj.autores.all()])
+        # Nombres de autores desnormalizados en el propio libro (sin consulta por fila)
+        return obj.autores_nombres
     mostrar_autores.short_description = 'Autores'  # Nombre que aparecerá en el admin
+    mostrar_autores.admin_order_field = 'autores_nombres'  # Permite ordenar por autores
 
 
 @admin.register(Comentario)
-class ComentarioAdmin(admin.ModelAdmin):
-    list_display = ('id', 'libro', 'usuario', 'texto', 'fecha')  # Campos a mostrar
+class ComentarioAdmin(AdminAEscala):
+    list_display = ('id', 'mostrar_libro', 'mostrar_usuario', 'texto', 'fecha')  # Campos a mostrar
+    list_select_related = ('libro', 'usuario')  # Libro y usuario en la misma consulta
     search_fields = ('libro__titulo', 'usuario__username', 'texto')  # Permite buscar por libro, usuario o texto
-    list_filter = ('fecha',)  # Filtro lateral por fecha
+    list_filter = ('fecha',)  # Filtro lateral por fecha (rangos sobre el índice de fecha)
     ordering = ('-fecha',)  # Ordena por fecha descendente
+    autocomplete_fields = ('libro', 'usuario')
+    # Mismo orden que el índice (fecha, id)
+    campos_cursor = ('fecha', 'id')
+
+    def get_queryset(self, request):
+        # __str__ usa el libro y el usuario (borrado, historial, mensajes)
+        return super().get_queryset(request).select_related('libro', 'usuario')
+
+    def get_search_results(self, request, queryset, search_term):
+        # Texto y libro en los índices de texto completo y usuario por nombre
+        # exacto, en lugar de LIKE '%q%' sobre tres tablas
+        if not search_term:
+            return queryset, False
+        return queryset.filter(
+            busqueda.filtro_comentarios(search_term)
+            | Q(libro__in=Libro.objects.filter(busqueda.filtro_libros(search_term)).values('id'))
+            | Q(usuario__username=search_term)
+        ), False
+
+    def codificar_cursor(self, obj):
+        return paginacion.codificar_cursor(obj.fecha, obj.pk)
+
+    def filtro_cursor(self, cursor):
+        try:
+            fecha, pk = paginacion.decodificar_cursor(cursor)
+        except paginacion.CursorInvalido:
+            return None
+        return Q(fecha__lt=fecha) | Q(fecha=fecha, id__lt=pk)
+
+    @admin.display(description='Libro', ordering='libro__titulo')
+    def mostrar_libro(self, obj):
+        return obj.libro.titulo
+
+    @admin.display(description='Usuario', ordering='usuario__username')
+    def mostrar_usuario(self, obj):
+        return obj.usuario.username
@@ -0,0 +1,38 @@
+# Trabajo diferido hasta que se confirma la transacción en curso.
+#
+# Varias escrituras de una misma transacción (editar un libro guarda el libro
+# y cambia sus autores; borrar N libros emite N señales) piden el mismo
+# refresco: versiones de caché, rankings, libros similares. Cada una suma sus
+# valores a un conjunto por hilo y registra un callback de on_commit; el
+# primero que se ejecuta vacía el conjunto y hace el trabajo una sola vez con
+# todo lo acumulado, los demás no encuentran nada que hacer. Si la
+# transacción se revierte, los valores quedan para la siguiente, lo que solo
+# cuesta un refresco de más.
+#
+# Fuera de una transacción on_commit ejecuta el callback en el acto. Con
+# robust=True un fallo del refresco se registra en el log pero no convierte
+# en error una escritura que ya se confirmó.
+import threading
+
+from django.db import transaction
+
+
+class AlConfirmar:
+    """Acumula valores y llama a ``aplicar(valores)`` una vez al confirmar."""
+
+    def __init__(self, aplicar):
+        self.aplicar = aplicar
+        self._local = threading.local()
+
+    def agregar(self, valores):
+        pendientes = getattr(self._local, 'valores', None)
+        if pendientes is None:
+            pendientes = self._local.valores = set()
+        pendientes.update(valores)
+        transaction.on_commit(self._vaciar, robust=True)
+
+    def _vaciar(self):
+        valores = getattr(self._local, 'valores', None)
+        self._local.valores = None
+        if valores:
+            self.aplicar(valores)
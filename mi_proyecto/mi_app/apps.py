@@ -1,5 +1,6 @@
 # Importa AppConfig, que es una clase base para configurar una aplicación de Django
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 # Definimos una clase de configuración llamada 'MiAppConfig', que hereda de AppConfig
@@ -9,3 +10,20 @@ class MiAppConfig(AppConfig):
     
     # Nombre de la aplicación; debe coincidir con el nombre de la carpeta de la app
     name = 'mi_app'
+
+    def ready(self):
+        # Registra las señales que invalidan la caché de respuestas, las que
+        # mantienen los campos desnormalizados de Libro, las facetas, los
+        # rankings, los libros similares y el registro de cambios, y la
+        # instrumentación de consultas de cada conexión nueva
+        from . import cambios, desnormalizacion, facetas, metricas, rankings, signals, similares  # noqa: F401
+
+        # Las migraciones que reconstruyen tablas en SQLite borran los triggers
+        # del índice de búsqueda; se reinstalan al terminar cada migrate
+        post_migrate.connect(_reinstalar_indice_busqueda, sender=self)
+
+
+def _reinstalar_indice_busqueda(using, **kwargs):
+    from django.db import connections
+    from .busqueda import instalar_indice
+    instalar_indice(connections[using])
@@ -0,0 +1,165 @@
+# Autenticación barata para la API JSON.
+#
+# Cada llamada AJAX con @login_required lee la sesión y el usuario; la página
+# de DataTables lanza tres a la vez en cada recarga. Para que no cuesten
+# consultas:
+#   - SESSION_ENGINE cached_db: la sesión se lee de la caché (la base solo se
+#     consulta si la entrada fue expulsada).
+#   - UsuarioEnCacheBackend guarda del usuario resuelto solo el id, el nombre,
+#     is_active/is_staff/is_superuser y el hash de sesión (un HMAC de la
+#     contraseña, que Django compara con el guardado en la sesión), nunca el
+#     hash de la contraseña. El usuario que devuelve tiene el resto de campos
+#     diferidos: leerlos cuesta una consulta y save() solo escribe los
+#     cargados. La entrada dura MI_APP_USUARIO_CACHE_SEGUNDOS y se borra al
+#     guardar o eliminar el usuario y otra vez al confirmar; con varios
+#     procesos la caché debe ser compartida (Redis/Memcached) para que el
+#     borrado llegue a todos. Dentro de una petición, AuthenticationMiddleware
+#     ya memoriza request.user y request.auser().
+#   - Tokens firmados de corta duración (POST /api/token/) para lecturas:
+#     TokenApiMiddleware acepta "Authorization: Bearer <token>" en GET/HEAD de
+#     las vistas de mi_app y construye el usuario a partir del propio token,
+#     sin tocar sesión ni base de datos. No se pueden revocar: caducan en
+#     MI_APP_TOKEN_API_SEGUNDOS.
+#
+# Ajustes:
+#   AUTHENTICATION_BACKENDS = ['mi_app.autenticacion.UsuarioEnCacheBackend']
+#   MI_APP_USUARIO_CACHE_SEGUNDOS = 300
+#   MI_APP_TOKEN_API_SEGUNDOS = 300
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core import signing
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import DEFERRED
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import JsonResponse
+
+SAL_TOKEN = 'mi_app.token_api'
+METODOS_TOKEN = ('GET', 'HEAD')
+
+
+def _clave_usuario(user_id):
+    return f'mi_app:usuario:{user_id}'
+
+
+def _segundos_cache():
+    return getattr(settings, 'MI_APP_USUARIO_CACHE_SEGUNDOS', 300)
+
+
+# Campos que se guardan en la caché; el resto quedan diferidos
+CAMPOS_EN_CACHE = ('id', 'username', 'is_active', 'is_staff', 'is_superuser')
+
+
+def _datos(usuario):
+    datos = {campo: getattr(usuario, campo) for campo in CAMPOS_EN_CACHE}
+    datos['hash_sesion'] = usuario.get_session_auth_hash()
+    return datos
+
+
+def _usuario(datos):
+    """``User`` con los campos de ``datos`` cargados y los demás diferidos."""
+    usuario = User.from_db(
+        DEFAULT_DB_ALIAS, [campo.attname for campo in User._meta.concrete_fields],
+        [datos.get(campo.attname, DEFERRED) for campo in User._meta.concrete_fields],
+    )
+    # Sin leer la contraseña diferida: es lo que compara django.contrib.auth.get_user
+    hash_sesion = datos['hash_sesion']
+    usuario.get_session_auth_hash = lambda: hash_sesion
+    return usuario
+
+
+class UsuarioEnCacheBackend(ModelBackend):
+    """ModelBackend que resuelve el usuario de la sesión desde la caché."""
+
+    def get_user(self, user_id):
+        clave = _clave_usuario(user_id)
+        datos = cache.get(clave)
+        if datos is None:
+            usuario = super().get_user(user_id)
+            if usuario is None:
+                return None
+            datos = _datos(usuario)
+            cache.set(clave, datos, _segundos_cache())
+        usuario = _usuario(datos)
+        return usuario if self.user_can_authenticate(usuario) else None
+
+    async def aget_user(self, user_id):
+        clave = _clave_usuario(user_id)
+        datos = await cache.aget(clave)
+        if datos is None:
+            usuario = await super().aget_user(user_id)
+            if usuario is None:
+                return None
+            datos = _datos(usuario)
+            await cache.aset(clave, datos, _segundos_cache())
+        usuario = _usuario(datos)
+        return usuario if self.user_can_authenticate(usuario) else None
+
+
+@receiver([post_save, post_delete], sender=User)
+def usuario_cambiado(sender, instance, **kwargs):
+    # Cambio de contraseña, is_staff, is_active o baja: la copia deja de valer.
+    # Se borra también al confirmar: entretanto una petición concurrente pudo
+    # volver a guardar la fila anterior
+    clave = _clave_usuario(instance.pk)
+    cache.delete(clave)
+    transaction.on_commit(partial(cache.delete, clave), robust=True)
+
+
+def emitir_token(usuario):
+    """Token firmado con el id, el nombre y is_staff del usuario."""
+    return signing.TimestampSigner(salt=SAL_TOKEN).sign_object(
+        {'id': usuario.pk, 'nombre': usuario.get_username(), 'staff': usuario.is_staff}, compress=True,
+    )
+
+
+def leer_token(token):
+    """Devuelve un ``User`` sin guardar con los datos del token, o None si no es válido o caducó."""
+    try:
+        datos = signing.TimestampSigner(salt=SAL_TOKEN).unsign_object(
+            token, max_age=getattr(settings, 'MI_APP_TOKEN_API_SEGUNDOS', 300),
+        )
+    except signing.BadSignature:
+        return None
+    usuario = User(pk=datos['id'], username=datos['nombre'], is_staff=datos['staff'], is_active=True)
+    usuario.token_api = True
+    return usuario
+
+
+class TokenApiMiddleware:
+    # Va después de AuthenticationMiddleware: sustituye el usuario perezoso de
+    # la sesión antes de que nadie lo evalúe, así la sesión ni se carga
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        # En modo async devuelve la corrutina de get_response, que espera el manejador
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        cabecera = request.headers.get('Authorization', '')
+        if not cabecera.startswith('Bearer '):
+            return None
+        # Solo lecturas de la API de mi_app: las escrituras siguen exigiendo sesión y CSRF
+        if request.method not in METODOS_TOKEN or request.resolver_match.app_name != 'mi_app':
+            return JsonResponse({'error': 'El token solo permite lecturas de la API.'}, status=403)
+        usuario = leer_token(cabecera[len('Bearer '):].strip())
+        if usuario is None:
+            return JsonResponse({'error': 'Token inválido o caducado.'}, status=401)
+        request.user = usuario
+
+        async def auser():
+            return usuario
+
+        request.auser = auser
+        return None
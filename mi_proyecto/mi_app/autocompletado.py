@@ -0,0 +1,136 @@
+# Índice de prefijos en memoria para el autocompletado de autores.
+#
+# El selector Select2 de index.html llama a /autores/buscar/ en cada tecla.
+# En lugar de consultar la base cada vez, cada proceso guarda una lista
+# ordenada con los nombres normalizados (sin acentos ni mayúsculas) y busca
+# los prefijos con bisect: la respuesta sale de memoria, sin consultas.
+#
+# Cada nombre entra una vez por palabra ("gabriel garcia marquez",
+# "garcia marquez", "marquez"), así "garcia mar" encuentra a Gabriel García
+# Márquez. El índice se construye la primera vez que se usa y se reconstruye
+# cuando cambia la versión 'autor' de cache_versionada (las señales y las
+# rutas masivas la renuevan en cada escritura): comprobarla es una lectura de
+# la caché, no de la base.
+#
+# Orden de los resultados: nombre exacto, nombre que empieza por el texto,
+# coincidencia en una palabra posterior (antes cuanto más a la izquierda),
+# nombre más corto y, por último, alfabético.
+import bisect
+import heapq
+import threading
+import unicodedata
+
+from asgiref.sync import sync_to_async
+
+from .cache_versionada import aversiones, versiones
+from .models import Autor
+
+# Los resultados de prefijos de hasta este largo (los que más coinciden) se
+# memorizan dentro de cada versión del índice
+LARGO_MEMORIZADO = 2
+# Tope de la memoria de prefijos cortos: con nombres no latinos puede haber
+# muchos prefijos distintos de dos letras
+MAX_MEMORIZADOS = 5000
+
+
+def normalizar(texto):
+    """Minúsculas, sin diacríticos y con los espacios colapsados."""
+    if texto.isascii():
+        return ' '.join(texto.lower().split())
+    descompuesto = unicodedata.normalize('NFKD', texto)
+    sin_marcas = ''.join(c for c in descompuesto if not unicodedata.combining(c))
+    return ' '.join(sin_marcas.casefold().split())
+
+
+class IndicePrefijos:
+    """Lista ordenada de ``(clave, posición, id)`` de una versión de los autores."""
+
+    def __init__(self, autores, version=None):
+        self.version = version
+        self.nombres = {}
+        entradas = []
+        for autor_id, nombre in autores:
+            self.nombres[autor_id] = nombre
+            palabras = normalizar(nombre).split(' ')
+            for posicion in range(len(palabras)):
+                entradas.append((' '.join(palabras[posicion:]), posicion, autor_id))
+        entradas.sort()
+        # Listas paralelas: bisect trabaja sobre las claves sin crear tuplas
+        self.claves = [clave for clave, _, _ in entradas]
+        self.posiciones = [posicion for _, posicion, _ in entradas]
+        self.ids = [autor_id for _, _, autor_id in entradas]
+        self.largos = {autor_id: len(nombre) for autor_id, nombre in self.nombres.items()}
+        self._memorizados = {}
+
+    def __len__(self):
+        return len(self.nombres)
+
+    def buscar(self, texto, limite=10):
+        """Devuelve ``[(id, nombre)]`` con los ``limite`` mejores autores para ``texto``."""
+        prefijo = normalizar(texto)
+        if not prefijo:
+            return []
+        memorizar = len(prefijo) <= LARGO_MEMORIZADO
+        if memorizar and (prefijo, limite) in self._memorizados:
+            return self._memorizados[prefijo, limite]
+        inicio = bisect.bisect_left(self.claves, prefijo)
+        # Toda clave que empieza por el prefijo es menor que prefijo + U+FFFF
+        fin = bisect.bisect_left(self.claves, prefijo + '\uffff', inicio)
+        mejores = {}
+        for indice in range(inicio, fin):
+            autor_id = self.ids[indice]
+            orden = (
+                self.claves[indice] != prefijo or self.posiciones[indice] > 0,
+                self.posiciones[indice],
+                self.largos[autor_id],
+                self.claves[indice],
+            )
+            previo = mejores.get(autor_id)
+            if previo is None or orden < previo:
+                mejores[autor_id] = orden
+        elegidos = heapq.nsmallest(limite, mejores.items(), key=lambda par: par[1])
+        resultado = [(autor_id, self.nombres[autor_id]) for autor_id, _ in elegidos]
+        if memorizar and len(self._memorizados) < MAX_MEMORIZADOS:
+            self._memorizados[prefijo, limite] = resultado
+        return resultado
+
+
+_indice = None
+_bloqueo = threading.Lock()
+
+
+def _construir(version):
+    global _indice
+    with _bloqueo:
+        # Otro hilo pudo construirlo mientras se esperaba el bloqueo
+        if _indice is None or _indice.version != version:
+            _indice = IndicePrefijos(Autor.objects.values_list('id', 'nombre').iterator(), version)
+        return _indice
+
+
+def indice():
+    """Índice de la versión actual de los autores; lo reconstruye si cambió."""
+    # La versión se lee antes que los autores: una escritura durante la
+    # construcción la renueva y el índice se rehace en la siguiente llamada
+    version = versiones(['autor'])['autor']
+    actual = _indice
+    if actual is not None and actual.version == version:
+        return actual
+    return _construir(version)
+
+
+async def aindice():
+    """Versión asíncrona de ``indice``."""
+    version = (await aversiones(['autor']))['autor']
+    actual = _indice
+    if actual is not None and actual.version == version:
+        return actual
+    return await sync_to_async(_construir)(version)
+
+
+def buscar(texto, limite=10):
+    return indice().buscar(texto, limite)
+
+
+async def abuscar(texto, limite=10):
+    return (await aindice()).buscar(texto, limite)
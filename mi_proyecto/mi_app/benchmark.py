@@ -0,0 +1,303 @@
+# Banco de pruebas de rendimiento para los endpoints de mi_app.
+#
+# generar_catalogo() crea un catálogo sintético con el mismo esquema que
+# BD_LIBRERIA.csv (autores y comentarios con distribución de Zipf, vocabulario
+# e idiomas tomados del CSV real) y lo carga con el importador masivo.
+# ejecutar() recorre los escenarios con el cliente de pruebas de Django y
+# mide latencia (p50/p95/p99), consultas por petición y memoria pico. El
+# resultado es un dict serializable a JSON que puede compararse con una
+# ejecución anterior mediante comparar().
+import bisect
+import csv
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client
+
+from . import cambios, rankings
+from .cache_versionada import invalidar
+from .desnormalizacion import recalcular_todo
+from .importacion import ImportadorCatalogo, leer_en_bloques
+from .models import Autor, Comentario, Libro
+
+CSV_REFERENCIA = os.path.join(
+    os.path.dirname(__file__), 'management', 'commands', 'data', 'BD_LIBRERIA.csv'
+)
+COLUMNAS_CSV = [
+    'Book_ID', 'Authors', 'Publication_Year', 'Title', 'title', 'language_code',
+    'average_rating', 'Ratings_Count', 'Total_Ratings', 'Text_Reviews',
+    'One_Star_Ratings', 'Two_Star_Ratings', 'Three_Star_Ratings',
+    'Four_Star_Ratings', 'Five_Star_Ratings',
+]
+AJAX = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+
+class Zipf:
+    """Muestreador de rangos 0..n-1 con probabilidad proporcional a 1/(k+1)^s."""
+
+    def __init__(self, n, s=1.1, rnd=random):
+        self.rnd = rnd
+        self.acumulado = list(itertools.accumulate(1.0 / (k + 1) ** s for k in range(n)))
+
+    def __call__(self):
+        return bisect.bisect_left(self.acumulado, self.rnd.random() * self.acumulado[-1])
+
+
+def _referencia():
+    palabras, idiomas = set(), []
+    with open(CSV_REFERENCIA, encoding='utf-8', newline='') as archivo:
+        for fila in csv.DictReader(archivo):
+            palabras.update(re.findall(r'[^\W\d_]{3,}', fila['Title']))
+            idiomas.append(fila['language_code'] or 'eng')
+    return sorted(palabras), idiomas
+
+
+def escribir_csv_sintetico(ruta, libros, autores, rnd):
+    """Escribe un CSV con el esquema de BD_LIBRERIA.csv y ``libros`` filas."""
+    palabras, idiomas = _referencia()
+    nombres = [f'{rnd.choice(palabras)} {rnd.choice(palabras)} {k}' for k in range(autores)]
+    autor_zipf = Zipf(autores, rnd=rnd)
+    with open(ruta, 'w', encoding='utf-8', newline='') as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(COLUMNAS_CSV)
+        for libro_id in range(1, libros + 1):
+            titulo = ' '.join(rnd.choice(palabras) for _ in range(rnd.randint(1, 5))) + f' {libro_id}'
+            coautores = {nombres[autor_zipf()] for _ in range(1 + int(rnd.random() < 0.2))}
+            estrellas = [rnd.randint(0, 5000) for _ in range(5)]
+            total = sum(estrellas)
+            promedio = sum((i + 1) * n for i, n in enumerate(estrellas)) / max(total, 1)
+            escritor.writerow([
+                libro_id, ', '.join(sorted(coautores)), f'{rnd.randint(1800, 2024)}.0', titulo, titulo,
+                rnd.choice(idiomas), f'{promedio:.2f}', total, total, rnd.randint(0, 500), *estrellas,
+            ])
+
+
+def generar_catalogo(libros, autores=None, comentarios=None, usuarios=50, semilla=0, salida=sys.stdout):
+    """Genera y carga un catálogo sintético. Devuelve un resumen con los tiempos."""
+    rnd = random.Random(semilla)
+    autores = autores or max(libros // 5, 1)
+    comentarios = libros * 2 if comentarios is None else comentarios
+    inicio = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as carpeta:
+        ruta = os.path.join(carpeta, 'catalogo.csv')
+        escribir_csv_sintetico(ruta, libros, autores, rnd)
+        importador = ImportadorCatalogo()
+        for bloque in leer_en_bloques(ruta):
+            importador.importar_bloque(bloque)
+    salida.write(f'Catálogo cargado: {importador.libros_creados} libros, {importador.autores_creados} autores\n')
+
+    nombres_usuario = [f'bench{k}' for k in range(usuarios)]
+    existentes = set(User.objects.filter(username__in=nombres_usuario).values_list('username', flat=True))
+    User.objects.bulk_create([
+        User(username=nombre, is_staff=(k == 0))
+        for k, nombre in enumerate(nombres_usuario) if nombre not in existentes
+    ])
+    cuentas = list(User.objects.filter(username__in=nombres_usuario).values_list('id', flat=True))
+    libro_ids = list(Libro.objects.order_by('id').values_list('id', flat=True))
+    libro_zipf = Zipf(len(libro_ids), rnd=rnd)
+    usuario_zipf = Zipf(len(cuentas), rnd=rnd)
+    pendientes = []
+    for _ in range(comentarios):
+        pendientes.append(Comentario(
+            libro_id=libro_ids[libro_zipf()], usuario_id=cuentas[usuario_zipf()],
+            texto=' '.join(rnd.choice(('bueno', 'malo', 'excelente', 'aburrido', 'recomendado')) for _ in range(8)),
+        ))
+        if len(pendientes) >= 5000:
+            Comentario.objects.bulk_create(pendientes)
+            pendientes = []
+    Comentario.objects.bulk_create(pendientes)
+    # bulk_create no emite señales: se recalculan contadores, rankings y la caché
+    recalcular_todo()
+    rankings.recalcular_todo()
+    invalidar('autor', 'libro', 'comentario', 'usuario')
+    cambios.marcar_recarga()
+    return {
+        'libros': Libro.objects.count(),
+        'autores': Autor.objects.count(),
+        'comentarios': Comentario.objects.count(),
+        'segundos_generacion': round(time.perf_counter() - inicio, 3),
+    }
+
+
+class _ContadorConsultas:
+    def __init__(self):
+        self.consultas = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.consultas += 1
+        return execute(sql, params, many, context)
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return None
+    indice = min(int(round(p / 100 * (len(ordenados) - 1))), len(ordenados) - 1)
+    return ordenados[indice]
+
+
+def rss_pico_mb():
+    """Memoria máxima del proceso en MB, o None donde no hay ``resource`` (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss está en KiB en Linux y en bytes en macOS
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _escenarios(rnd):
+    """Devuelve ``{nombre: funcion(cliente) -> respuesta}`` para cada endpoint medido."""
+    libro_ids = list(Libro.objects.order_by('id').values_list('id', flat=True))
+    nombres = list(Autor.objects.order_by('?').values_list('nombre', flat=True)[:500])
+    autor_ids = list(Autor.objects.order_by('id').values_list('id', flat=True)[:1000])
+    libro_zipf = Zipf(len(libro_ids), rnd=rnd)
+    comentarios_propios = []
+    idiomas = list(Libro.objects.order_by().values_list('idioma', flat=True).distinct()) or ['eng']
+    decadas = [str(anio // 10 * 10) for anio in range(1800, 2030, 10)]
+
+    def pagina_libros(cliente):
+        columna = rnd.choice((0, 1, 3, 4))
+        params = {
+            'draw': 1, 'start': rnd.randint(0, 50) * 10, 'length': 10,
+            'columns[0][data]': 'id', 'columns[1][data]': 'titulo', 'columns[2][data]': 'autores_nombres',
+            'columns[3][data]': 'anio_publicacion', 'columns[4][data]': 'idioma',
+            'order[0][column]': columna, 'order[0][dir]': rnd.choice(('asc', 'desc')),
+        }
+        if rnd.random() < 0.3:
+            params['search[value]'] = rnd.choice(nombres).split()[0][:4]
+        return cliente.get('/libros/', params)
+
+    def listado_libros(cliente):
+        # Listado completo, comprimido como lo pide un navegador. La primera vez
+        # se transmite (y se consume el cuerpo para medirlo entero); después sale
+        # de la caché ya comprimido
+        respuesta = cliente.get(
+            '/libros/', {'formato': rnd.choice(('json', 'ndjson'))}, HTTP_ACCEPT_ENCODING='gzip, deflate, br',
+        )
+        if respuesta.streaming:
+            for _ in respuesta.streaming_content:
+                pass
+        return respuesta
+
+    def ranking_libros(cliente):
+        por = rnd.choice(('global', 'idioma', 'decada'))
+        claves = {'global': [''], 'idioma': idiomas, 'decada': decadas}[por]
+        return cliente.get('/libros/ranking/', {'por': por, 'clave': rnd.choice(claves), 'limite': 20})
+
+    def buscar_autores(cliente):
+        prefijo = rnd.choice(nombres)[:rnd.randint(1, 6)]
+        return cliente.get('/autores/buscar/', {'q': prefijo}, **AJAX)
+
+    def obtener_comentarios(cliente):
+        return cliente.get(f'/libros/{libro_ids[libro_zipf()]}/comentarios/')
+
+    def agregar_libro(cliente):
+        cuerpo = {
+            'titulo': f'Libro de prueba {rnd.random()}', 'anio_publicacion': rnd.randint(1900, 2024),
+            'idioma': 'spa', 'autores': rnd.sample(autor_ids, min(2, len(autor_ids))),
+        }
+        return cliente.post('/libros/agregar/', json.dumps(cuerpo), content_type='application/json', **AJAX)
+
+    def editar_libro(cliente):
+        libro_id = libro_ids[libro_zipf()]
+        cuerpo = {
+            'titulo': f'Editado {rnd.random()}', 'anio_publicacion': rnd.randint(1900, 2024),
+            'idioma': 'eng', 'autores': rnd.sample(autor_ids, min(1, len(autor_ids))),
+        }
+        return cliente.post(f'/libros/editar/{libro_id}/', json.dumps(cuerpo), content_type='application/json', **AJAX)
+
+    def agregar_comentario(cliente):
+        libro_id = libro_ids[libro_zipf()]
+        respuesta = cliente.post(
+            f'/libros/{libro_id}/comentarios/agregar/', json.dumps({'texto': 'comentario de carga'}),
+            content_type='application/json', **AJAX,
+        )
+        if respuesta.status_code == 201:
+            comentarios_propios.append(respuesta.json()['comentario']['id'])
+        return respuesta
+
+    def eliminar_comentario(cliente):
+        if not comentarios_propios:
+            return agregar_comentario(cliente)
+        return cliente.post(f'/comentarios/eliminar/{comentarios_propios.pop()}/', **AJAX)
+
+    return {
+        'obtener_libros': pagina_libros,
+        'listado_libros': listado_libros,
+        'ranking_libros': ranking_libros,
+        'buscar_autores': buscar_autores,
+        'obtener_comentarios': obtener_comentarios,
+        'agregar_libro': agregar_libro,
+        'editar_libro': editar_libro,
+        'agregar_comentario': agregar_comentario,
+        'eliminar_comentario': eliminar_comentario,
+    }
+
+
+def ejecutar(peticiones=200, semilla=0, sin_cache=False, escenarios=None):
+    """Mide cada escenario ``peticiones`` veces y devuelve los resultados."""
+    rnd = random.Random(semilla)
+    usuario = User.objects.filter(is_staff=True).first() or User.objects.create(username='bench_admin', is_staff=True)
+    cliente = Client()
+    cliente.force_login(usuario)
+    contador = _ContadorConsultas()
+    resultados = {}
+    for nombre, escenario in _escenarios(rnd).items():
+        if escenarios and nombre not in escenarios:
+            continue
+        latencias, consultas, errores = [], [], 0
+        for _ in range(peticiones):
+            if sin_cache:
+                cache.clear()
+            contador.consultas = 0
+            with connections['default'].execute_wrapper(contador):
+                inicio = time.perf_counter()
+                respuesta = escenario(cliente)
+                latencias.append((time.perf_counter() - inicio) * 1000)
+            consultas.append(contador.consultas)
+            errores += respuesta.status_code >= 400
+        resultados[nombre] = {
+            'peticiones': peticiones,
+            'errores': errores,
+            'p50_ms': round(percentil(latencias, 50), 3),
+            'p95_ms': round(percentil(latencias, 95), 3),
+            'p99_ms': round(percentil(latencias, 99), 3),
+            'consultas_media': round(sum(consultas) / len(consultas), 2),
+            'consultas_max': max(consultas),
+        }
+    return {
+        'escenarios': resultados,
+        'rss_pico_mb': rss_pico_mb(),
+    }
+
+
+def comparar(actual, base, umbral=20.0):
+    """Compara dos resultados y devuelve líneas de texto y si hubo regresiones.
+
+    Se considera regresión un aumento de p95 o de consultas medias mayor que
+    ``umbral`` por ciento respecto a ``base``.
+    """
+    lineas, regresion = [], False
+    for nombre, datos in actual['escenarios'].items():
+        previo = base.get('escenarios', {}).get(nombre)
+        if not previo:
+            continue
+        for metrica in ('p95_ms', 'consultas_media'):
+            antes, ahora = previo[metrica], datos[metrica]
+            cambio = (ahora - antes) / antes * 100 if antes else 0.0
+            marca = ''
+            if cambio > umbral:
+                marca, regresion = '  <-- REGRESIÓN', True
+            lineas.append(f'{nombre:22} {metrica:16} {antes:>10} -> {ahora:<10} ({cambio:+.1f}%){marca}')
+    return lineas, regresion
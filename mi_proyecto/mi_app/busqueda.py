@@ -0,0 +1,203 @@
+# Búsqueda de texto completo con tablas virtuales FTS5 de SQLite.
+#
+# Hay una tabla FTS5 de contenido externo por cada modelo indexado (títulos de
+# libros, nombres de autores y textos de comentarios). Se mantienen al día con
+# triggers, de modo que también las inserciones masivas (bulk_create) quedan
+# indexadas. El tokenizador unicode61 con remove_diacritics pliega los acentos
+# ("garcia" encuentra "García") y los índices de prefijo aceleran el
+# autocompletado. En otros motores se recurre a icontains.
+import re
+
+from django.db import connections, router
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import Autor, Comentario, Libro
+
+TOKENIZADOR = "unicode61 remove_diacritics 2"
+
+# (tabla FTS, tabla de contenido, columna indexada)
+TABLAS_FTS = (
+    ('mi_app_libro_fts', 'mi_app_libro', 'titulo'),
+    ('mi_app_autor_fts', 'mi_app_autor', 'nombre'),
+    ('mi_app_comentario_fts', 'mi_app_comentario', 'texto'),
+)
+
+# Peso relativo de cada origen en el ranking de libros (bm25 es negativo:
+# cuanto menor, más relevante)
+PESO_TITULO = 1.0
+PESO_AUTOR = 0.8
+PESO_COMENTARIO = 0.5
+
+# Alias de base de datos -> si tiene las tablas FTS5 (se comprueba una vez por alias)
+_disponible = {}
+
+
+def _sentencias(fts, tabla, columna):
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{columna}, content='{tabla}', content_rowid='id', "
+        f"tokenize='{TOKENIZADOR}', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columna}) VALUES (new.id, new.{columna}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columna}) VALUES ('delete', old.id, old.{columna}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columna} ON {tabla} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columna}) VALUES ('delete', old.id, old.{columna}); "
+        f"INSERT INTO {fts}(rowid, {columna}) VALUES (new.id, new.{columna}); END",
+    ]
+
+
+def instalar_indice(conexion):
+    """Crea las tablas FTS5 y sus triggers si faltan y reconstruye el índice.
+
+    Es idempotente. Las migraciones que reconstruyen una tabla en SQLite
+    eliminan sus triggers, por eso también se ejecuta tras cada ``migrate``.
+    """
+    if conexion.vendor != 'sqlite':
+        return
+    with conexion.cursor() as cursor:
+        cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")
+        existentes = {fila[0] for fila in cursor.fetchall()}
+        for fts, tabla, columna in TABLAS_FTS:
+            esperados = {fts, f'{fts}_ai', f'{fts}_ad', f'{fts}_au'}
+            if tabla not in existentes or esperados <= existentes:
+                continue
+            for sentencia in _sentencias(fts, tabla, columna):
+                cursor.execute(sentencia)
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+    _disponible.pop(conexion.alias, None)
+
+
+def eliminar_indice(conexion):
+    if conexion.vendor != 'sqlite':
+        return
+    with conexion.cursor() as cursor:
+        for fts, _, _ in TABLAS_FTS:
+            for sufijo in ('_ai', '_ad', '_au'):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {fts}{sufijo}")
+            cursor.execute(f"DROP TABLE IF EXISTS {fts}")
+    _disponible.pop(conexion.alias, None)
+
+
+def indice_disponible(alias):
+    """True si la base ``alias`` tiene las tablas FTS5 (una réplica puede no tenerlas)."""
+    conexion = connections[alias]
+    if conexion.vendor != 'sqlite':
+        return False
+    if alias not in _disponible:
+        with conexion.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN (%s, %s, %s)",
+                [fts for fts, _, _ in TABLAS_FTS],
+            )
+            _disponible[alias] = cursor.fetchone()[0] == len(TABLAS_FTS)
+    return _disponible[alias]
+
+
+def consulta_fts(texto):
+    """Traduce el texto del usuario a una consulta FTS5 de prefijos.
+
+    Cada palabra se cita para neutralizar la sintaxis de FTS5 y se le añade
+    ``*`` para buscar por prefijo; todas las palabras deben aparecer.
+    """
+    palabras = re.findall(r'\w+', texto)
+    return ' '.join(f'"{palabra}"*' for palabra in palabras)
+
+
+def buscar_libros(texto, limite=20, incluir_comentarios=True):
+    """Devuelve los ids de libros más relevantes para ``texto``, en orden."""
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    # SQL directo: la base de lectura se pide al router (puede ser una réplica)
+    alias = router.db_for_read(Libro)
+    if not indice_disponible(alias):
+        condicion = Q(titulo__icontains=texto) | Q(autores__nombre__icontains=texto)
+        if incluir_comentarios:
+            condicion |= Q(comentarios__texto__icontains=texto)
+        return list(Libro.objects.filter(condicion).distinct().values_list('id', flat=True)[:limite])
+
+    partes = [
+        f"SELECT rowid AS libro_id, bm25(mi_app_libro_fts) * {PESO_TITULO} AS puntaje "
+        "FROM mi_app_libro_fts WHERE mi_app_libro_fts MATCH %s",
+        f"SELECT r.libro_id, bm25(mi_app_autor_fts) * {PESO_AUTOR} "
+        "FROM mi_app_autor_fts JOIN mi_app_libro_autores r ON r.autor_id = mi_app_autor_fts.rowid "
+        "WHERE mi_app_autor_fts MATCH %s",
+    ]
+    if incluir_comentarios:
+        partes.append(
+            f"SELECT c.libro_id, bm25(mi_app_comentario_fts) * {PESO_COMENTARIO} "
+            "FROM mi_app_comentario_fts JOIN mi_app_comentario c ON c.id = mi_app_comentario_fts.rowid "
+            "WHERE mi_app_comentario_fts MATCH %s"
+        )
+    sql = (
+        "SELECT libro_id FROM (" + " UNION ALL ".join(partes) + ") "
+        "GROUP BY libro_id ORDER BY MIN(puntaje) LIMIT %s"
+    )
+    with connections[alias].cursor() as cursor:
+        cursor.execute(sql, [consulta] * len(partes) + [limite])
+        return [fila[0] for fila in cursor.fetchall()]
+
+
+def buscar_autores(texto, limite=10):
+    """Devuelve ``[(id, nombre)]`` de los autores más relevantes para ``texto``."""
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return []
+    alias = router.db_for_read(Autor)
+    if not indice_disponible(alias):
+        return list(Autor.objects.filter(nombre__icontains=texto).values_list('id', 'nombre')[:limite])
+    with connections[alias].cursor() as cursor:
+        cursor.execute(
+            "SELECT a.id, a.nombre FROM mi_app_autor_fts f JOIN mi_app_autor a ON a.id = f.rowid "
+            "WHERE mi_app_autor_fts MATCH %s ORDER BY f.rank LIMIT %s",
+            [consulta, limite],
+        )
+        return cursor.fetchall()
+
+
+def filtro_libros(texto):
+    """``Q`` que restringe libros por título o autor usando el índice (para el admin)."""
+    if not indice_disponible(router.db_for_read(Libro)):
+        return Q(titulo__icontains=texto) | Q(id__in=_libros_con_autor_like(texto))
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return Q(pk__in=[])
+    return Q(id__in=RawSQL(
+        "SELECT rowid FROM mi_app_libro_fts WHERE mi_app_libro_fts MATCH %s "
+        "UNION SELECT r.libro_id FROM mi_app_autor_fts "
+        "JOIN mi_app_libro_autores r ON r.autor_id = mi_app_autor_fts.rowid "
+        "WHERE mi_app_autor_fts MATCH %s",
+        [consulta, consulta],
+    ))
+
+
+def filtro_autores(texto):
+    """``Q`` que restringe autores por nombre usando el índice (para el admin)."""
+    if not indice_disponible(router.db_for_read(Autor)):
+        return Q(nombre__icontains=texto)
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return Q(pk__in=[])
+    return Q(id__in=RawSQL(
+        "SELECT rowid FROM mi_app_autor_fts WHERE mi_app_autor_fts MATCH %s",
+        [consulta],
+    ))
+
+
+def filtro_comentarios(texto):
+    """``Q`` que restringe comentarios por texto usando el índice (para el admin)."""
+    if not indice_disponible(router.db_for_read(Comentario)):
+        return Q(texto__icontains=texto)
+    consulta = consulta_fts(texto)
+    if not consulta:
+        return Q(pk__in=[])
+    return Q(id__in=RawSQL(
+        "SELECT rowid FROM mi_app_comentario_fts WHERE mi_app_comentario_fts MATCH %s",
+        [consulta],
+    ))
+
+
+def _libros_con_autor_like(texto):
+    return Libro.autores.through.objects.filter(autor__nombre__icontains=texto).values('libro_id')
@@ -0,0 +1,287 @@
+# Caché de respuestas JSON basada en versiones por modelo.
+#
+# Cada modelo ('autor', 'libro', 'comentario', 'usuario') tiene una versión
+# guardada en la caché de Django que se renueva con cada escritura (ver
+# signals.py). Las vistas de solo lectura declaran de qué modelos dependen:
+# mientras ninguna de esas versiones cambie, la respuesta se sirve desde la
+# caché o con un 304 si el navegador ya la tiene (ETag / Last-Modified).
+# Lo que se guarda son los bytes ya codificados y comprimidos según
+# Accept-Encoding (ver compresion.py): un acierto no vuelve a serializar ni
+# a comprimir.
+#
+# Las versiones se renuevan al confirmarse la transacción de la escritura,
+# no antes: si no, una lectura concurrente podría ver la versión nueva, leer
+# las filas aún sin confirmar y guardar esa respuesta vieja bajo la clave
+# nueva hasta la siguiente escritura.
+#
+# En producción con varios procesos, CACHES debe apuntar a un backend
+# compartido (Redis, Memcached, base de datos) para que todos vean las mismas
+# versiones. Los comandos que invalidan la caché se niegan a ejecutarse con
+# una caché local a cada proceso (ver comandos.py).
+import hashlib
+import json
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse
+from django.http.response import HttpResponseBase
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+from .al_confirmar import AlConfirmar
+from .compresion import IDENTIDAD, comprimir, envolver_flujo, negociar
+from .metricas import medir_serializacion
+from .streaming import quiere_ndjson
+
+# Parámetros que no cambian el contenido: '_' es el anti-caché de jQuery y
+# 'draw' el contador de peticiones de DataTables (se reinyecta en la respuesta)
+PARAMETROS_IGNORADOS = ('_', 'draw')
+
+def _clave_version(modelo):
+    return f'mi_app:version:{modelo}'
+
+
+def versiones(modelos):
+    """Devuelve ``{modelo: version}``; la versión es un timestamp en nanosegundos."""
+    claves = {modelo: _clave_version(modelo) for modelo in modelos}
+    guardadas = cache.get_many(claves.values())
+    resultado = {}
+    for modelo, clave in claves.items():
+        valor = guardadas.get(clave)
+        if valor is None:
+            # Primera vez o entrada expulsada: se crea una versión nueva, lo que
+            # invalida cualquier respuesta anterior
+            cache.add(clave, time.time_ns(), None)
+            valor = cache.get(clave)
+        resultado[modelo] = valor
+    return resultado
+
+
+def _renovar(modelos):
+    ahora = time.time_ns()
+    cache.set_many({_clave_version(modelo): ahora for modelo in modelos}, None)
+
+
+_pendientes = AlConfirmar(_renovar)
+
+
+def invalidar(*modelos):
+    """Renueva la versión de ``modelos`` al confirmarse la transacción en curso.
+
+    Fuera de una transacción se renueva en el acto. Los modelos de toda la
+    transacción se renuevan juntos con un solo set_many.
+    """
+    _pendientes.agregar(modelos)
+
+
+def cache_compartida(alias='default'):
+    """False si la caché vive en la memoria de cada proceso (LocMem, Dummy)."""
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+async def aversiones(modelos):
+    """Versión asíncrona de ``versiones``."""
+    claves = {modelo: _clave_version(modelo) for modelo in modelos}
+    guardadas = await cache.aget_many(claves.values())
+    resultado = {}
+    for modelo, clave in claves.items():
+        valor = guardadas.get(clave)
+        if valor is None:
+            await cache.aadd(clave, time.time_ns(), None)
+            valor = await cache.aget(clave)
+        resultado[modelo] = valor
+    return resultado
+
+
+def _firma(nombre, request, args, kwargs, actuales):
+    parametros = sorted(
+        (clave, request.GET.getlist(clave))
+        for clave in request.GET
+        if clave not in PARAMETROS_IGNORADOS
+    )
+    # El formato NDJSON también puede pedirse por Accept, así que forma parte de la firma
+    firma = repr((nombre, args, sorted(kwargs.items()), parametros, quiere_ndjson(request), sorted(actuales.items())))
+    return hashlib.md5(firma.encode()).hexdigest()
+
+
+def _etiqueta(firma, codificacion):
+    # Cada codificación es una representación distinta y lleva su propio ETag
+    return '"%s"' % firma if codificacion == IDENTIDAD else '"%s-%s"' % (firma, codificacion)
+
+
+def _responder(request, datos, codificacion):
+    # Respuestas de DataTables: 'draw' cambia en cada petición, así que el
+    # cuerpo se codifica (y comprime, con un nivel rápido) cada vez
+    if isinstance(datos, dict):
+        datos = {**datos, 'draw': _entero(request.GET['draw'])}
+    with medir_serializacion(request):
+        respuesta = JsonResponse(datos, safe=False)
+        if codificacion != IDENTIDAD:
+            respuesta.content = comprimir(respuesta.content, codificacion, al_vuelo=True)
+            respuesta['Content-Encoding'] = codificacion
+    return respuesta
+
+
+def _codificar(request, datos, codificacion):
+    """(tipo, bytes) de ``datos`` en JSON y en la codificación pedida."""
+    with medir_serializacion(request):
+        cuerpo = json.dumps(datos, cls=DjangoJSONEncoder).encode()
+        return 'application/json', comprimir(cuerpo, codificacion)
+
+
+def _desde_bytes(guardado, codificacion):
+    tipo, cuerpo = guardado
+    respuesta = HttpResponse(cuerpo, content_type=tipo)
+    if codificacion != IDENTIDAD:
+        respuesta['Content-Encoding'] = codificacion
+    return respuesta
+
+
+def _recomprimir(request, guardado, codificacion):
+    tipo, cuerpo = guardado
+    with medir_serializacion(request):
+        return tipo, comprimir(cuerpo, codificacion)
+
+
+def _respuesta_de_vista(respuesta, clave, codificacion):
+    """Respuesta devuelta por la vista: un listado transmitido se comprime y se guarda."""
+    if respuesta.status_code != 200 or not respuesta.streaming:
+        return respuesta
+    tipo, duracion = respuesta['Content-Type'], _duracion_cache()
+
+    def guardar(cuerpo):
+        cache.set(f'{clave}:{codificacion}', (tipo, cuerpo), duracion)
+
+    return envolver_flujo(respuesta, codificacion, guardar)
+
+
+def _cabeceras(respuesta, etag, ultima_modificacion):
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(ultima_modificacion)
+    # El navegador puede guardar la respuesta pero debe revalidarla siempre
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    patch_vary_headers(respuesta, ('Accept', 'Accept-Encoding'))
+    return respuesta
+
+
+def _duracion_cache():
+    return getattr(settings, 'MI_APP_CACHE_RESPUESTAS_SEGUNDOS', 3600)
+
+
+def _pasos(nombre, modelos, request, args, kwargs):
+    """Lógica común de las envolturas síncrona y asíncrona de ``json_versionado``.
+
+    Es un generador: cada E/S (versiones, caché, vista) se pide con un
+    ``yield`` y el conductor (``_conducir`` o ``_aconducir``) devuelve su
+    resultado con ``send``. La respuesta final es el valor de retorno.
+    """
+    actuales = yield ('versiones', modelos)
+    codificacion = negociar(request)
+    firma = _firma(nombre, request, args, kwargs, actuales)
+    etag = _etiqueta(firma, codificacion)
+    ultima_modificacion = max(actuales.values()) // 1_000_000_000
+    respuesta = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if respuesta is None:
+        clave = 'mi_app:respuesta:' + firma
+        if 'draw' in request.GET:
+            datos = (yield ('leer', [clave])).get(clave)
+            if datos is None:
+                datos = yield ('vista',)
+                if isinstance(datos, HttpResponseBase):
+                    return _cabeceras(datos, etag, ultima_modificacion) if datos.status_code == 200 else datos
+                yield ('guardar', clave, datos)
+            respuesta = _responder(request, datos, codificacion)
+        else:
+            guardados = yield ('leer', [f'{clave}:{codificacion}', f'{clave}:{IDENTIDAD}'])
+            guardado = guardados.get(f'{clave}:{codificacion}')
+            if guardado is None:
+                if f'{clave}:{IDENTIDAD}' in guardados:
+                    guardado = _recomprimir(request, guardados[f'{clave}:{IDENTIDAD}'], codificacion)
+                else:
+                    datos = yield ('vista',)
+                    if isinstance(datos, HttpResponseBase):
+                        respuesta = _respuesta_de_vista(datos, clave, codificacion)
+                        return _cabeceras(respuesta, etag, ultima_modificacion) if respuesta.status_code == 200 else respuesta
+                    guardado = _codificar(request, datos, codificacion)
+                yield ('guardar', f'{clave}:{codificacion}', guardado)
+            respuesta = _desde_bytes(guardado, codificacion)
+    return _cabeceras(respuesta, etag, ultima_modificacion)
+
+
+def _conducir(pasos, vista):
+    resultado = None
+    try:
+        while True:
+            paso, *argumentos = pasos.send(resultado)
+            if paso == 'versiones':
+                resultado = versiones(*argumentos)
+            elif paso == 'leer':
+                resultado = cache.get_many(*argumentos)
+            elif paso == 'guardar':
+                resultado = cache.set(*argumentos, _duracion_cache())
+            else:
+                resultado = vista()
+    except StopIteration as fin:
+        return fin.value
+
+
+async def _aconducir(pasos, vista):
+    resultado = None
+    try:
+        while True:
+            paso, *argumentos = pasos.send(resultado)
+            if paso == 'versiones':
+                resultado = await aversiones(*argumentos)
+            elif paso == 'leer':
+                resultado = await cache.aget_many(*argumentos)
+            elif paso == 'guardar':
+                resultado = await cache.aset(*argumentos, _duracion_cache())
+            else:
+                resultado = await vista()
+    except StopIteration as fin:
+        return fin.value
+
+
+def json_versionado(*modelos):
+    """Decorador para vistas que devuelven datos serializables a JSON.
+
+    La vista devuelve un ``dict`` o una ``list`` y el decorador construye la
+    respuesta, la guarda en caché por versión ya codificada (y comprimida
+    según Accept-Encoding) y responde 304 a los GET condicionales cuyo ETag
+    sigue vigente. Si la vista devuelve una respuesta: un listado transmitido
+    por bloques se comprime al vuelo y se guarda para la siguiente petición;
+    cualquier otra se entrega tal cual (con ETag si es un 200). Admite vistas
+    ``async def``.
+    """
+    def decorador(vista):
+        nombre = f'{vista.__module__}.{vista.__qualname__}'
+
+        if iscoroutinefunction(vista):
+            @wraps(vista)
+            async def envoltura_async(request, *args, **kwargs):
+                pasos = _pasos(nombre, modelos, request, args, kwargs)
+                return await _aconducir(pasos, lambda: vista(request, *args, **kwargs))
+
+            return envoltura_async
+
+        @wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            pasos = _pasos(nombre, modelos, request, args, kwargs)
+            return _conducir(pasos, lambda: vista(request, *args, **kwargs))
+
+        return envoltura
+    return decorador
+
+
+def _entero(valor):
+    try:
+        return int(valor)
+    except ValueError:
+        return 0
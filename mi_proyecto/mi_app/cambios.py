@@ -0,0 +1,143 @@
+# Registro de cambios del catálogo para refrescar las tablas de forma incremental.
+#
+# Cada escritura sobre Autor, Libro o Comentario añade una fila a
+# CambioCatalogo dentro de la misma transacción; su id es un número de
+# secuencia creciente. /cambios/?desde=<seq> devuelve solo las filas creadas,
+# modificadas o eliminadas después de ese número, y el navegador las aplica
+# sobre las tablas sin volver a pedir los listados completos.
+#
+# - Las señales de este módulo cubren el ORM fila a fila (vistas, admin, shell).
+# - Los cambios de autores_nombres (renombrar o eliminar un autor, cambiar los
+#   autores de un libro) se registran en desnormalizacion.recalcular_autores_nombres.
+# - Las rutas masivas (lotes, importación, recálculos completos) no emiten
+#   señales: llaman a registrar() o, si tocan medio catálogo, a
+#   marcar_recarga(), que pide a los clientes recargar todo.
+#
+# La secuencia supone que las transacciones se confirman en el orden de sus
+# ids. En SQLite es así (un solo escritor a la vez); en PostgreSQL una
+# transacción lenta puede confirmar el id 10 después de que un cliente leyera
+# hasta el 11, y el 10 se perdería. Por eso, salvo en SQLite, solo se entregan
+# las entradas con más de MI_APP_CAMBIOS_MARGEN_SEGUNDOS de antigüedad
+# (visibles()): una escritura debe confirmarse dentro de ese margen. Lo
+# reciente llega en la lectura siguiente. Los cambios de nombre de usuario no
+# se registran: solo afectan a la columna de autor de los comentarios.
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Autor, CambioCatalogo, Comentario, Libro
+
+GUARDADO = 'guardado'
+ELIMINADO = 'eliminado'
+RECARGA = 'recarga'
+MAX_CAMBIOS = 1000
+# Margen por defecto fuera de SQLite
+MARGEN_SEGUNDOS = 5
+
+
+def registrar(modelo, ids, accion=GUARDADO):
+    """Añade una entrada por cada id de ``modelo``."""
+    CambioCatalogo.objects.bulk_create(
+        [CambioCatalogo(modelo=modelo, objeto_id=objeto_id, accion=accion) for objeto_id in ids],
+        batch_size=MAX_CAMBIOS,
+    )
+
+
+def marcar_recarga():
+    """Pide a todos los clientes que recarguen las tablas completas."""
+    CambioCatalogo.objects.create(modelo='*', accion=RECARGA)
+
+
+def margen():
+    """Segundos que espera una entrada antes de entregarse (0 en SQLite)."""
+    segundos = getattr(settings, 'MI_APP_CAMBIOS_MARGEN_SEGUNDOS', None)
+    if segundos is None:
+        segundos = 0 if connection.vendor == 'sqlite' else MARGEN_SEGUNDOS
+    return segundos
+
+
+def visibles():
+    """Entradas que ya se pueden entregar sin saltarse ids aún sin confirmar."""
+    entradas = CambioCatalogo.objects.all()
+    segundos = margen()
+    if segundos:
+        entradas = entradas.filter(fecha__lte=timezone.now() - timedelta(seconds=segundos))
+    return entradas
+
+
+def ultima_secuencia():
+    return visibles().order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def purgar(antes_de):
+    """Borra las entradas anteriores a ``antes_de`` salvo la última.
+
+    Conservar la última permite saber si un cliente se quedó atrás: si su
+    ``desde`` es anterior a la primera entrada que queda, debe recargar.
+    """
+    ultima = ultima_secuencia()
+    borradas, _ = CambioCatalogo.objects.filter(fecha__lt=antes_de, id__lt=ultima).delete()
+    return borradas
+
+
+def leer(desde, limite=MAX_CAMBIOS):
+    """Cambios posteriores a ``desde`` agrupados por modelo.
+
+    Devuelve ``(hasta, mas, recargar, cambios)`` donde ``cambios`` es
+    ``{modelo: {objeto_id: accion}}`` con la última acción de cada objeto.
+    """
+    primera = CambioCatalogo.objects.order_by('id').values_list('id', flat=True).first()
+    if primera is not None and desde < primera - 1:
+        # Las entradas que el cliente necesitaba ya se purgaron
+        return ultima_secuencia(), False, True, {}
+    filas = list(
+        visibles().filter(id__gt=desde).order_by('id')
+        .values_list('id', 'modelo', 'objeto_id', 'accion')[:limite + 1]
+    )
+    mas = len(filas) > limite
+    filas = filas[:limite]
+    hasta = filas[-1][0] if filas else desde
+    cambios = {'autor': {}, 'libro': {}, 'comentario': {}}
+    for _, modelo, objeto_id, accion in filas:
+        if accion == RECARGA:
+            return ultima_secuencia(), False, True, {}
+        cambios[modelo][objeto_id] = accion
+    return hasta, mas, False, cambios
+
+
+@receiver(post_save, sender=Autor)
+def autor_guardado(sender, instance, **kwargs):
+    registrar('autor', [instance.pk])
+
+
+@receiver(post_delete, sender=Autor)
+def autor_eliminado(sender, instance, **kwargs):
+    registrar('autor', [instance.pk], ELIMINADO)
+
+
+@receiver(post_save, sender=Libro)
+def libro_guardado(sender, instance, created, update_fields=None, **kwargs):
+    registrar('libro', [instance.pk])
+    # Los comentarios muestran el título del libro
+    if not created and (update_fields is None or 'titulo' in update_fields):
+        registrar('comentario', instance.comentarios.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Libro)
+def libro_eliminado(sender, instance, **kwargs):
+    # Sus comentarios se borran en cascada y registran su propia entrada
+    registrar('libro', [instance.pk], ELIMINADO)
+
+
+@receiver(post_save, sender=Comentario)
+def comentario_guardado(sender, instance, **kwargs):
+    registrar('comentario', [instance.pk])
+
+
+@receiver(post_delete, sender=Comentario)
+def comentario_eliminado(sender, instance, **kwargs):
+    registrar('comentario', [instance.pk], ELIMINADO)
@@ -0,0 +1,226 @@
+# Importación del CSV en etapas, con el análisis repartido entre procesos.
+#
+#   lector     recorre el archivo y lo corta en rangos de bytes de unos
+#              TAMANO_RANGO bytes que terminan en un fin de registro
+#   análisis   un ProcessPoolExecutor lee cada rango, lo interpreta con el
+#              módulo csv, valida las filas y las prepara (autores separados,
+#              año convertido, estadísticas, hash; ver importacion.preparar_fila)
+#   escritor   el proceso principal recibe los rangos en el orden del archivo
+#              y los escribe en bloques de ``lote`` filas, cada uno en su
+#              transacción, con ImportadorCatalogo o SincronizadorCatalogo
+#
+# Solo el escritor toca la base de datos. Los rangos en vuelo están limitados
+# (EN_VUELO_POR_PROCESO por proceso), así que si la escritura va más despacio
+# que el análisis la memoria no crece con el tamaño del archivo.
+#
+# Un salto de línea dentro de un campo entre comillas no es un fin de
+# registro: el lector solo corta donde el número de comillas acumulado es par
+# (el CSV escapa las comillas duplicándolas).
+import csv
+import io
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+from .importacion import TAMANO_LOTE, id_externo, preparar_fila, validar_fila
+
+# Unas 7000 filas de BD_LIBRERIA por rango: las filas preparadas de los rangos
+# en vuelo ocupan decenas de MB aun con muchos procesos
+TAMANO_RANGO = 1024 * 1024
+EN_VUELO_POR_PROCESO = 2
+# Ejemplos de problemas que se guardan para el informe
+MAX_EJEMPLOS = 20
+
+
+def leer_cabecera(ruta):
+    """Columnas del CSV y posición en bytes donde empiezan los datos."""
+    with open(ruta, 'rb') as archivo:
+        linea = archivo.readline()
+        return next(csv.reader([linea.decode('utf-8-sig')]), []), archivo.tell()
+
+
+def rangos(archivo, inicio, tamano=TAMANO_RANGO):
+    """Genera ``(inicio, fin)`` desde ``inicio`` hasta el final de ``archivo`` (abierto en binario)."""
+    archivo.seek(inicio)
+    while True:
+        datos = archivo.read(tamano)
+        if not datos:
+            return
+        comillas = datos.count(b'"')
+        if not datos.endswith(b'\n'):
+            resto = archivo.readline()
+            comillas += resto.count(b'"')
+        # Comillas impares: el corte cae dentro de un campo con saltos de línea
+        while comillas % 2:
+            linea = archivo.readline()
+            if not linea:
+                break
+            comillas += linea.count(b'"')
+        fin = archivo.tell()
+        yield inicio, fin
+        inicio = fin
+
+
+class Rango:
+    """Resultado del análisis de un rango de bytes."""
+
+    def __init__(self, filas, preparadas, problemas, conteo_problemas, con_problemas, segundos):
+        self.filas = filas
+        self.preparadas = preparadas
+        # [(registro dentro del rango, Book_ID, [problemas])], solo los primeros
+        self.problemas = problemas
+        # Filas por tipo de problema
+        self.conteo_problemas = conteo_problemas
+        self.con_problemas = con_problemas
+        self.segundos = segundos
+
+
+def analizar_rango(ruta, inicio, fin, cabecera, preparar=True):
+    """Interpreta, valida y prepara las filas de ``ruta[inicio:fin]`` (se ejecuta en los procesos)."""
+    reloj = time.perf_counter()
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        texto = archivo.read(fin - inicio).decode('utf-8')
+    preparadas = []
+    problemas = []
+    conteo = Counter()
+    filas = con_problemas = 0
+    for numero, fila in enumerate(csv.DictReader(io.StringIO(texto, newline=''), fieldnames=cabecera)):
+        filas += 1
+        encontrados = validar_fila(fila)
+        if encontrados:
+            con_problemas += 1
+            # Por tipo de problema, sin el valor ("año no válido: 'x'" -> "año no válido")
+            conteo.update(problema.split(':')[0] for problema in encontrados)
+            if len(problemas) < MAX_EJEMPLOS:
+                problemas.append((numero, id_externo(fila), encontrados))
+        if preparar:
+            preparadas.append(preparar_fila(fila))
+    return Rango(filas, preparadas, problemas, conteo, con_problemas, time.perf_counter() - reloj)
+
+
+class Etapa:
+    """Tiempo y volumen de una etapa para el informe."""
+
+    def __init__(self):
+        self.segundos = 0.0
+        self.filas = 0
+        self.bytes = 0
+
+
+class Canalizacion:
+    """Lector, análisis en ``trabajadores`` procesos y un escritor.
+
+    ``escribir`` recibe listas de como mucho ``lote`` filas preparadas; sin
+    ``escribir`` (validación sin escritura) los procesos no devuelven las filas.
+    Con ``trabajadores=1`` todo ocurre en el proceso actual.
+    """
+
+    def __init__(self, ruta, trabajadores=1, lote=TAMANO_LOTE, tamano_rango=TAMANO_RANGO):
+        self.ruta = ruta
+        self.trabajadores = trabajadores
+        self.lote = lote
+        self.tamano_rango = tamano_rango
+        self.lectura = Etapa()
+        self.analisis = Etapa()
+        self.escritura = Etapa()
+        # Tiempo que el escritor pasa esperando al análisis
+        self.espera = 0.0
+        self.total = 0.0
+        self.rangos = 0
+        self.conteo_problemas = Counter()
+        self.con_problemas = 0
+        # [(número de registro en el archivo, Book_ID, [problemas])]
+        self.ejemplos = []
+
+    @property
+    def filas(self):
+        return self.analisis.filas
+
+    def _rangos(self, archivo, inicio):
+        generador = rangos(archivo, inicio, self.tamano_rango)
+        while True:
+            reloj = time.perf_counter()
+            siguiente = next(generador, None)
+            self.lectura.segundos += time.perf_counter() - reloj
+            if siguiente is None:
+                return
+            self.lectura.bytes += siguiente[1] - siguiente[0]
+            self.rangos += 1
+            yield siguiente
+
+    def ejecutar(self, escribir=None, progreso=None):
+        """Procesa el archivo entero; ``progreso(filas)`` se llama tras cada rango escrito."""
+        inicio_total = time.perf_counter()
+        cabecera, inicio = leer_cabecera(self.ruta)
+        self.lectura.bytes = inicio
+        preparar = escribir is not None
+        with open(self.ruta, 'rb') as archivo:
+            tareas = self._rangos(archivo, inicio)
+            if self.trabajadores == 1:
+                for desde, hasta in tareas:
+                    self._recibir(analizar_rango(self.ruta, desde, hasta, cabecera, preparar), escribir, progreso)
+            else:
+                # django.setup(): con spawn/forkserver los procesos empiezan sin configurar
+                with ProcessPoolExecutor(self.trabajadores, initializer=django.setup) as ejecutor:
+                    en_vuelo = deque()
+                    for desde, hasta in tareas:
+                        en_vuelo.append(ejecutor.submit(analizar_rango, self.ruta, desde, hasta, cabecera, preparar))
+                        if len(en_vuelo) >= self.trabajadores * EN_VUELO_POR_PROCESO:
+                            self._esperar(en_vuelo.popleft(), escribir, progreso)
+                    while en_vuelo:
+                        self._esperar(en_vuelo.popleft(), escribir, progreso)
+        self.total = time.perf_counter() - inicio_total
+
+    def _esperar(self, futuro, escribir, progreso):
+        reloj = time.perf_counter()
+        resultado = futuro.result()
+        self.espera += time.perf_counter() - reloj
+        self._recibir(resultado, escribir, progreso)
+
+    def _recibir(self, resultado, escribir, progreso):
+        previas = self.analisis.filas
+        self.analisis.filas += resultado.filas
+        self.analisis.segundos += resultado.segundos
+        self.conteo_problemas.update(resultado.conteo_problemas)
+        self.con_problemas += resultado.con_problemas
+        for numero, externo, problemas in resultado.problemas:
+            if len(self.ejemplos) < MAX_EJEMPLOS:
+                self.ejemplos.append((previas + numero + 1, externo, problemas))
+        if escribir is not None:
+            reloj = time.perf_counter()
+            preparadas = resultado.preparadas
+            for inicio in range(0, len(preparadas), self.lote):
+                escribir(preparadas[inicio:inicio + self.lote])
+            self.escritura.segundos += time.perf_counter() - reloj
+            self.escritura.filas += len(preparadas)
+        if progreso is not None:
+            progreso(self.analisis.filas)
+
+    def informe(self):
+        """Líneas de texto con el rendimiento de cada etapa y el resumen de la validación."""
+        def ritmo(cantidad, segundos):
+            return cantidad / max(segundos, 1e-9)
+
+        megas = self.lectura.bytes / (1024 * 1024)
+        lineas = [
+            f"lectura: {megas:.1f} MB en {self.rangos} rangos, {self.lectura.segundos:.2f}s "
+            f"({ritmo(megas, self.lectura.segundos):.0f} MB/s)",
+            f"análisis: {self.analisis.filas} filas, {self.analisis.segundos:.2f}s sumando {self.trabajadores} "
+            f"proceso(s) ({ritmo(self.analisis.filas, self.analisis.segundos):.0f} filas/s por proceso)",
+        ]
+        if self.con_problemas:
+            resumen = ", ".join(f"{problema}: {cuantas}" for problema, cuantas in self.conteo_problemas.most_common())
+            lineas.append(f"validación: {self.con_problemas} filas con problemas ({resumen})")
+        if self.escritura.filas:
+            lineas.append(
+                f"escritura: {self.escritura.filas} filas en {self.escritura.segundos:.2f}s "
+                f"({ritmo(self.escritura.filas, self.escritura.segundos):.0f} filas/s)"
+            )
+        lineas.append(
+            f"total: {self.total:.2f}s ({ritmo(self.analisis.filas, self.total):.0f} filas/s), "
+            f"{self.espera:.2f}s esperando al análisis"
+        )
+        return lineas
@@ -0,0 +1,166 @@
+# Prueba de carga del canal de eventos (/eventos/, ver eventos.py).
+#
+# medir_suscriptores() abre N conexiones SSE contra la aplicación ASGI de
+# Django dentro del propio proceso (scope, receive y send simulados, sin red),
+# espera a que todas estén suscritas y mide con tracemalloc la memoria que
+# ocupan. Después crea un autor y mide cuánto tarda el evento en llegar a cada
+# conexión, y cuántas lecturas del registro hace el Difusor mientras tanto:
+# deben depender del intervalo, no del número de suscriptores.
+#
+# Se ejecuta con async_to_sync desde el hilo principal para que el ORM
+# asíncrono use la misma conexión (y la misma base temporal) que el comando.
+import asyncio
+import time
+import tracemalloc
+
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.urls import reverse
+
+from .autenticacion import emitir_token
+from .benchmark import percentil, rss_pico_mb
+from .eventos import DIFUSOR
+from .models import Autor
+
+
+class _Medicion:
+    def __init__(self, total):
+        self.total = total
+        self.conectadas = 0
+        self.errores = 0
+        self.recibidas = 0
+        self.todas_conectadas = asyncio.Event()
+        self.todas_recibidas = asyncio.Event()
+        self.cerrar = asyncio.Event()
+
+    def conectada(self, error=False):
+        self.conectadas += 1
+        self.errores += error
+        if self.conectadas == self.total:
+            self.todas_conectadas.set()
+
+    def recibida(self):
+        self.recibidas += 1
+        if self.recibidas == self.total - self.errores:
+            self.todas_recibidas.set()
+
+
+class _Conexion:
+    """Extremo cliente de una conexión simulada."""
+
+    __slots__ = ('medicion', 'pedido_enviado', 'conectada', 'llegada')
+
+    def __init__(self, medicion):
+        self.medicion = medicion
+        self.pedido_enviado = False
+        self.conectada = False
+        self.llegada = None
+
+    async def recibir(self):
+        if not self.pedido_enviado:
+            self.pedido_enviado = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # El cliente no envía nada más hasta que cierra la conexión
+        await self.medicion.cerrar.wait()
+        return {'type': 'http.disconnect'}
+
+    async def enviar(self, mensaje):
+        if mensaje['type'] == 'http.response.start':
+            if mensaje['status'] != 200:
+                self.medicion.conectada(error=True)
+            return
+        cuerpo = mensaje.get('body', b'')
+        if not self.conectada and cuerpo.startswith(b'retry:'):
+            self.conectada = True
+            self.medicion.conectada()
+        elif self.llegada is None and b'event: cambios' in cuerpo:
+            self.llegada = time.perf_counter()
+            self.medicion.recibida()
+
+
+def _scope(ruta, token, numero):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': ruta,
+        'raw_path': ruta.encode(),
+        'query_string': b'',
+        'root_path': '',
+        'headers': [
+            (b'host', b'testserver'),
+            (b'accept', b'text/event-stream'),
+            (b'authorization', f'Bearer {token}'.encode()),
+        ],
+        'client': ('127.0.0.1', 10000 + numero),
+        'server': ('testserver', 80),
+    }
+
+
+def _redondear(valor, decimales=3):
+    return None if valor is None else round(valor, decimales)
+
+
+async def medir_suscriptores(suscriptores=2000, segundos=5.0, espera=30.0):
+    """Abre ``suscriptores`` conexiones a /eventos/ y devuelve las medidas."""
+    aplicacion = get_asgi_application()
+    usuario = await User.objects.filter(is_staff=True).afirst()
+    if usuario is None:
+        usuario = await User.objects.acreate(username='bench_eventos', is_staff=True)
+    token = emitir_token(usuario)
+    ruta = reverse('mi_app:eventos_catalogo')
+
+    medicion = _Medicion(suscriptores)
+    conexiones = [_Conexion(medicion) for _ in range(suscriptores)]
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    tareas = [
+        asyncio.create_task(aplicacion(_scope(ruta, token, numero), conexion.recibir, conexion.enviar))
+        for numero, conexion in enumerate(conexiones)
+    ]
+    try:
+        inicio = time.perf_counter()
+        await asyncio.wait_for(medicion.todas_conectadas.wait(), espera)
+        conexion_s = time.perf_counter() - inicio
+        ocupada, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Un cambio y, sin más cambios, ``segundos`` de conexiones ociosas
+        lecturas_antes = DIFUSOR.lecturas
+        inicio = time.perf_counter()
+        await Autor.objects.acreate(nombre=f'Autor de prueba de eventos {time.time_ns()}')
+        try:
+            await asyncio.wait_for(medicion.todas_recibidas.wait(), espera)
+        except asyncio.TimeoutError:
+            pass
+        await asyncio.sleep(segundos)
+        lecturas = DIFUSOR.lecturas - lecturas_antes
+        duracion = time.perf_counter() - inicio
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        medicion.cerrar.set()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        # Sin suscriptores el sondeo termina tras su última espera
+        if DIFUSOR.tarea is not None:
+            await DIFUSOR.tarea
+
+    latencias = [(c.llegada - inicio) * 1000 for c in conexiones if c.llegada is not None]
+    activas = suscriptores - medicion.errores
+    return {
+        'suscriptores': suscriptores,
+        'errores': medicion.errores,
+        'conexion_s': _redondear(conexion_s),
+        'memoria_total_mb': _redondear((ocupada - base) / (1024 * 1024), 2),
+        'memoria_por_conexion_kb': _redondear((ocupada - base) / 1024 / max(activas, 1), 2),
+        'eventos_recibidos': len(latencias),
+        'entrega_p50_ms': _redondear(percentil(latencias, 50)),
+        'entrega_p99_ms': _redondear(percentil(latencias, 99)),
+        'entrega_max_ms': _redondear(max(latencias, default=None)),
+        'lecturas_registro': lecturas,
+        'lecturas_por_segundo': _redondear(lecturas / duracion, 2),
+        'suscriptores_restantes': len(DIFUSOR.suscriptores),
+        'rss_pico_mb': rss_pico_mb(),
+    }
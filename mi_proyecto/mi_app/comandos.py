@@ -0,0 +1,34 @@
+# Base de los comandos de gestión que renuevan versiones de caché.
+#
+# Un comando corre en su propio proceso: con una caché local a cada proceso
+# (LocMemCache, la de settings.py) su invalidar() no llega a los servidores,
+# que seguirían sirviendo respuestas viejas hasta que caduquen
+# (MI_APP_CACHE_RESPUESTAS_SEGUNDOS). Por eso estos comandos fallan salvo que
+# CACHES sea compartida o se pase --cache-local, que solo tiene sentido si
+# ningún servidor está en marcha o se va a reiniciar después.
+from django.core.management.base import BaseCommand, CommandError
+
+from .cache_versionada import cache_compartida
+
+
+class ComandoQueInvalida(BaseCommand):
+    """Comando que llama a invalidar(): exige una caché compartida."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cache-local', action='store_true',
+            help="Permite ejecutarlo con una caché local al proceso (los servidores en marcha no verán los cambios)",
+        )
+
+    def invalida(self, options):
+        """Si esta ejecución va a invalidar la caché (p. ej. no en un modo de solo lectura)."""
+        return True
+
+    def execute(self, *args, **options):
+        if self.invalida(options) and not options.get('cache_local') and not cache_compartida():
+            raise CommandError(
+                "CACHES usa una caché local a cada proceso: la invalidación de este comando no llegaría a los "
+                "servidores, que seguirían sirviendo respuestas viejas. Configura un backend compartido "
+                "(Redis, Memcached, base de datos) o usa --cache-local si no hay ningún servidor en marcha."
+            )
+        return super().execute(*args, **options)
@@ -0,0 +1,180 @@
+# Compresión de respuestas JSON con negociación de Accept-Encoding.
+#
+# cache_versionada guarda, por versión de datos, los bytes ya comprimidos de
+# cada respuesta en cada codificación que algún cliente haya pedido: un
+# listado se comprime una vez por versión y no en cada recarga. Los listados
+# transmitidos por bloques se comprimen mientras se envían y el resultado se
+# guarda para las peticiones siguientes (envolver_flujo).
+#
+# gzip siempre está disponible (zlib). Brotli ('br') y Zstandard ('zstd') se
+# usan si están instalados los paquetes brotli y zstandard.
+#
+# Ajustes:
+#   MI_APP_COMPRESION_MAX_BYTES   tamaño máximo de un cuerpo guardado en caché
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - dependencia opcional
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+IDENTIDAD = 'identity'
+# Preferencia del servidor cuando el cliente acepta varias con la misma q
+DISPONIBLES = tuple(
+    nombre for nombre, modulo in (('br', brotli), ('zstd', zstandard), ('gzip', zlib)) if modulo is not None
+)
+# Niveles para cuerpos que se guardan (se comprimen una vez por versión) y
+# para los que se comprimen al vuelo
+NIVELES = {'gzip': (9, 6), 'br': (9, 4), 'zstd': (19, 3)}
+
+
+def negociar(request):
+    """Mejor codificación disponible según Accept-Encoding, o IDENTIDAD."""
+    aceptadas = {}
+    for parte in request.headers.get('Accept-Encoding', '').split(','):
+        nombre, _, parametros = parte.strip().partition(';')
+        nombre = nombre.strip().lower()
+        if not nombre:
+            continue
+        calidad = 1.0
+        parametro, _, valor = parametros.strip().partition('=')
+        if parametro.strip() == 'q':
+            try:
+                calidad = float(valor)
+            except ValueError:
+                calidad = 0.0
+        aceptadas[nombre] = calidad
+    comodin = aceptadas.get('*', 0.0)
+    mejor, mejor_calidad = IDENTIDAD, 0.0
+    for nombre in DISPONIBLES:
+        calidad = aceptadas.get(nombre, comodin)
+        if calidad > mejor_calidad:
+            mejor, mejor_calidad = nombre, calidad
+    return mejor
+
+
+def comprimir(datos, codificacion, al_vuelo=False):
+    """Comprime ``datos`` (bytes) en una sola llamada."""
+    if codificacion == IDENTIDAD:
+        return datos
+    nivel = NIVELES[codificacion][al_vuelo]
+    if codificacion == 'gzip':
+        compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+        return compresor.compress(datos) + compresor.flush()
+    if codificacion == 'br':
+        return brotli.compress(datos, quality=nivel)
+    return zstandard.ZstdCompressor(level=nivel).compress(datos)
+
+
+class _CompresorIncremental:
+    """Comprime por fragmentos; cada fragmento sale completo para enviarse ya."""
+
+    def __init__(self, codificacion):
+        nivel = NIVELES[codificacion][True]
+        self.codificacion = codificacion
+        if codificacion == 'gzip':
+            self.compresor = zlib.compressobj(nivel, zlib.DEFLATED, 31)
+        elif codificacion == 'br':
+            self.compresor = brotli.Compressor(quality=nivel)
+        else:
+            self.compresor = zstandard.ZstdCompressor(level=nivel).compressobj()
+
+    def fragmento(self, datos):
+        if self.codificacion == 'gzip':
+            return self.compresor.compress(datos) + self.compresor.flush(zlib.Z_SYNC_FLUSH)
+        if self.codificacion == 'br':
+            return self.compresor.process(datos) + self.compresor.flush()
+        return self.compresor.compress(datos) + self.compresor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def terminar(self):
+        if self.codificacion == 'br':
+            return self.compresor.finish()
+        return self.compresor.flush()
+
+
+def comprimir_flujo(fragmentos, codificacion):
+    """Comprime al vuelo un iterable de bytes (exportaciones, ver exportacion.py)."""
+    if codificacion == IDENTIDAD:
+        yield from fragmentos
+        return
+    compresor = _CompresorIncremental(codificacion)
+    for datos in fragmentos:
+        comprimido = compresor.fragmento(datos)
+        if comprimido:
+            yield comprimido
+    yield compresor.terminar()
+
+
+def _maximo_guardable():
+    return getattr(settings, 'MI_APP_COMPRESION_MAX_BYTES', 32 * 1024 * 1024)
+
+
+class _Acumulador:
+    """Comprime (si hace falta) lo que se envía y lo reúne para guardarlo al final."""
+
+    def __init__(self, codificacion, guardar):
+        self.compresor = None if codificacion == IDENTIDAD else _CompresorIncremental(codificacion)
+        self.guardar = guardar
+        self.partes = []
+        self.tamano = 0
+
+    def fragmento(self, datos):
+        if isinstance(datos, str):
+            datos = datos.encode()
+        if self.compresor is not None:
+            datos = self.compresor.fragmento(datos)
+        self._reunir(datos)
+        return datos
+
+    def terminar(self):
+        datos = self.compresor.terminar() if self.compresor is not None else b''
+        self._reunir(datos)
+        # Un cuerpo demasiado grande no se guarda, pero se envía igual
+        if self.partes is not None:
+            self.guardar(b''.join(self.partes))
+        return datos
+
+    def _reunir(self, datos):
+        if self.partes is None:
+            return
+        self.tamano += len(datos)
+        if self.tamano > _maximo_guardable():
+            self.partes = None
+        else:
+            self.partes.append(datos)
+
+
+def envolver_flujo(respuesta, codificacion, guardar):
+    """Comprime al vuelo una StreamingHttpResponse y llama a ``guardar(bytes)`` al terminar.
+
+    Si el cliente corta la conexión a medias no se guarda nada.
+    """
+    acumulador = _Acumulador(codificacion, guardar)
+    contenido = respuesta.streaming_content
+
+    if respuesta.is_async:
+        async def flujo():
+            async for parte in contenido:
+                datos = acumulador.fragmento(parte)
+                if datos:
+                    yield datos
+            yield acumulador.terminar()
+    else:
+        def flujo():
+            for parte in contenido:
+                datos = acumulador.fragmento(parte)
+                if datos:
+                    yield datos
+            yield acumulador.terminar()
+
+    respuesta.streaming_content = flujo()
+    if codificacion != IDENTIDAD:
+        respuesta['Content-Encoding'] = codificacion
+    return respuesta
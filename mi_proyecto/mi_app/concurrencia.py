@@ -0,0 +1,139 @@
+# Banco de pruebas de escrituras concurrentes entre procesos.
+#
+# medir_concurrencia() lanza procesos escritores, que publican comentarios a
+# través de la vista agregar_comentario (con sus reintentos), y procesos
+# lectores, que leen páginas de comentarios mientras tanto. Sirve para
+# comparar el perfil SQLite por defecto con settings_sqlite_wal.
+#
+# Los procesos se crean con spawn y arrancan Django en _preparar_proceso: por
+# eso este módulo no importa modelos a nivel de módulo (al deserializar las
+# tareas en el hijo, Django todavía no está configurado).
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import time
+
+
+def _preparar_proceso(ajustes, ruta_bd):
+    os.environ['DJANGO_SETTINGS_MODULE'] = ajustes
+    import django
+    django.setup()
+    from django.db import connections
+    connections['default'].settings_dict['NAME'] = ruta_bd
+
+
+def _escritor(semilla, segundos, libro_ids, usuario_id):
+    """Publica comentarios a través de la vista real hasta agotar el tiempo."""
+    from django.contrib.auth.models import User
+    from django.db import OperationalError, connections
+    from django.test import RequestFactory
+
+    from . import views
+    from .reintentos import es_bloqueo
+
+    rnd = random.Random(semilla)
+    fabrica = RequestFactory()
+    usuario = User.objects.get(pk=usuario_id)
+    escrituras, bloqueos, errores = 0, 0, 0
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        libro_id = rnd.choice(libro_ids)
+        peticion = fabrica.post(
+            f'/libros/{libro_id}/comentarios/agregar/', json.dumps({'texto': 'comentario de carga'}),
+            content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        peticion.user = usuario
+        try:
+            respuesta = views.agregar_comentario(peticion, libro_id)
+        except OperationalError as error:
+            # Llega aquí solo si se agotaron los reintentos
+            if not es_bloqueo(error):
+                raise
+            bloqueos += 1
+            continue
+        if respuesta.status_code == 201:
+            escrituras += 1
+        else:
+            errores += 1
+    connections.close_all()
+    return {'escrituras': escrituras, 'bloqueos': bloqueos, 'errores': errores}
+
+
+def _lector(semilla, segundos, libro_ids):
+    """Lee los últimos comentarios de libros al azar y mide cada lectura en ms."""
+    from django.db import OperationalError, connections
+
+    from .models import Comentario
+    from .reintentos import es_bloqueo
+
+    rnd = random.Random(semilla)
+    tiempos, bloqueos = [], 0
+    fin = time.perf_counter() + segundos
+    while time.perf_counter() < fin:
+        inicio = time.perf_counter()
+        try:
+            list(
+                Comentario.objects.filter(libro_id=rnd.choice(libro_ids))
+                .order_by('-fecha').values('id', 'usuario__username', 'texto', 'fecha')[:20]
+            )
+        except OperationalError as error:
+            if not es_bloqueo(error):
+                raise
+            bloqueos += 1
+            continue
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    connections.close_all()
+    return {'tiempos': tiempos, 'bloqueos': bloqueos}
+
+
+def _redondear(valor):
+    return None if valor is None else round(valor, 2)
+
+
+def medir_concurrencia(ajustes, ruta_bd, escritores, lectores, segundos, semilla=0):
+    """Lanza escritores y lectores contra ``ruta_bd`` durante ``segundos``.
+
+    Devuelve escrituras por segundo, bloqueos que llegaron al cliente (tras los
+    reintentos) y la latencia de lectura medida mientras se escribía.
+    """
+    from django.contrib.auth.models import User
+    from django.db import connections
+
+    from .benchmark import percentil
+    from .models import Libro
+
+    libro_ids = list(Libro.objects.values_list('id', flat=True))
+    usuario_ids = list(User.objects.values_list('id', flat=True))
+    # Los procesos hijos abren sus propias conexiones
+    connections.close_all()
+    contexto = multiprocessing.get_context('spawn')
+    with contexto.Pool(escritores + lectores, initializer=_preparar_proceso, initargs=(ajustes, ruta_bd)) as pool:
+        tareas_escritura = [
+            pool.apply_async(_escritor, (semilla + k, segundos, libro_ids, usuario_ids[k % len(usuario_ids)]))
+            for k in range(escritores)
+        ]
+        tareas_lectura = [
+            pool.apply_async(_lector, (semilla + escritores + k, segundos, libro_ids))
+            for k in range(lectores)
+        ]
+        escrituras = [tarea.get() for tarea in tareas_escritura]
+        lecturas = [tarea.get() for tarea in tareas_lectura]
+
+    tiempos = list(itertools.chain.from_iterable(lectura['tiempos'] for lectura in lecturas))
+    total = sum(escritura['escrituras'] for escritura in escrituras)
+    return {
+        'escritores': escritores,
+        'lectores': lectores,
+        'segundos': segundos,
+        'escrituras': total,
+        'escrituras_por_segundo': round(total / segundos, 1),
+        'bloqueos_escritura': sum(escritura['bloqueos'] for escritura in escrituras),
+        'errores_escritura': sum(escritura['errores'] for escritura in escrituras),
+        'lecturas': len(tiempos),
+        'bloqueos_lectura': sum(lectura['bloqueos'] for lectura in lecturas),
+        'lectura_p50_ms': _redondear(percentil(tiempos, 50)),
+        'lectura_p95_ms': _redondear(percentil(tiempos, 95)),
+        'lectura_p99_ms': _redondear(percentil(tiempos, 99)),
+    }
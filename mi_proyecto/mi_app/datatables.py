@@ -0,0 +1,108 @@
+# Utilidades para el modo "server-side processing" de DataTables.
+#
+# DataTables envía en la query string los parámetros draw, start, length,
+# search[value], order[i][column], order[i][dir] y, por cada columna,
+# columns[i][data] y columns[i][search][value]. Aquí se traducen a filtros,
+# ordenamiento y un slice del QuerySet para devolver solo la página pedida.
+import re
+
+# Límite de filas por página para que un cliente no pueda pedir la tabla completa
+MAX_FILAS_POR_PAGINA = 100
+
+_PATRON_COLUMNA = re.compile(r'^columns\[(\d+)\]\[data\]$')
+_PATRON_ORDEN = re.compile(r'^order\[(\d+)\]\[column\]$')
+
+
+def es_peticion_datatables(request):
+    # DataTables siempre envía 'draw' cuando trabaja en modo servidor
+    return 'draw' in request.GET
+
+
+def _entero(valor, defecto, minimo=0):
+    try:
+        return max(int(valor), minimo)
+    except (TypeError, ValueError):
+        return defecto
+
+
+class Columna:
+    """Describe cómo ordenar y filtrar una columna de la tabla.
+
+    ``orden`` es el campo del ORM usado en ``order_by`` (``None`` si la columna
+    no es ordenable) y ``filtro`` una función que recibe el texto buscado y
+    devuelve un ``Q`` (``None`` si la columna no es filtrable).
+    """
+
+    def __init__(self, orden=None, filtro=None):
+        self.orden = orden
+        self.filtro = filtro
+
+
+class Consulta:
+    """Resultado de interpretar los parámetros de DataTables.
+
+    ``filtrado`` es el QuerySet con los filtros sin evaluar (su COUNT solo hace
+    falta si ``hay_filtros``) y ``pagina`` el QuerySet recortado.
+    """
+
+    def __init__(self, draw, filtrado, hay_filtros, pagina):
+        self.draw = draw
+        self.filtrado = filtrado
+        self.hay_filtros = hay_filtros
+        self.pagina = pagina
+
+
+def preparar(request, queryset, columnas, busqueda_global):
+    """Aplica los parámetros de DataTables a ``queryset`` sin ejecutar consultas.
+
+    ``columnas`` es un dict ``{nombre_data: Columna}`` y ``busqueda_global``
+    una función que recibe el texto de ``search[value]`` y devuelve un ``Q``.
+    """
+    params = request.GET
+    draw = _entero(params.get('draw'), 0)
+    inicio = _entero(params.get('start'), 0)
+    largo = _entero(params.get('length'), 10, minimo=-1)
+    if largo <= 0 or largo > MAX_FILAS_POR_PAGINA:
+        largo = MAX_FILAS_POR_PAGINA
+
+    # Mapear el índice de columna que usa DataTables al nombre de 'data'
+    indices = {}
+    for clave, valor in params.items():
+        coincidencia = _PATRON_COLUMNA.match(clave)
+        if coincidencia:
+            indices[coincidencia.group(1)] = valor
+
+    filtrado = queryset
+    hay_filtros = False
+
+    texto = params.get('search[value]', '').strip()
+    if texto:
+        filtrado = filtrado.filter(busqueda_global(texto))
+        hay_filtros = True
+
+    for indice, nombre in indices.items():
+        columna = columnas.get(nombre)
+        valor = params.get(f'columns[{indice}][search][value]', '').strip()
+        if valor and columna and columna.filtro:
+            filtrado = filtrado.filter(columna.filtro(valor))
+            hay_filtros = True
+
+    orden = []
+    posiciones = sorted(
+        (int(m.group(1)), valor)
+        for clave, valor in params.items()
+        if (m := _PATRON_ORDEN.match(clave))
+    )
+    for posicion, indice in posiciones:
+        columna = columnas.get(indices.get(indice))
+        if columna is None or columna.orden is None:
+            continue
+        direccion = params.get(f'order[{posicion}][dir]', 'asc')
+        orden.append(f'-{columna.orden}' if direccion == 'desc' else columna.orden)
+    # Desempate estable por id para que la paginación sea determinista
+    if 'id' not in orden and '-id' not in orden:
+        orden.append('id')
+
+    pagina = filtrado.order_by(*orden)[inicio:inicio + largo]
+    return Consulta(draw, filtrado, hay_filtros, pagina)
+
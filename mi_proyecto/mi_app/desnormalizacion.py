@@ -0,0 +1,113 @@
+# Mantenimiento de los campos desnormalizados de Libro.
+#
+# Libro.autores_nombres guarda los nombres de sus autores separados por comas
+# y Libro.num_comentarios el total de comentarios, para que los listados lean
+# una sola tabla. Las señales de este módulo los actualizan dentro de la misma
+# transacción que la escritura que los cambia; recalcular_todo() los
+# reconstruye en bloque (comando recalcular_desnormalizados).
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import cambios
+from .models import Autor, Comentario, Libro
+
+TAMANO_LOTE = 2000
+
+
+def unir_nombres(nombres):
+    return ", ".join(nombres)
+
+
+def recalcular_autores_nombres(libro_ids, libro_model=Libro, registrar_cambios=True):
+    """Recalcula ``autores_nombres`` de los libros indicados.
+
+    bulk_update no emite señales, así que aquí mismo se anotan los libros en
+    el registro de cambios (salvo en reconstrucciones completas).
+    """
+    libro_ids = list(libro_ids)
+    Relacion = libro_model.autores.through
+    for inicio in range(0, len(libro_ids), TAMANO_LOTE):
+        bloque = libro_ids[inicio:inicio + TAMANO_LOTE]
+        nombres = {libro_id: [] for libro_id in bloque}
+        filas = (
+            Relacion.objects.filter(libro_id__in=bloque)
+            .order_by('libro_id', 'id')
+            .values_list('libro_id', 'autor__nombre')
+        )
+        for libro_id, nombre in filas:
+            nombres[libro_id].append(nombre)
+        libro_model.objects.bulk_update(
+            [libro_model(id=libro_id, autores_nombres=unir_nombres(lista)) for libro_id, lista in nombres.items()],
+            ['autores_nombres'],
+        )
+        if registrar_cambios:
+            cambios.registrar('libro', bloque)
+
+
+def recalcular_todo(libro_model=Libro, comentario_model=Comentario, tamano=TAMANO_LOTE):
+    """Reconstruye ambos campos para todo el catálogo. Devuelve los libros tratados."""
+    conteo = (
+        comentario_model.objects.filter(libro=OuterRef('pk'))
+        .order_by().values('libro').annotate(total=Count('id')).values('total')
+    )
+    libro_model.objects.update(num_comentarios=Coalesce(Subquery(conteo), 0))
+
+    total = 0
+    ultimo = 0
+    while True:
+        ids = list(
+            libro_model.objects.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:tamano]
+        )
+        if not ids:
+            return total
+        recalcular_autores_nombres(ids, libro_model=libro_model, registrar_cambios=False)
+        total += len(ids)
+        ultimo = ids[-1]
+
+
+@receiver(m2m_changed, sender=Libro.autores.through)
+def autores_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # libro.autores.add/remove/set/clear
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            recalcular_autores_nombres([instance.pk])
+    elif action == 'pre_clear':
+        # autor.libros.clear(): hay que recordar los libros antes de borrar las filas
+        instance._libros_afectados = list(instance.libros.values_list('id', flat=True))
+    elif action == 'post_clear':
+        recalcular_autores_nombres(getattr(instance, '_libros_afectados', []))
+    elif action in ('post_add', 'post_remove'):
+        recalcular_autores_nombres(pk_set)
+
+
+@receiver(post_save, sender=Autor)
+def autor_guardado(sender, instance, created, **kwargs):
+    # Un autor nuevo todavía no tiene libros; uno existente pudo cambiar de nombre
+    if not created:
+        recalcular_autores_nombres(instance.libros.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Autor)
+def autor_por_eliminar(sender, instance, **kwargs):
+    # El borrado en cascada de la tabla intermedia no emite m2m_changed
+    instance._libros_afectados = list(instance.libros.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Autor)
+def autor_eliminado(sender, instance, **kwargs):
+    recalcular_autores_nombres(getattr(instance, '_libros_afectados', []))
+
+
+@receiver(post_save, sender=Comentario)
+def comentario_creado(sender, instance, created, **kwargs):
+    if created:
+        Libro.objects.filter(pk=instance.libro_id).update(num_comentarios=F('num_comentarios') + 1)
+
+
+@receiver(post_delete, sender=Comentario)
+def comentario_eliminado(sender, instance, **kwargs):
+    Libro.objects.filter(pk=instance.libro_id, num_comentarios__gt=0).update(
+        num_comentarios=F('num_comentarios') - 1
+    )
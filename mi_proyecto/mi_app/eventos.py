@@ -0,0 +1,191 @@
+# Canal de eventos del catálogo (Server-Sent Events) para /eventos/.
+#
+# En lugar de que cada navegador sondee los listados, cada proceso ASGI tiene
+# un único Difusor que lee el registro de cambios (CambioCatalogo, ver
+# cambios.py) cada MI_APP_EVENTOS_INTERVALO segundos y reparte a todas las
+# conexiones abiertas el mismo evento ya codificado: una consulta por
+# intervalo y por proceso, tenga uno o miles de suscriptores. Sin
+# suscriptores el sondeo se detiene.
+#
+# Con varios workers cada uno sondea por su cuenta, y la tabla de cambios hace
+# de canal común entre ellos. Cambiar el sondeo por LISTEN/NOTIFY de
+# PostgreSQL solo afectaría a Difusor._leer.
+#
+# Cada evento lleva la secuencia y los ids tocados:
+#   id: 42
+#   event: cambios
+#   data: {"hasta": 42, "guardados": {"libro": [7]}, "eliminados": {"comentario": [3]}}
+# Si un suscriptor acumula más de MAX_PENDIENTES eventos sin leer se descartan
+# y recibe uno con "recargar": true. El navegador, reciba lo que reciba, pide
+# /cambios/?desde=<su secuencia> para obtener las filas.
+#
+# Ajustes:
+#   MI_APP_EVENTOS_INTERVALO   segundos entre lecturas del registro (por defecto 1)
+#   MI_APP_EVENTOS_LATIDO      segundos entre comentarios de mantenimiento (por defecto 15)
+import asyncio
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+
+from . import cambios
+
+logger = logging.getLogger(__name__)
+
+MAX_PENDIENTES = 100
+# El navegador reintenta la conexión tras este tiempo (ms) si se corta
+REINTENTO_MS = 5000
+
+
+def _intervalo():
+    return getattr(settings, 'MI_APP_EVENTOS_INTERVALO', 1.0)
+
+
+def _latido():
+    return getattr(settings, 'MI_APP_EVENTOS_LATIDO', 15.0)
+
+
+def mensaje(evento, datos, id_evento=None):
+    """Codifica un mensaje SSE."""
+    lineas = [] if id_evento is None else [f'id: {id_evento}']
+    lineas += [f'event: {evento}', 'data: ' + json.dumps(datos, separators=(',', ':'))]
+    return ('\n'.join(lineas) + '\n\n').encode()
+
+
+def agrupar(filas):
+    """Resume entradas del registro ``(id, modelo, objeto_id, accion)`` en un evento."""
+    hasta = filas[-1][0]
+    ultimas = {}
+    for _, modelo, objeto_id, accion in filas:
+        if accion == cambios.RECARGA:
+            return {'hasta': hasta, 'recargar': True}
+        # La última acción de cada objeto es la que cuenta
+        ultimas[modelo, objeto_id] = accion
+    datos = {'hasta': hasta}
+    for (modelo, objeto_id), accion in ultimas.items():
+        grupo = 'guardados' if accion == cambios.GUARDADO else 'eliminados'
+        datos.setdefault(grupo, {}).setdefault(modelo, []).append(objeto_id)
+    return datos
+
+
+class _Suscriptor:
+    # Lista y futuro en lugar de asyncio.Queue: con miles de conexiones
+    # ociosas cada objeto por conexión cuenta
+    __slots__ = ('pendientes', 'aviso', 'desbordado')
+
+    def __init__(self):
+        self.pendientes = []
+        self.aviso = None
+        self.desbordado = False
+
+    def entregar(self, evento):
+        if len(self.pendientes) < MAX_PENDIENTES:
+            self.pendientes.append(evento)
+        else:
+            self.desbordado = True
+        if self.aviso is not None and not self.aviso.done():
+            self.aviso.set_result(None)
+
+    async def esperar(self, segundos):
+        """Espera a que haya eventos pendientes; devuelve False si pasa el plazo."""
+        if not self.pendientes:
+            self.aviso = asyncio.get_running_loop().create_future()
+            try:
+                await asyncio.wait_for(self.aviso, segundos)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.aviso = None
+        return True
+
+
+class Difusor:
+    """Lee el registro de cambios una vez por intervalo y reparte los eventos."""
+
+    def __init__(self):
+        self.suscriptores = set()
+        self.ultimo = 0
+        self.tarea = None
+        self.lecturas = 0
+
+    def suscribir(self):
+        suscriptor = _Suscriptor()
+        self.suscriptores.add(suscriptor)
+        bucle = asyncio.get_running_loop()
+        if self.tarea is None or self.tarea.done() or self.tarea.get_loop() is not bucle:
+            self.tarea = bucle.create_task(self._sondear())
+        return suscriptor
+
+    def cancelar(self, suscriptor):
+        self.suscriptores.discard(suscriptor)
+
+    async def _leer(self):
+        filas = cambios.visibles().filter(id__gt=self.ultimo).order_by('id').values_list(
+            'id', 'modelo', 'objeto_id', 'accion'
+        )[:cambios.MAX_CAMBIOS]
+        self.lecturas += 1
+        return [fila async for fila in filas]
+
+    async def _sondear(self):
+        # Se empieza en la secuencia actual: lo anterior ya lo tienen los clientes
+        self.ultimo = await sync_to_async(cambios.ultima_secuencia)()
+        while self.suscriptores:
+            try:
+                filas = await self._leer()
+            except Exception:
+                # Un fallo de la base no debe cerrar las conexiones abiertas
+                logger.exception('No se pudo leer el registro de cambios')
+                filas = []
+            if filas:
+                self.ultimo = filas[-1][0]
+                self.difundir(mensaje('cambios', agrupar(filas), self.ultimo))
+            if len(filas) < cambios.MAX_CAMBIOS:
+                await asyncio.sleep(_intervalo())
+
+    def difundir(self, evento):
+        # El mismo objeto bytes va a todas las colas: repartir no copia nada
+        for suscriptor in list(self.suscriptores):
+            suscriptor.entregar(evento)
+
+
+DIFUSOR = Difusor()
+
+
+async def flujo(difusor=DIFUSOR):
+    """Generador de la respuesta SSE de una conexión."""
+    suscriptor = difusor.suscribir()
+    try:
+        yield f'retry: {REINTENTO_MS}\n\n'.encode()
+        while True:
+            if not await suscriptor.esperar(_latido()):
+                # Comentario SSE: mantiene viva la conexión a través de proxies
+                yield b': latido\n\n'
+                continue
+            if suscriptor.desbordado:
+                suscriptor.desbordado = False
+                suscriptor.pendientes.clear()
+                yield mensaje('cambios', {'hasta': difusor.ultimo, 'recargar': True}, difusor.ultimo)
+                continue
+            pendientes, suscriptor.pendientes = suscriptor.pendientes, []
+            yield b''.join(pendientes)
+    finally:
+        difusor.cancelar(suscriptor)
+
+
+def responder(request):
+    """Respuesta SSE de /eventos/. Bajo WSGI responde 204.
+
+    Una conexión abierta ocuparía un worker WSGI entero. Un 204 indica a
+    EventSource que no vuelva a intentarlo; la página sigue funcionando con
+    /cambios/ tras cada edición propia.
+    """
+    if not isinstance(request, ASGIRequest):
+        return HttpResponse(status=204)
+    respuesta = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    respuesta['Cache-Control'] = 'no-cache'
+    # nginx: enviar cada evento en cuanto llega, sin acumularlo
+    respuesta['X-Accel-Buffering'] = 'no'
+    return respuesta
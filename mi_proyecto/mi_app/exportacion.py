@@ -0,0 +1,285 @@
+# Exportación del catálogo por bloques (comando exportar_catalogo y /exportar/).
+#
+# Cada tabla (libros, autores, comentarios) se lee con un único
+# values_list().iterator() ordenado por id y se escribe en bloques de
+# FILAS_POR_BLOQUE filas: la memoria depende del tamaño del bloque y no del de
+# la tabla, tenga mil filas o diez millones.
+#
+# Formatos:
+#   csv      libros con las columnas de BD_LIBRERIA.csv (importar_libros_csv
+#            lo vuelve a leer; Book_ID es el id externo, así que --sincronizar
+#            reconoce cada libro); autores y comentarios con sus columnas
+#   ndjson   una fila JSON por línea
+#   parquet  columnar, un grupo de filas por bloque (requiere pyarrow)
+#   arrow    flujo IPC de Arrow, un lote por bloque (requiere pyarrow)
+#
+# Compresión opcional: gzip, zstd o br. CSV y NDJSON se comprimen enteros
+# (.gz, .zst, .br, ver compresion.py); Parquet y Arrow comprimen por columna
+# con su propio códec, y Arrow solo admite zstd.
+import csv
+import io
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .compresion import DISPONIBLES, IDENTIDAD, comprimir_flujo
+from .importacion import COLUMNAS_ESTADISTICAS
+from .models import Autor, Comentario, Libro
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover - dependencia opcional
+    pyarrow = None
+
+FILAS_POR_BLOQUE = 50000
+# Filas por lectura del cursor (fetchmany / cursor con nombre en PostgreSQL)
+FILAS_POR_LECTURA = 2000
+
+# formato -> (tipo de contenido, extensión)
+FORMATOS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+COLUMNARES = ('parquet', 'arrow')
+# compresión -> (tipo de contenido, extensión) del archivo CSV/NDJSON comprimido
+COMPRESIONES = {
+    'gzip': ('application/gzip', 'gz'),
+    'zstd': ('application/zstd', 'zst'),
+    'br': ('application/x-brotli', 'br'),
+}
+CODECS_PARQUET = {None: 'none', 'gzip': 'gzip', 'zstd': 'zstd', 'br': 'brotli'}
+CODECS_ARROW = {None: None, 'zstd': 'zstd'}
+
+
+class ExportacionInvalida(ValueError):
+    pass
+
+
+def columnar_disponible():
+    return pyarrow is not None
+
+
+class Tabla:
+    """Columnas exportadas de un modelo: ``(nombre, campo del ORM, tipo)``.
+
+    ``tipo`` es 'entero', 'decimal', 'texto' o 'fecha' (solo lo usa Arrow).
+
+    ``csv`` es la lista ``(cabecera, nombre de columna)`` del CSV; por defecto
+    las mismas columnas con sus nombres.
+    """
+
+    def __init__(self, modelo, columnas, csv=None):
+        self.modelo = modelo
+        self.nombres = [nombre for nombre, _, _ in columnas]
+        self.campos = [campo for _, campo, _ in columnas]
+        self.tipos = [tipo for _, _, tipo in columnas]
+        csv = csv or [(nombre, nombre) for nombre in self.nombres]
+        self.cabecera_csv = [cabecera for cabecera, _ in csv]
+        self.indices_csv = [self.nombres.index(nombre) for _, nombre in csv]
+
+    def consulta(self):
+        return self.modelo.objects.order_by('id').values_list(*self.campos)
+
+    def esquema(self):
+        tipos = {
+            'entero': pyarrow.int64(),
+            'decimal': pyarrow.float64(),
+            'texto': pyarrow.string(),
+            'fecha': pyarrow.timestamp('us', tz='UTC'),
+        }
+        return pyarrow.schema([(nombre, tipos[tipo]) for nombre, tipo in zip(self.nombres, self.tipos)])
+
+
+TABLAS = {
+    'libros': Tabla(
+        Libro,
+        [
+            ('id', 'id', 'entero'),
+            ('id_externo', 'id_externo', 'texto'),
+            ('titulo', 'titulo', 'texto'),
+            ('autores', 'autores_nombres', 'texto'),
+            ('anio_publicacion', 'anio_publicacion', 'entero'),
+            ('idioma', 'idioma', 'texto'),
+            ('num_comentarios', 'num_comentarios', 'entero'),
+            ('calificacion_promedio', 'estadisticas__calificacion_promedio', 'decimal'),
+            *((campo, f'estadisticas__{campo}', 'entero') for campo in COLUMNAS_ESTADISTICAS.values()),
+        ],
+        # Mismo orden de columnas que BD_LIBRERIA.csv; el título va en Title y en title
+        csv=[
+            ('Book_ID', 'id_externo'), ('Authors', 'autores'), ('Publication_Year', 'anio_publicacion'),
+            ('Title', 'titulo'), ('title', 'titulo'), ('language_code', 'idioma'),
+            ('average_rating', 'calificacion_promedio'), *COLUMNAS_ESTADISTICAS.items(),
+        ],
+    ),
+    'autores': Tabla(Autor, [('id', 'id', 'entero'), ('nombre', 'nombre', 'texto')]),
+    'comentarios': Tabla(
+        Comentario,
+        [
+            ('id', 'id', 'entero'),
+            ('libro_id', 'libro_id', 'entero'),
+            ('usuario_id', 'usuario_id', 'entero'),
+            ('usuario', 'usuario__username', 'texto'),
+            ('texto', 'texto', 'texto'),
+            ('fecha', 'fecha', 'fecha'),
+        ],
+    ),
+}
+
+
+class _Sumidero:
+    """Archivo de solo escritura que guarda lo escrito hasta que se recoge."""
+
+    closed = False
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def recoger(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+class Exportacion:
+    """Iterable de bytes con una tabla exportada; ``filas`` cuenta las escritas."""
+
+    def __init__(self, tabla, formato='csv', compresion=None, filas_por_bloque=FILAS_POR_BLOQUE):
+        if tabla not in TABLAS:
+            raise ExportacionInvalida(f"Tabla desconocida: '{tabla}'. Opciones: {', '.join(TABLAS)}.")
+        if formato not in FORMATOS:
+            raise ExportacionInvalida(f"Formato desconocido: '{formato}'. Opciones: {', '.join(FORMATOS)}.")
+        if compresion is not None and compresion not in COMPRESIONES:
+            raise ExportacionInvalida(f"Compresión desconocida: '{compresion}'. Opciones: {', '.join(COMPRESIONES)}.")
+        if formato in COLUMNARES and pyarrow is None:
+            raise ExportacionInvalida(f"El formato {formato} requiere pyarrow, que no está instalado.")
+        if formato == 'arrow' and compresion not in CODECS_ARROW:
+            raise ExportacionInvalida("Arrow solo admite compresión zstd.")
+        if formato not in COLUMNARES and compresion is not None and compresion not in compresion_disponibles():
+            raise ExportacionInvalida(f"La compresión {compresion} no está disponible en este servidor.")
+        if filas_por_bloque < 1:
+            raise ExportacionInvalida("El tamaño de bloque debe ser mayor que cero.")
+        self.tabla = TABLAS[tabla]
+        self.nombre = tabla
+        self.formato = formato
+        self.compresion = compresion
+        self.filas_por_bloque = filas_por_bloque
+        self.filas = 0
+
+    @property
+    def nombre_archivo(self):
+        nombre = f'{self.nombre}.{FORMATOS[self.formato][1]}'
+        if self.compresion and self.formato not in COLUMNARES:
+            nombre += '.' + COMPRESIONES[self.compresion][1]
+        return nombre
+
+    @property
+    def tipo_contenido(self):
+        if self.compresion and self.formato not in COLUMNARES:
+            return COMPRESIONES[self.compresion][0]
+        return FORMATOS[self.formato][0]
+
+    def __iter__(self):
+        if self.formato == 'parquet':
+            return self._parquet()
+        if self.formato == 'arrow':
+            return self._arrow()
+        texto = self._csv() if self.formato == 'csv' else self._ndjson()
+        return comprimir_flujo(texto, self.compresion or IDENTIDAD)
+
+    def _bloques(self):
+        bloque = []
+        filas = self.tabla.consulta().iterator(chunk_size=min(FILAS_POR_LECTURA, self.filas_por_bloque))
+        for fila in filas:
+            bloque.append(fila)
+            if len(bloque) >= self.filas_por_bloque:
+                self.filas += len(bloque)
+                yield bloque
+                bloque = []
+        if bloque:
+            self.filas += len(bloque)
+            yield bloque
+
+    def _csv(self):
+        texto = io.StringIO()
+        escritor = csv.writer(texto)
+        escritor.writerow(self.tabla.cabecera_csv)
+        indices = self.tabla.indices_csv
+        for bloque in self._bloques():
+            escritor.writerows([fila[i] for i in indices] for fila in bloque)
+            yield texto.getvalue().encode()
+            texto.seek(0)
+            texto.truncate()
+        # Tabla vacía: solo la cabecera
+        if texto.tell():
+            yield texto.getvalue().encode()
+
+    def _ndjson(self):
+        codificador = DjangoJSONEncoder(ensure_ascii=False)
+        nombres = self.tabla.nombres
+        for bloque in self._bloques():
+            yield ''.join(codificador.encode(dict(zip(nombres, fila))) + '\n' for fila in bloque).encode()
+
+    def _lotes_arrow(self, esquema):
+        for bloque in self._bloques():
+            columnas = zip(*bloque)
+            yield pyarrow.record_batch(
+                [pyarrow.array(valores, type=campo.type) for valores, campo in zip(columnas, esquema)], schema=esquema
+            )
+
+    def _parquet(self):
+        esquema = self.tabla.esquema()
+        sumidero = _Sumidero()
+        with pyarrow.parquet.ParquetWriter(sumidero, esquema, compression=CODECS_PARQUET[self.compresion]) as escritor:
+            for lote in self._lotes_arrow(esquema):
+                escritor.write_batch(lote)
+                yield sumidero.recoger()
+        # Pie del archivo (o archivo vacío con solo el esquema)
+        yield sumidero.recoger()
+
+    def _arrow(self):
+        esquema = self.tabla.esquema()
+        sumidero = _Sumidero()
+        opciones = pyarrow.ipc.IpcWriteOptions(compression=CODECS_ARROW[self.compresion])
+        with pyarrow.ipc.new_stream(sumidero, esquema, options=opciones) as escritor:
+            for lote in self._lotes_arrow(esquema):
+                escritor.write_batch(lote)
+                yield sumidero.recoger()
+        yield sumidero.recoger()
+
+
+def compresion_disponibles():
+    return [nombre for nombre in COMPRESIONES if nombre in DISPONIBLES]
+
+
+async def aiterar(exportacion):
+    """Recorre la exportación bloque a bloque desde el hilo del ORM (vistas bajo ASGI).
+
+    StreamingHttpResponse consumiría entero un iterador síncrono antes de
+    enviar nada; así cada bloque sale en cuanto está listo.
+    """
+    partes = iter(exportacion)
+    siguiente = sync_to_async(next)
+    try:
+        while (parte := await siguiente(partes, None)) is not None:
+            yield parte
+    finally:
+        await sync_to_async(partes.close)()
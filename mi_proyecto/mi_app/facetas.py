@@ -0,0 +1,209 @@
+# Facetas del catálogo: cuántos libros hay por idioma, década y año.
+#
+# FacetaLibro guarda un contador por cada combinación (idioma, año) que
+# existe: unos pocos miles de filas frente al catálogo entero. /libros/facetas/
+# y los totales de la tabla de libros filtrada por idioma, década o año
+# (obtener_libros) suman esas filas en lugar de hacer un GROUP BY o un COUNT
+# sobre Libro; las filas de la página salen del índice (idioma, anio_publicacion).
+#
+# Las señales de este módulo ajustan los contadores dentro de la misma
+# transacción que la escritura: un UPDATE cuantos = cuantos ± 1 por cada
+# combinación tocada. Las rutas masivas, que no emiten señales, llaman a
+# aplicar() (lotes, importación) y recalcular_todo() reconstruye la tabla
+# (comando recalcular_desnormalizados).
+from collections import Counter
+
+from django.db.models import Case, Count, F, Min, Q, Sum, Value, When
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import FacetaLibro, Libro
+
+CAMPOS = frozenset({'idioma', 'anio_publicacion'})
+TAMANO_LOTE = 5000
+# Combinaciones por UPDATE: SQLite limita la profundidad de las expresiones
+COMBINACIONES_POR_CONSULTA = 100
+
+
+class FiltroInvalido(ValueError):
+    pass
+
+
+def leer_filtros(params):
+    """Lee ``idioma``, ``decada`` y ``anio`` de la query string (None si faltan)."""
+    filtros = {'idioma': params.get('idioma', '').strip() or None}
+    for nombre in ('decada', 'anio'):
+        valor = params.get(nombre, '').strip()
+        if valor and not valor.isdigit():
+            raise FiltroInvalido(f"'{nombre}' debe ser un año numérico.")
+        filtros[nombre] = int(valor) if valor else None
+    if filtros['decada'] is not None and filtros['decada'] % 10:
+        raise FiltroInvalido("'decada' debe ser un múltiplo de 10.")
+    return filtros
+
+
+def hay_filtros(filtros):
+    return any(valor is not None for valor in filtros.values())
+
+
+def condicion(filtros, campo_anio='anio_publicacion'):
+    """``Q`` de los filtros sobre Libro (sobre FacetaLibro con ``campo_anio='anio'``)."""
+    q = Q()
+    if filtros['idioma'] is not None:
+        q &= Q(idioma=filtros['idioma'])
+    if filtros['decada'] is not None:
+        # Rango y no anio / 10: sigue usando el índice
+        q &= Q(**{f'{campo_anio}__gte': filtros['decada'], f'{campo_anio}__lt': filtros['decada'] + 10})
+    if filtros['anio'] is not None:
+        q &= Q(**{campo_anio: filtros['anio']})
+    return q
+
+
+def _en_filtros(idioma, anio, filtros, ignorar=None):
+    if ignorar != 'idioma' and filtros['idioma'] is not None and idioma != filtros['idioma']:
+        return False
+    if ignorar != 'decada' and filtros['decada'] is not None and (
+        anio is None or not filtros['decada'] <= anio < filtros['decada'] + 10
+    ):
+        return False
+    return ignorar == 'anio' or filtros['anio'] is None or anio == filtros['anio']
+
+
+def _lista(conteo, orden):
+    return [{'valor': valor, 'cuantos': cuantos} for valor, cuantos in sorted(conteo.items(), key=orden) if cuantos > 0]
+
+
+def resumir(filas, filtros):
+    """Conteos de /libros/facetas/ a partir de las filas ``(idioma, anio, cuantos)``.
+
+    Cada faceta aplica los filtros de las otras, no el suyo, para mostrar las
+    alternativas: con idioma=Español, ``idiomas`` sigue listando todos.
+    """
+    total = sin_anio = 0
+    idiomas, decadas, anios = Counter(), Counter(), Counter()
+    for idioma, anio, cuantos in filas:
+        if _en_filtros(idioma, anio, filtros):
+            total += cuantos
+        if _en_filtros(idioma, anio, filtros, ignorar='idioma'):
+            idiomas[idioma] += cuantos
+        if anio is None:
+            if _en_filtros(idioma, anio, filtros, ignorar='anio'):
+                sin_anio += cuantos
+            continue
+        if _en_filtros(idioma, anio, filtros, ignorar='decada'):
+            decadas[anio // 10 * 10] += cuantos
+        if _en_filtros(idioma, anio, filtros, ignorar='anio'):
+            anios[anio] += cuantos
+    return {
+        'filtros': filtros,
+        'total': total,
+        # Idiomas de más a menos libros; décadas y años en orden cronológico
+        'idiomas': _lista(idiomas, lambda par: (-par[1], par[0])),
+        'decadas': _lista(decadas, lambda par: par[0]),
+        'anios': _lista(anios, lambda par: par[0]),
+        'sin_anio': sin_anio,
+    }
+
+
+def _filas():
+    return FacetaLibro.objects.exclude(cuantos=0).values_list('idioma', 'anio', 'cuantos')
+
+
+def calcular(filtros):
+    return resumir(_filas(), filtros)
+
+
+async def acalcular(filtros):
+    return resumir([fila async for fila in _filas()], filtros)
+
+
+def contar(filtros):
+    """Libros que cumplen los filtros, sumando contadores en lugar de un COUNT."""
+    return FacetaLibro.objects.filter(condicion(filtros, 'anio')).aggregate(total=Sum('cuantos'))['total'] or 0
+
+
+async def acontar(filtros):
+    return (await FacetaLibro.objects.filter(condicion(filtros, 'anio')).aaggregate(total=Sum('cuantos')))['total'] or 0
+
+
+def clave(idioma, anio):
+    # El año puede llegar como texto desde el JSON de las vistas
+    return idioma, None if anio is None else int(anio)
+
+
+def aplicar(deltas):
+    """Suma ``deltas`` (``{(idioma, anio): n}``) a los contadores.
+
+    Un UPDATE por cada COMBINACIONES_POR_CONSULTA combinaciones; las que aún
+    no tienen fila se insertan después. Las que restan siempre tienen fila (el
+    libro estaba en ellas), así que si faltan tantas como combinaciones suman,
+    faltan justo esas y no hace falta consultarlas.
+    """
+    normalizados = Counter()
+    for (idioma, anio), delta in deltas.items():
+        normalizados[clave(idioma, anio)] += delta
+    pendientes = [(combinacion, delta) for combinacion, delta in normalizados.items() if delta]
+    for inicio in range(0, len(pendientes), COMBINACIONES_POR_CONSULTA):
+        bloque = dict(pendientes[inicio:inicio + COMBINACIONES_POR_CONSULTA])
+        combinaciones = Q()
+        for idioma, anio in bloque:
+            combinaciones |= Q(idioma=idioma, anio=anio)
+        # Una sola fila por combinación aunque una carrera haya creado dos
+        primeras = (
+            FacetaLibro.objects.filter(combinaciones).values('idioma', 'anio').annotate(primera=Min('pk')).values('primera')
+        )
+        suma = Case(*[When(idioma=idioma, anio=anio, then=Value(delta)) for (idioma, anio), delta in bloque.items()])
+        faltan = len(bloque) - FacetaLibro.objects.filter(pk__in=primeras).update(cuantos=F('cuantos') + suma)
+        if not faltan:
+            continue
+        suman = [combinacion for combinacion, delta in bloque.items() if delta > 0]
+        if faltan != len(suman):
+            existentes = set(FacetaLibro.objects.filter(combinaciones).values_list('idioma', 'anio'))
+            suman = [combinacion for combinacion in suman if combinacion not in existentes]
+        FacetaLibro.objects.bulk_create([
+            FacetaLibro(idioma=idioma, anio=anio, cuantos=bloque[idioma, anio]) for idioma, anio in suman
+        ])
+
+
+def recalcular_todo(libro_model=Libro, faceta_model=FacetaLibro):
+    """Reconstruye la tabla de facetas con un GROUP BY. Devuelve las filas creadas."""
+    filas = list(
+        libro_model.objects.order_by().values_list('idioma', 'anio_publicacion').annotate(total=Count('id'))
+    )
+    faceta_model.objects.all().delete()
+    faceta_model.objects.bulk_create(
+        [faceta_model(idioma=idioma, anio=anio, cuantos=total) for idioma, anio, total in filas],
+        batch_size=TAMANO_LOTE,
+    )
+    return len(filas)
+
+
+@receiver(pre_save, sender=Libro)
+def libro_por_guardar(sender, instance, update_fields=None, **kwargs):
+    # Libro.from_db ya dejó en _faceta_leida el idioma y el año leídos; si la
+    # instancia no salió de la base (o los difirió) se leen por clave primaria
+    if instance.pk is None or (update_fields is not None and not CAMPOS & set(update_fields)):
+        return
+    if getattr(instance, '_faceta_leida', None) is None:
+        instance._faceta_leida = (
+            Libro.objects.filter(pk=instance.pk).values_list('idioma', 'anio_publicacion').first() or False
+        )
+
+
+@receiver(post_save, sender=Libro)
+def libro_guardado(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not CAMPOS & set(update_fields):
+        return
+    deltas = Counter()
+    anterior = getattr(instance, '_faceta_leida', None)
+    if anterior:
+        deltas[clave(*anterior)] -= 1
+    deltas[clave(instance.idioma, instance.anio_publicacion)] += 1
+    aplicar(deltas)
+    # Un segundo save() de la misma instancia parte de lo que se acaba de guardar
+    instance._faceta_leida = (instance.idioma, instance.anio_publicacion)
+
+
+@receiver(post_delete, sender=Libro)
+def libro_eliminado(sender, instance, **kwargs):
+    aplicar({(instance.idioma, instance.anio_publicacion): -1})
@@ -0,0 +1,396 @@
+# Lógica de importación masiva del catálogo desde el CSV de BD_LIBRERIA.
+#
+# El archivo se lee en bloques y cada bloque se escribe con bulk_create dentro
+# de su propia transacción: autores nuevos, libros nuevos y filas de la tabla
+# intermedia Libro.autores. Los autores se resuelven con un mapa en memoria
+# nombre -> id para no consultar la base de datos por cada fila. Las columnas
+# de calificaciones van a LibroEstadisticas, también con inserciones masivas.
+#
+# Cada libro importado guarda su Book_ID (id_externo) y un hash de su
+# contenido normalizado. SincronizadorCatalogo toma un archivo completo como
+# el estado deseado del catálogo: compara cada fila con el hash guardado y
+# solo escribe las filas nuevas o cambiadas, y borra los libros cuyo Book_ID
+# ya no aparece. Repetir la sincronización con el mismo archivo no escribe nada.
+import csv
+import hashlib
+import json
+import math
+import re
+from collections import Counter
+from itertools import islice
+
+from django.db import transaction
+
+from . import facetas
+from .desnormalizacion import unir_nombres
+from .lotes import eliminar_libros
+from .models import Autor, Libro, LibroEstadisticas
+
+TAMANO_LOTE = 5000
+
+
+def leer_en_bloques(ruta, tamano=TAMANO_LOTE):
+    # Generador de listas de filas (dict) sin cargar el archivo completo
+    with open(ruta, 'r', encoding='utf-8', newline='') as archivo:
+        lector = csv.DictReader(archivo)
+        while True:
+            bloque = list(islice(lector, tamano))
+            if not bloque:
+                return
+            yield bloque
+
+
+def normalizar_fila(fila):
+    """Convierte una fila del CSV en ``(titulo, anio, idioma, autores)``.
+
+    Devuelve ``None`` si la fila no tiene título.
+    """
+    titulo = (fila.get('Title') or '').strip()
+    if not titulo:
+        return None
+    try:
+        anio = int(float(fila.get('Publication_Year') or ''))
+    except (ValueError, OverflowError):
+        anio = None
+    # anio_publicacion es positivo: un año negativo haría fallar el bloque entero
+    if anio is not None and anio < 0:
+        anio = None
+    idioma = (fila.get('language_code') or '').strip() or 'eng'
+    autores = []
+    for nombre in (fila.get('Authors') or '').split(', '):
+        nombre = nombre.strip()
+        if nombre and nombre not in autores:
+            autores.append(nombre)
+    return titulo, anio, idioma, autores
+
+
+# Columnas del CSV -> campos enteros de LibroEstadisticas
+COLUMNAS_ESTADISTICAS = {
+    'Ratings_Count': 'num_calificaciones',
+    'Total_Ratings': 'total_calificaciones',
+    'Text_Reviews': 'resenas_texto',
+    'One_Star_Ratings': 'estrellas_1',
+    'Two_Star_Ratings': 'estrellas_2',
+    'Three_Star_Ratings': 'estrellas_3',
+    'Four_Star_Ratings': 'estrellas_4',
+    'Five_Star_Ratings': 'estrellas_5',
+}
+
+
+def normalizar_estadisticas(fila):
+    """Devuelve los campos de ``LibroEstadisticas`` de la fila, o ``None`` si no tiene promedio."""
+    try:
+        campos = {'calificacion_promedio': float(fila.get('average_rating') or '')}
+    except ValueError:
+        return None
+    if not math.isfinite(campos['calificacion_promedio']):
+        return None
+    for columna, campo in COLUMNAS_ESTADISTICAS.items():
+        try:
+            campos[campo] = max(int(float(fila.get(columna) or 0)), 0)
+        except (ValueError, OverflowError):
+            campos[campo] = 0
+    campos['puntuacion'] = LibroEstadisticas.calcular_puntuacion(
+        campos['calificacion_promedio'], campos['num_calificaciones']
+    )
+    return campos
+
+
+def id_externo(fila):
+    """Book_ID de la fila, o ``None`` si no tiene."""
+    return (fila.get('Book_ID') or '').strip() or None
+
+
+def huella(normalizada, estadisticas):
+    """Hash del contenido normalizado de una fila: si no cambia, el libro tampoco."""
+    contenido = json.dumps([normalizada, estadisticas], sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.blake2b(contenido.encode(), digest_size=16).hexdigest()
+
+
+def preparar_fila(fila):
+    """``(normalizada, estadísticas, id externo, hash)`` de una fila, o ``None`` si no tiene título.
+
+    No consulta la base de datos: se puede llamar desde otros procesos (ver canalizacion.py).
+    """
+    normalizada = normalizar_fila(fila)
+    if normalizada is None:
+        return None
+    campos = normalizar_estadisticas(fila)
+    return normalizada, campos, id_externo(fila), huella(normalizada, campos)
+
+
+# Código de idioma del CSV: eng, spa, en-US, en-GB...
+IDIOMA_VALIDO = re.compile(r'[A-Za-z]{2,3}(-[A-Za-z0-9]{2,8})*')
+ANIO_MAXIMO = 2100
+MAX_ID_EXTERNO = 64
+
+
+def validar_fila(fila):
+    """Problemas de una fila del CSV, como textos; lista vacía si no tiene ninguno.
+
+    La importación sigue la misma regla que normalizar_fila y
+    normalizar_estadisticas: la fila sin título se omite y los valores no
+    válidos se dejan vacíos (año, estadísticas) o tal cual (idioma).
+    """
+    problemas = []
+    if not (fila.get('Title') or '').strip():
+        problemas.append("sin título")
+    anio = (fila.get('Publication_Year') or '').strip()
+    if anio:
+        try:
+            valido = 0 <= float(anio) <= ANIO_MAXIMO
+        except ValueError:
+            valido = False
+        if not valido:
+            problemas.append(f"año no válido: {anio!r}")
+    idioma = (fila.get('language_code') or '').strip()
+    if idioma and not IDIOMA_VALIDO.fullmatch(idioma):
+        problemas.append(f"idioma no válido: {idioma!r}")
+    promedio = (fila.get('average_rating') or '').strip()
+    if promedio:
+        try:
+            valido = 0 <= float(promedio) <= 5
+        except ValueError:
+            valido = False
+        if not valido:
+            problemas.append(f"calificación no válida: {promedio!r}")
+    if len(id_externo(fila) or '') > MAX_ID_EXTERNO:
+        problemas.append(f"Book_ID de más de {MAX_ID_EXTERNO} caracteres")
+    return problemas
+
+
+class ImportadorCatalogo:
+    """Escribe bloques de filas normalizadas con inserciones masivas."""
+
+    def __init__(self):
+        self.autores = dict(Autor.objects.values_list('nombre', 'id'))
+        self.autores_nuevos = []
+        self.libros_creados = 0
+        self.autores_creados = 0
+        self.omitidas = 0
+        self._cargar_libros()
+
+    def _cargar_libros(self):
+        # Claves de libros existentes (-> id) para conservar la semántica de get_or_create
+        self.libros = {
+            (titulo, anio, idioma): libro_id
+            for libro_id, titulo, anio, idioma in Libro.objects.values_list('id', 'titulo', 'anio_publicacion', 'idioma')
+        }
+        # Book_ID ya importados: la misma fila con otro título no crea otro libro
+        self.externos = set(Libro.objects.filter(id_externo__isnull=False).values_list('id_externo', flat=True))
+
+    def importar_bloque(self, filas):
+        self.importar_preparadas([preparar_fila(fila) for fila in filas])
+
+    def importar_preparadas(self, preparadas):
+        """Como importar_bloque, con las filas ya pasadas por preparar_fila."""
+        registros = []
+        estadisticas = []
+        for preparada in preparadas:
+            if preparada is None:
+                self.omitidas += 1
+                continue
+            normalizada, campos, externo, _ = preparada
+            titulo, anio, idioma, autores = normalizada
+            clave = (titulo, anio, idioma)
+            if clave in self.libros or externo in self.externos:
+                # Un libro ya importado recibe sus estadísticas si aún no las tiene
+                if campos and self.libros.get(clave) is not None:
+                    estadisticas.append(LibroEstadisticas(libro_id=self.libros[clave], **campos))
+                self.omitidas += 1
+                continue
+            self.libros[clave] = None
+            if externo is not None:
+                self.externos.add(externo)
+            registros.append(preparada)
+        if registros or estadisticas:
+            with transaction.atomic():
+                self._escribir(registros, estadisticas)
+
+    def _crear_autores(self, listas):
+        nuevos = []
+        for autores in listas:
+            for nombre in autores:
+                if nombre not in self.autores:
+                    self.autores[nombre] = None
+                    nuevos.append(Autor(nombre=nombre))
+        if nuevos:
+            for autor in Autor.objects.bulk_create(nuevos):
+                self.autores[autor.nombre] = autor.id
+                self.autores_nuevos.append(autor.id)
+            self.autores_creados += len(nuevos)
+
+    def _escribir(self, registros, estadisticas):
+        """Crea los libros de ``registros`` (``(normalizada, estadísticas, id externo, hash)``) y los devuelve."""
+        self._crear_autores(autores for (_, _, _, autores), _, _, _ in registros)
+
+        # bulk_create no emite señales: los campos desnormalizados se rellenan aquí
+        libros = Libro.objects.bulk_create([
+            Libro(
+                titulo=titulo, anio_publicacion=anio, idioma=idioma, autores_nombres=unir_nombres(autores),
+                id_externo=externo, hash_contenido=hash_contenido,
+            )
+            for (titulo, anio, idioma, autores), _, externo, hash_contenido in registros
+        ])
+        self.libros_creados += len(libros)
+        facetas.aplicar(Counter((idioma, anio) for (_, anio, idioma, _), _, _, _ in registros))
+
+        Relacion = Libro.autores.through
+        Relacion.objects.bulk_create([
+            Relacion(libro_id=libro.id, autor_id=self.autores[nombre])
+            for libro, ((_, _, _, autores), _, _, _) in zip(libros, registros)
+            for nombre in autores
+        ])
+
+        for libro, ((titulo, anio, idioma, _), campos, _, _) in zip(libros, registros):
+            self.libros[(titulo, anio, idioma)] = libro.id
+            if campos:
+                estadisticas.append(LibroEstadisticas(libro_id=libro.id, **campos))
+        # ignore_conflicts: los libros existentes que ya tenían estadísticas se dejan como están
+        LibroEstadisticas.objects.bulk_create(estadisticas, ignore_conflicts=True)
+        return libros
+
+
+class SincronizadorCatalogo(ImportadorCatalogo):
+    """Lleva el catálogo al contenido de un archivo completo, fila a fila por Book_ID.
+
+    Las filas cuyo hash coincide con el guardado no se escriben; las nuevas se
+    crean y las cambiadas se actualizan, todo con operaciones masivas. Al
+    terminar el archivo, eliminar_ausentes() borra los libros con Book_ID que
+    no aparecieron. ``tocados``, ``creados``, ``autores_cambiados`` y
+    ``titulos_cambiados`` son los ids de los libros escritos, para actualizar
+    después rankings, similares y cambios.
+    """
+
+    def _cargar_libros(self):
+        # Book_ID -> (id, hash) de los libros ya sincronizados
+        self.huellas = {
+            externo: (libro_id, hash_contenido)
+            for libro_id, externo, hash_contenido in Libro.objects.filter(id_externo__isnull=False)
+            .values_list('id', 'id_externo', 'hash_contenido')
+        }
+        # Libros anteriores sin Book_ID (creados a mano o por una importación
+        # antigua): la primera sincronización los adopta por título, año e
+        # idioma, normalizados como en normalizar_fila
+        self.sin_id = {
+            (titulo.strip(), anio, idioma.strip() or 'eng'): libro_id
+            for libro_id, titulo, anio, idioma in Libro.objects.filter(id_externo__isnull=True)
+            .values_list('id', 'titulo', 'anio_publicacion', 'idioma')
+        }
+        self.libros = {}
+        self.vistos = set()
+        self.tocados = []
+        self.creados = []
+        self.autores_cambiados = []
+        self.titulos_cambiados = []
+        self.actualizados = 0
+        self.sin_cambios = 0
+        self.eliminados = 0
+
+    def importar_preparadas(self, preparadas):
+        nuevos = []
+        cambiados = []
+        for preparada in preparadas:
+            # Sin Book_ID no hay con qué comparar; uno repetido solo cuenta la primera vez
+            if preparada is None or preparada[2] is None or preparada[2] in self.vistos:
+                self.omitidas += 1
+                continue
+            normalizada, campos, externo, hash_contenido = preparada
+            self.vistos.add(externo)
+            libro_id, anterior = self.huellas.pop(externo, (None, None))
+            if libro_id is None:
+                libro_id = self.sin_id.pop(tuple(normalizada[:3]), None)
+                if libro_id is None:
+                    nuevos.append((normalizada, campos, externo, hash_contenido))
+                    continue
+            if anterior == hash_contenido:
+                self.sin_cambios += 1
+                continue
+            cambiados.append((libro_id, normalizada, campos, externo, hash_contenido))
+        if nuevos or cambiados:
+            with transaction.atomic():
+                if nuevos:
+                    creados = [libro.id for libro in self._escribir(nuevos, [])]
+                    self.creados.extend(creados)
+                    self.tocados.extend(creados)
+                    self.libros.clear()
+                if cambiados:
+                    self._actualizar(cambiados)
+
+    def _actualizar(self, cambiados):
+        ids = [libro_id for libro_id, _, _, _, _ in cambiados]
+        self._crear_autores(autores for _, (_, _, _, autores), _, _, _ in cambiados)
+
+        # Facetas: sale la combinación guardada y entra la del archivo
+        deltas = Counter()
+        titulos = {}
+        for libro_id, titulo, idioma, anio in Libro.objects.filter(pk__in=ids).values_list(
+            'id', 'titulo', 'idioma', 'anio_publicacion'
+        ):
+            titulos[libro_id] = titulo
+            deltas[(idioma, anio)] -= 1
+        for libro_id, (titulo, anio, idioma, _), _, _, _ in cambiados:
+            deltas[(idioma, anio)] += 1
+            # Los comentarios muestran el título del libro
+            if titulo != titulos[libro_id]:
+                self.titulos_cambiados.append(libro_id)
+        Libro.objects.bulk_update(
+            [
+                Libro(
+                    pk=libro_id, titulo=titulo, anio_publicacion=anio, idioma=idioma,
+                    autores_nombres=unir_nombres(autores), id_externo=externo, hash_contenido=hash_contenido,
+                )
+                for libro_id, (titulo, anio, idioma, autores), _, externo, hash_contenido in cambiados
+            ],
+            ['titulo', 'anio_publicacion', 'idioma', 'autores_nombres', 'id_externo', 'hash_contenido'],
+        )
+        facetas.aplicar(deltas)
+
+        # La tabla intermedia solo se rehace en los libros cuyos autores cambiaron
+        Relacion = Libro.autores.through
+        actuales = {libro_id: set() for libro_id in ids}
+        for libro_id, autor_id in Relacion.objects.filter(libro_id__in=ids).values_list('libro_id', 'autor_id'):
+            actuales[libro_id].add(autor_id)
+        autores_cambiados = {}
+        for libro_id, (_, _, _, autores), _, _, _ in cambiados:
+            ids_autores = {self.autores[nombre] for nombre in autores}
+            if ids_autores != actuales[libro_id]:
+                autores_cambiados[libro_id] = ids_autores
+        if autores_cambiados:
+            Relacion.objects.filter(libro_id__in=list(autores_cambiados)).delete()
+            Relacion.objects.bulk_create([
+                Relacion(libro_id=libro_id, autor_id=autor_id)
+                for libro_id, ids_autores in autores_cambiados.items()
+                for autor_id in ids_autores
+            ])
+            self.autores_cambiados.extend(autores_cambiados)
+
+        con = [LibroEstadisticas(libro_id=libro_id, **campos) for libro_id, _, campos, _, _ in cambiados if campos]
+        LibroEstadisticas.objects.bulk_create(
+            con, update_conflicts=True, unique_fields=['libro'],
+            update_fields=['calificacion_promedio', 'puntuacion', *COLUMNAS_ESTADISTICAS.values()],
+        )
+        LibroEstadisticas.objects.filter(
+            libro_id__in=[libro_id for libro_id, _, campos, _, _ in cambiados if not campos]
+        ).delete()
+        self.actualizados += len(cambiados)
+        self.tocados.extend(ids)
+
+    @property
+    def ausentes(self):
+        """Libros con Book_ID que no aparecieron en el archivo (hasta eliminar_ausentes)."""
+        return len(self.huellas)
+
+    def eliminar_ausentes(self, incremental=True):
+        """Borra los libros con Book_ID que no estaban en el archivo. Devuelve cuántos.
+
+        Con ``incremental=False`` no se actualizan rankings, similares ni el
+        registro de cambios (ver lotes.eliminar_libros).
+        """
+        ids = sorted(libro_id for libro_id, _ in self.huellas.values())
+        for inicio in range(0, len(ids), TAMANO_LOTE):
+            with transaction.atomic():
+                eliminar_libros(ids[inicio:inicio + TAMANO_LOTE], incremental)
+        self.huellas.clear()
+        self.eliminados += len(ids)
+        return len(ids)
@@ -0,0 +1,346 @@
+# Operaciones en lote sobre libros y autores (/libros/lote/ y /autores/lote/).
+#
+# Un lote es una lista de operaciones {"op": "crear" | "actualizar" | "eliminar",
+# "id": ..., "datos": {...}}. Todas se validan primero con unas pocas consultas
+# por conjunto (ids existentes, autores válidos, nombres ocupados) y, solo si
+# ninguna tiene errores, se aplican con bulk_create/bulk_update e inserciones
+# masivas en la tabla intermedia. La vista envuelve la aplicación en una única
+# transacción: o se aplica el lote entero o nada.
+#
+# Los borrados de libros, comentarios, estadísticas y autores no pasan por
+# QuerySet.delete(): con receptores de señales Django recorre las filas una
+# a una y cada libro costaba más de una docena de consultas. Se borran con un
+# DELETE por tabla (_borrar_sin_senales) y eliminar_libros() y
+# eliminar_autores() rehacen de una vez lo que hacían esas señales:
+#
+#   facetas.py          contadores por idioma y año de los libros borrados
+#   cambios.py          entradas "eliminado" de libros, comentarios y autores
+#   rankings.py         grupos que pierden un libro, grupos de los autores
+#   similares.py        listas ajenas que contenían un libro o compartían autor
+#   signals.py          versiones de caché de libro, comentario, autor y ranking
+#   desnormalizacion.py autores_nombres de los libros sin esos autores (LoteAutores)
+#
+# El índice de búsqueda no necesita nada: lo mantienen triggers de SQLite
+# (ver busqueda.py). Las tablas sin señales (rankings, similares, tabla
+# intermedia) usan delete(), que en ese caso ya es un solo DELETE.
+import uuid
+from collections import Counter
+
+from django.db import connections, router
+from django.db.models import Q
+
+from .cache_versionada import invalidar
+from . import cambios, facetas, rankings, similares
+from .desnormalizacion import recalcular_autores_nombres, unir_nombres
+from .models import Autor, Comentario, Libro, LibroEstadisticas, LibroSimilar, RankingLibro
+
+MAX_OPERACIONES = 1000
+OPERACIONES = ('crear', 'actualizar', 'eliminar')
+
+
+class LoteInvalido(ValueError):
+    pass
+
+
+def leer_operaciones(datos):
+    """Valida la forma del cuerpo y devuelve la lista de operaciones."""
+    if isinstance(datos, dict):
+        datos = datos.get('operaciones')
+    if not isinstance(datos, list) or not datos:
+        raise LoteInvalido('Se esperaba una lista de operaciones.')
+    if len(datos) > MAX_OPERACIONES:
+        raise LoteInvalido(f'El lote admite como máximo {MAX_OPERACIONES} operaciones.')
+    return datos
+
+
+def _borrar_sin_senales(modelo, campo, valores):
+    """DELETE de las filas de ``modelo`` con ``campo`` en ``valores``, sin emitir señales."""
+    conexion = connections[router.db_for_write(modelo)]
+    tabla = conexion.ops.quote_name(modelo._meta.db_table)
+    columna = conexion.ops.quote_name(modelo._meta.get_field(campo).column)
+    tamano = conexion.features.max_query_params or len(valores)
+    with conexion.cursor() as cursor:
+        for inicio in range(0, len(valores), tamano):
+            trozo = valores[inicio:inicio + tamano]
+            cursor.execute(f"DELETE FROM {tabla} WHERE {columna} IN ({', '.join(['%s'] * len(trozo))})", trozo)
+
+
+def eliminar_libros(libro_ids, incremental=True):
+    """Borra estos libros y sus filas dependientes con unas pocas consultas fijas.
+
+    Hace el trabajo de las señales de borrado para el conjunto entero:
+    contadores de facetas, cambios de libros y comentarios, grupos de ranking
+    y listas de similares que los contenían (estos dos al confirmar). Con
+    ``incremental=False`` solo se mantienen las facetas: el llamador rehace
+    rankings y similares enteros y pide una recarga a los clientes.
+    """
+    libro_ids = list(libro_ids)
+    if not libro_ids:
+        return
+    Relacion = Libro.autores.through
+    comentario_ids = []
+    if incremental:
+        comentario_ids = list(Comentario.objects.filter(libro_id__in=libro_ids).values_list('pk', flat=True))
+    deltas = Counter()
+    deltas.subtract(Libro.objects.filter(pk__in=libro_ids).values_list('idioma', 'anio_publicacion'))
+    grupos = con_similar = ()
+    if incremental:
+        grupos = set(RankingLibro.objects.filter(libro_id__in=libro_ids).values_list('tipo', 'clave'))
+        con_similar = set(
+            LibroSimilar.objects.filter(similar_id__in=libro_ids).exclude(libro_id__in=libro_ids)
+            .values_list('libro_id', flat=True)
+        )
+
+    _borrar_sin_senales(Comentario, 'libro', libro_ids)
+    _borrar_sin_senales(LibroEstadisticas, 'libro', libro_ids)
+    RankingLibro.objects.filter(libro_id__in=libro_ids).delete()
+    LibroSimilar.objects.filter(Q(libro_id__in=libro_ids) | Q(similar_id__in=libro_ids)).delete()
+    Relacion.objects.filter(libro_id__in=libro_ids).delete()
+    _borrar_sin_senales(Libro, 'id', libro_ids)
+
+    facetas.aplicar(deltas)
+    invalidar('libro', 'comentario')
+    if not incremental:
+        return
+    cambios.registrar('comentario', comentario_ids, cambios.ELIMINADO)
+    cambios.registrar('libro', libro_ids, cambios.ELIMINADO)
+    rankings.programar_grupos(grupos)
+    similares.programar(con_similar)
+
+
+def eliminar_autores(autor_ids):
+    """Borra estos autores y sus relaciones. Devuelve los ids de los libros que los tenían.
+
+    El llamador recalcula autores_nombres de esos libros (ver LoteAutores).
+    """
+    autor_ids = list(autor_ids)
+    if not autor_ids:
+        return set()
+    relaciones = Libro.autores.through.objects.filter(autor_id__in=autor_ids)
+    afectados = set(relaciones.values_list('libro_id', flat=True))
+    relaciones.delete()
+    RankingLibro.objects.filter(tipo='autor', clave__in=[str(pk) for pk in autor_ids]).delete()
+    _borrar_sin_senales(Autor, 'id', autor_ids)
+    cambios.registrar('autor', autor_ids, cambios.ELIMINADO)
+    # Sin esos autores en común cambian los vecinos de sus libros
+    similares.programar(afectados)
+    invalidar('autor', 'ranking')
+    return afectados
+
+
+def _entero_positivo(valor):
+    try:
+        valor = int(valor)
+    except (TypeError, ValueError):
+        return None
+    return valor if valor > 0 else None
+
+
+class _Lote:
+    """Base común: clasifica las operaciones y acumula un resultado por cada una."""
+
+    modelo = None
+
+    def __init__(self, operaciones):
+        self.operaciones = operaciones
+        self.resultados = [{'indice': indice, 'ok': True} for indice in range(len(operaciones))]
+        self.crear, self.actualizar, self.eliminar = [], [], []
+
+    @property
+    def valido(self):
+        return all(resultado['ok'] for resultado in self.resultados)
+
+    @property
+    def requiere_staff(self):
+        # Se decide con el cuerpo tal cual, antes de validar (y consultar) nada
+        return any(
+            isinstance(operacion, dict) and operacion.get('op') in ('actualizar', 'eliminar')
+            for operacion in self.operaciones
+        )
+
+    def _error(self, indice, mensaje):
+        # Se conserva el primer error encontrado para cada operación
+        if self.resultados[indice]['ok']:
+            self.resultados[indice] = {'indice': indice, 'ok': False, 'error': mensaje}
+
+    def _clasificar(self):
+        vistos = set()
+        for indice, operacion in enumerate(self.operaciones):
+            if not isinstance(operacion, dict) or operacion.get('op') not in OPERACIONES:
+                self._error(indice, "La operación debe ser 'crear', 'actualizar' o 'eliminar'.")
+                continue
+            op = operacion['op']
+            datos = operacion.get('datos') or {}
+            if op != 'eliminar' and not isinstance(datos, dict):
+                self._error(indice, "'datos' debe ser un objeto.")
+                continue
+            if op == 'crear':
+                self.crear.append((indice, datos))
+                continue
+            pk = _entero_positivo(operacion.get('id'))
+            if pk is None:
+                self._error(indice, "Falta un 'id' válido.")
+            elif pk in vistos:
+                self._error(indice, 'El mismo registro aparece más de una vez en el lote.')
+            else:
+                vistos.add(pk)
+                (self.actualizar if op == 'actualizar' else self.eliminar).append((indice, pk, datos))
+
+        # Una sola consulta para comprobar que existen los registros a modificar
+        existentes = set(self.modelo.objects.filter(pk__in=vistos).values_list('pk', flat=True))
+        for lista in (self.actualizar, self.eliminar):
+            for indice, pk, _ in lista:
+                if pk not in existentes:
+                    self._error(indice, f'No existe el registro {pk}.')
+
+    def _pendientes(self, lista):
+        # Operaciones que pasaron la validación
+        return [item for item in lista if self.resultados[item[0]]['ok']]
+
+    def _marcar(self, indice, pk, estado):
+        self.resultados[indice] = {'indice': indice, 'ok': True, 'id': pk, 'estado': estado}
+
+
+class LoteLibros(_Lote):
+    modelo = Libro
+
+    def validar(self):
+        self._clasificar()
+        autor_ids = set()
+        for indice, datos in self.crear + [(i, d) for i, _, d in self.actualizar]:
+            titulo = str(datos.get('titulo') or '').strip()
+            idioma = str(datos.get('idioma') or '').strip()
+            anio = _entero_positivo(datos.get('anio_publicacion'))
+            autores = datos.get('autores')
+            if not (titulo and idioma and anio and isinstance(autores, list) and autores):
+                self._error(indice, 'Todos los campos son obligatorios')
+                continue
+            ids = list(dict.fromkeys(_entero_positivo(autor_id) for autor_id in autores))
+            if None in ids:
+                self._error(indice, 'Los autores deben ser ids numéricos.')
+                continue
+            datos['_limpios'] = (titulo, anio, idioma, ids)
+            autor_ids.update(ids)
+
+        # Una sola consulta para todos los autores referenciados en el lote
+        self.nombres = dict(Autor.objects.filter(id__in=autor_ids).values_list('id', 'nombre'))
+        for indice, datos in self.crear + [(i, d) for i, _, d in self.actualizar]:
+            if not self.resultados[indice]['ok']:
+                continue
+            faltan = [autor_id for autor_id in datos['_limpios'][3] if autor_id not in self.nombres]
+            if faltan:
+                self._error(indice, f'Autores inexistentes: {faltan}')
+        return self.valido
+
+    def aplicar(self):
+        Relacion = Libro.autores.through
+        eliminar = [pk for _, pk, _ in self._pendientes(self.eliminar)]
+        eliminar_libros(eliminar)
+        for indice, pk, _ in self._pendientes(self.eliminar):
+            self._marcar(indice, pk, 'eliminado')
+
+        actualizar = self._pendientes(self.actualizar)
+        deltas = Counter()
+        if actualizar:
+            # Idioma y año previos, para mover los contadores de facetas
+            deltas.subtract(
+                Libro.objects.filter(pk__in=[pk for _, pk, _ in actualizar]).values_list('idioma', 'anio_publicacion')
+            )
+            Libro.objects.bulk_update(
+                [self._libro(datos, id=pk) for _, pk, datos in actualizar],
+                ['titulo', 'anio_publicacion', 'idioma', 'autores_nombres'],
+            )
+            # Se reemplazan las relaciones completas, como hace autores.set()
+            Relacion.objects.filter(libro_id__in=[pk for _, pk, _ in actualizar]).delete()
+            for indice, pk, _ in actualizar:
+                self._marcar(indice, pk, 'actualizado')
+
+        crear = self._pendientes(self.crear)
+        creados = Libro.objects.bulk_create([self._libro(datos) for _, datos in crear])
+        for (indice, _), libro in zip(crear, creados):
+            self._marcar(indice, libro.pk, 'creado')
+
+        # bulk_create/bulk_update no emiten señales: relaciones, campos
+        # desnormalizados y versión de caché se mantienen aquí
+        pares = [(pk, datos) for _, pk, datos in actualizar]
+        pares += [(libro.pk, datos) for (_, datos), libro in zip(crear, creados)]
+        Relacion.objects.bulk_create([
+            Relacion(libro_id=libro_id, autor_id=autor_id)
+            for libro_id, datos in pares
+            for autor_id in datos['_limpios'][3]
+        ])
+        cambios.registrar('libro', [libro_id for libro_id, _ in pares])
+        deltas.update((datos['_limpios'][2], datos['_limpios'][1]) for _, datos in pares)
+        facetas.aplicar(deltas)
+        if actualizar:
+            # Cambiar idioma, año o autores puede mover el libro entre rankings
+            rankings.programar([pk for _, pk, _ in actualizar])
+        # Los autores cambian sus vecinos en "libros similares"
+        similares.programar([libro_id for libro_id, _ in pares])
+        if pares:
+            invalidar('libro')
+
+    def _libro(self, datos, **campos):
+        titulo, anio, idioma, autor_ids = datos['_limpios']
+        return Libro(
+            titulo=titulo, anio_publicacion=anio, idioma=idioma,
+            autores_nombres=unir_nombres(self.nombres[autor_id] for autor_id in autor_ids), **campos,
+        )
+
+
+class LoteAutores(_Lote):
+    modelo = Autor
+
+    def validar(self):
+        self._clasificar()
+        nombres = {}
+        for indice, datos in self.crear + [(i, d) for i, _, d in self.actualizar]:
+            nombre = str(datos.get('nombre') or '').strip()
+            if not nombre:
+                self._error(indice, 'El nombre del autor es requerido.')
+            elif nombre in nombres:
+                self._error(indice, 'El nombre se repite dentro del lote.')
+            else:
+                datos['_nombre'] = nombre
+                nombres[nombre] = indice
+
+        # Nombres ya ocupados por otro autor. Quedan libres los de autores que
+        # este mismo lote elimina o renombra (permite intercambiar dos nombres)
+        liberados = {pk for _, pk, _ in self.eliminar + self.actualizar}
+        for pk, nombre in Autor.objects.filter(nombre__in=nombres).values_list('pk', 'nombre'):
+            if pk not in liberados:
+                self._error(nombres[nombre], 'El autor ya existe.')
+        return self.valido
+
+    def aplicar(self):
+        Relacion = Libro.autores.through
+        afectados = set()
+
+        eliminar = [pk for _, pk, _ in self._pendientes(self.eliminar)]
+        afectados.update(eliminar_autores(eliminar))
+        for indice, pk, _ in self._pendientes(self.eliminar):
+            self._marcar(indice, pk, 'eliminado')
+
+        actualizar = self._pendientes(self.actualizar)
+        if actualizar:
+            # Primero se liberan los nombres para que dos autores puedan
+            # intercambiarlos; el provisional no puede coincidir con uno real
+            ids = [pk for _, pk, _ in actualizar]
+            marca = uuid.uuid4().hex
+            Autor.objects.bulk_update([Autor(pk=pk, nombre=f'__lote_tmp_{pk}_{marca}') for pk in ids], ['nombre'])
+            Autor.objects.bulk_update([Autor(pk=pk, nombre=datos['_nombre']) for _, pk, datos in actualizar], ['nombre'])
+            afectados.update(Relacion.objects.filter(autor_id__in=ids).values_list('libro_id', flat=True))
+            for indice, pk, _ in actualizar:
+                self._marcar(indice, pk, 'actualizado')
+
+        crear = self._pendientes(self.crear)
+        creados = Autor.objects.bulk_create([Autor(nombre=datos['_nombre']) for _, datos in crear])
+        for (indice, _), autor in zip(crear, creados):
+            self._marcar(indice, autor.pk, 'creado')
+
+        cambios.registrar('autor', [pk for _, pk, _ in actualizar] + [autor.pk for autor in creados])
+        if afectados:
+            recalcular_autores_nombres(afectados)
+            invalidar('libro')
+        if eliminar or actualizar or creados:
+            invalidar('autor')
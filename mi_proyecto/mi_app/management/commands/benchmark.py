@@ -0,0 +1,101 @@
+import json
+import os
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from mi_app import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Genera un catálogo sintético y mide latencia (p50/p95/p99), consultas por "
+        "petición y memoria pico de los endpoints de mi_app"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--libros', type=int, default=10000, help="Libros del catálogo sintético (10k, 100k, 1M...)")
+        parser.add_argument('--autores', type=int, help="Autores distintos (por defecto libros/5)")
+        parser.add_argument('--comentarios', type=int, help="Comentarios (por defecto 2 por libro)")
+        parser.add_argument('--peticiones', type=int, default=200, help="Peticiones por escenario")
+        parser.add_argument('--escenario', action='append', dest='escenarios', help="Limita la ejecución a este escenario (repetible)")
+        parser.add_argument('--semilla', type=int, default=0, help="Semilla aleatoria para resultados reproducibles")
+        parser.add_argument('--sin-cache', action='store_true', help="Vacía la caché antes de cada petición")
+        parser.add_argument('--salida', help="Guarda los resultados como JSON (línea base)")
+        parser.add_argument('--comparar', help="JSON de una ejecución anterior con el que comparar")
+        parser.add_argument('--umbral', type=float, default=20.0, help="Porcentaje de empeoramiento considerado regresión")
+        parser.add_argument(
+            '--usar-bd-actual', action='store_true',
+            help="Usa la base de datos configurada en lugar de una base temporal (¡escribe datos!)",
+        )
+
+    def handle(self, *args, **options):
+        if options['libros'] < 1 or options['peticiones'] < 1:
+            raise CommandError("--libros y --peticiones deben ser mayores que cero.")
+        base = None
+        if options['comparar']:
+            if not os.path.exists(options['comparar']):
+                raise CommandError(f"El archivo {options['comparar']} no existe.")
+            with open(options['comparar'], encoding='utf-8') as archivo:
+                base = json.load(archivo)
+
+        nombre_original = None
+        if not options['usar_bd_actual']:
+            setup_test_environment()
+            nombre_original = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            catalogo = benchmark.generar_catalogo(
+                options['libros'], options['autores'], options['comentarios'],
+                semilla=options['semilla'], salida=self.stdout,
+            )
+            medidas = benchmark.ejecutar(
+                options['peticiones'], semilla=options['semilla'],
+                sin_cache=options['sin_cache'], escenarios=options['escenarios'],
+            )
+        finally:
+            if nombre_original is not None:
+                connection.creation.destroy_test_db(nombre_original, verbosity=0)
+                teardown_test_environment()
+
+        resultado = {
+            'fecha': datetime.now(timezone.utc).isoformat(),
+            'commit': _commit_actual(),
+            'python': platform.python_version(),
+            'motor': connection.vendor,
+            'catalogo': catalogo,
+            **medidas,
+        }
+        self.stdout.write(f"{'escenario':22} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'consultas':>10} {'errores':>8}")
+        for nombre, datos in resultado['escenarios'].items():
+            self.stdout.write(
+                f"{nombre:22} {datos['p50_ms']:>9} {datos['p95_ms']:>9} {datos['p99_ms']:>9} "
+                f"{datos['consultas_media']:>10} {datos['errores']:>8}"
+            )
+        pico = resultado['rss_pico_mb']
+        self.stdout.write(f"Memoria pico (RSS): {'n/d' if pico is None else f'{pico} MB'}")
+
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
+
+        if base is not None:
+            lineas, regresion = benchmark.comparar(resultado, base, options['umbral'])
+            self.stdout.write('\n'.join(lineas))
+            if regresion:
+                raise CommandError("Se detectaron regresiones respecto a la línea base.")
+            self.stdout.write(self.style.SUCCESS("Sin regresiones respecto a la línea base."))
+
+
+def _commit_actual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
@@ -0,0 +1,73 @@
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from mi_app import benchmark, concurrencia
+
+
+class Command(BaseCommand):
+    help = (
+        "Lanza varios procesos que escriben comentarios y leen a la vez sobre una "
+        "base SQLite temporal; informa escrituras/s, bloqueos y latencia de lectura"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--escritores', type=int, default=4, help="Procesos que escriben")
+        parser.add_argument('--lectores', type=int, default=4, help="Procesos que leen")
+        parser.add_argument('--segundos', type=float, default=10.0, help="Duración de la carga")
+        parser.add_argument('--libros', type=int, default=2000, help="Libros del catálogo sintético")
+        parser.add_argument('--semilla', type=int, default=0, help="Semilla aleatoria")
+        parser.add_argument('--salida', help="Guarda los resultados como JSON")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError("Este banco de pruebas mide bloqueos de SQLite; el motor configurado es "
+                               f"{connection.vendor}.")
+        if options['escritores'] < 1 or options['segundos'] <= 0 or options['libros'] < 1:
+            raise CommandError("--escritores, --segundos y --libros deben ser mayores que cero.")
+        if options['lectores'] < 0:
+            raise CommandError("--lectores no puede ser negativo.")
+
+        # Base en un archivo temporal: varios procesos no pueden compartir una en memoria
+        carpeta = tempfile.mkdtemp(prefix='bench_concurrencia_')
+        ruta_bd = os.path.join(carpeta, 'db.sqlite3')
+        nombre_original = connection.settings_dict['NAME']
+        connection.close()
+        connection.settings_dict['NAME'] = ruta_bd
+        try:
+            call_command('migrate', verbosity=0, interactive=False)
+            benchmark.generar_catalogo(options['libros'], semilla=options['semilla'], salida=self.stdout)
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                modo = cursor.fetchone()[0]
+            resultado = concurrencia.medir_concurrencia(
+                settings.SETTINGS_MODULE, ruta_bd, options['escritores'], options['lectores'],
+                options['segundos'], semilla=options['semilla'],
+            )
+        finally:
+            connection.close()
+            connection.settings_dict['NAME'] = nombre_original
+            shutil.rmtree(carpeta, ignore_errors=True)
+
+        resultado = {'ajustes': settings.SETTINGS_MODULE, 'journal_mode': modo, **resultado}
+        self.stdout.write(f"Ajustes: {resultado['ajustes']} (journal_mode={modo})")
+        self.stdout.write(
+            f"Escrituras: {resultado['escrituras']} en {resultado['segundos']} s "
+            f"({resultado['escrituras_por_segundo']}/s), bloqueos: {resultado['bloqueos_escritura']}, "
+            f"otros errores: {resultado['errores_escritura']}"
+        )
+        self.stdout.write(
+            f"Lecturas: {resultado['lecturas']}, bloqueos: {resultado['bloqueos_lectura']}, "
+            f"p50 {resultado['lectura_p50_ms']} ms, p95 {resultado['lectura_p95_ms']} ms, "
+            f"p99 {resultado['lectura_p99_ms']} ms"
+        )
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
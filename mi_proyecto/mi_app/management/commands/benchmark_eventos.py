@@ -0,0 +1,65 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from mi_app import carga_eventos
+
+
+class Command(BaseCommand):
+    help = (
+        "Abre miles de conexiones SSE a /eventos/ dentro del proceso y mide la "
+        "memoria por conexión, la latencia de entrega y las lecturas del registro"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--suscriptores', type=int, default=2000, help="Conexiones abiertas a la vez")
+        parser.add_argument('--segundos', type=float, default=5.0, help="Tiempo con las conexiones ociosas")
+        parser.add_argument('--espera', type=float, default=60.0, help="Tiempo máximo para conectar o recibir")
+        parser.add_argument('--salida', help="Guarda los resultados como JSON")
+        parser.add_argument(
+            '--usar-bd-actual', action='store_true',
+            help="Usa la base de datos configurada en lugar de una base temporal (¡escribe datos!)",
+        )
+
+    def handle(self, *args, **options):
+        if options['suscriptores'] < 1 or options['segundos'] < 0 or options['espera'] <= 0:
+            raise CommandError("--suscriptores y --espera deben ser mayores que cero.")
+
+        nombre_original = None
+        if not options['usar_bd_actual']:
+            setup_test_environment()
+            nombre_original = connection.settings_dict['NAME']
+            connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            resultado = async_to_sync(carga_eventos.medir_suscriptores)(
+                options['suscriptores'], options['segundos'], options['espera'],
+            )
+        finally:
+            if nombre_original is not None:
+                connection.creation.destroy_test_db(nombre_original, verbosity=0)
+                teardown_test_environment()
+
+        self.stdout.write(
+            f"Suscriptores: {resultado['suscriptores']} ({resultado['errores']} errores), "
+            f"conectados en {resultado['conexion_s']} s"
+        )
+        pico = resultado['rss_pico_mb']
+        self.stdout.write(
+            f"Memoria: {resultado['memoria_total_mb']} MB en total, "
+            f"{resultado['memoria_por_conexion_kb']} KB por conexión (pico RSS {'n/d' if pico is None else f'{pico} MB'})"
+        )
+        self.stdout.write(
+            f"Evento recibido por {resultado['eventos_recibidos']}: p50 {resultado['entrega_p50_ms']} ms, "
+            f"p99 {resultado['entrega_p99_ms']} ms, máx. {resultado['entrega_max_ms']} ms"
+        )
+        self.stdout.write(
+            f"Lecturas del registro: {resultado['lecturas_registro']} "
+            f"({resultado['lecturas_por_segundo']}/s para todas las conexiones)"
+        )
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                json.dump(resultado, archivo, indent=2, ensure_ascii=False)
+            self.stdout.write(f"Resultados guardados en {options['salida']}")
@@ -0,0 +1,57 @@
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mi_app.benchmark import percentil
+
+
+class Command(BaseCommand):
+    help = (
+        "Lanza peticiones concurrentes contra un servidor en marcha (WSGI o ASGI) "
+        "y muestra peticiones/segundo y latencias"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', required=True, help="URL a pedir, p. ej. http://127.0.0.1:8000/libros/")
+        parser.add_argument('--concurrencia', type=int, default=20, help="Peticiones simultáneas")
+        parser.add_argument('--peticiones', type=int, default=500, help="Total de peticiones")
+        parser.add_argument('--cookie', help="Cabecera Cookie (sessionid=...) para vistas con login")
+
+    def handle(self, *args, **options):
+        if options['concurrencia'] < 1 or options['peticiones'] < 1:
+            raise CommandError("--concurrencia y --peticiones deben ser mayores que cero.")
+        cabeceras = {'X-Requested-With': 'XMLHttpRequest'}
+        if options['cookie']:
+            cabeceras['Cookie'] = options['cookie']
+
+        def pedir(_):
+            peticion = urllib.request.Request(options['url'], headers=cabeceras)
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(peticion, timeout=60) as respuesta:
+                    tamano = len(respuesta.read())
+                    estado = respuesta.status
+            except urllib.error.HTTPError as error:
+                tamano, estado = 0, error.code
+            except OSError:
+                tamano, estado = 0, None
+            return (time.perf_counter() - inicio) * 1000, estado, tamano
+
+        inicio = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrencia']) as ejecutor:
+            resultados = list(ejecutor.map(pedir, range(options['peticiones'])))
+        total = time.perf_counter() - inicio
+
+        latencias = [ms for ms, estado, _ in resultados if estado == 200]
+        errores = len(resultados) - len(latencias)
+        if not latencias:
+            raise CommandError(f"Ninguna petición respondió 200 ({errores} errores).")
+        self.stdout.write(f"Peticiones/segundo: {len(latencias) / total:.1f}")
+        self.stdout.write(
+            f"p50 {percentil(latencias, 50):.1f} ms  p95 {percentil(latencias, 95):.1f} ms  "
+            f"p99 {percentil(latencias, 99):.1f} ms"
+        )
+        self.stdout.write(f"Bytes por respuesta: {resultados[0][2]}  Errores: {errores}")
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mi_app import exportacion
+from mi_app.benchmark import rss_pico_mb
+
+
+class Command(BaseCommand):
+    help = (
+        "Exporta libros, autores y comentarios en CSV, NDJSON, Parquet o Arrow, "
+        "leyendo y escribiendo por bloques"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tabla', action='append', choices=list(exportacion.TABLAS), dest='tablas',
+            help="Tabla a exportar; se puede repetir (por defecto todas)",
+        )
+        parser.add_argument('--formato', choices=list(exportacion.FORMATOS), default='csv')
+        parser.add_argument(
+            '--compresion', choices=list(exportacion.COMPRESIONES),
+            help="CSV/NDJSON: el archivo entero; Parquet/Arrow: códec por columna",
+        )
+        parser.add_argument(
+            '--salida', default='.',
+            help="Carpeta de destino (por defecto la actual), o '-' para la salida estándar con una sola tabla",
+        )
+        parser.add_argument(
+            '--bloque', type=int, default=exportacion.FILAS_POR_BLOQUE,
+            help=f"Filas por bloque de escritura (por defecto {exportacion.FILAS_POR_BLOQUE})",
+        )
+
+    def handle(self, *args, **options):
+        tablas = list(dict.fromkeys(options['tablas'] or exportacion.TABLAS))
+        salida = options['salida']
+        if salida == '-' and len(tablas) != 1:
+            raise CommandError("Con --salida - hay que indicar una sola --tabla.")
+        if salida != '-' and not os.path.isdir(salida):
+            raise CommandError(f"La carpeta {salida} no existe.")
+        try:
+            exportaciones = [
+                exportacion.Exportacion(tabla, options['formato'], options['compresion'], options['bloque'])
+                for tabla in tablas
+            ]
+        except exportacion.ExportacionInvalida as error:
+            raise CommandError(str(error))
+
+        # Con la salida estándar ocupada por los datos, el resumen va a stderr
+        mensajes = self.stderr if salida == '-' else self.stdout
+        for actual in exportaciones:
+            inicio = time.perf_counter()
+            if salida == '-':
+                tamano = self._escribir(actual, sys.stdout.buffer)
+                sys.stdout.buffer.flush()
+            else:
+                ruta = os.path.join(salida, actual.nombre_archivo)
+                # Se escribe en un temporal y se renombra: una exportación a
+                # medias nunca sustituye a la anterior
+                temporal = ruta + '.parcial'
+                try:
+                    with open(temporal, 'wb') as archivo:
+                        tamano = self._escribir(actual, archivo)
+                    os.replace(temporal, ruta)
+                except BaseException:
+                    os.unlink(temporal)
+                    raise
+            transcurrido = time.perf_counter() - inicio
+            mensajes.write(self.style.SUCCESS(
+                f"{actual.nombre}: {actual.filas} filas, {tamano / (1024 * 1024):.1f} MB en {transcurrido:.1f}s "
+                f"({actual.filas / max(transcurrido, 1e-9):.0f} filas/s)"
+                + ("" if salida == '-' else f" -> {ruta}")
+            ))
+        pico = rss_pico_mb()
+        mensajes.write(f"Memoria máxima del proceso: {'n/d' if pico is None else f'{pico:.0f} MB'}")
+
+    def _escribir(self, actual, destino):
+        tamano = 0
+        for parte in actual:
+            destino.write(parte)
+            tamano += len(parte)
+        return tamano
@@ -1,47 +1,165 @@
-import csv
 import os
-from django.core.management.base import BaseCommand
-from mi_app.models import Autor, Libro
+import time
+from django.core.management.base import CommandError
+from mi_app import cambios, rankings, similares
+from mi_app.cache_versionada import invalidar
+from mi_app.canalizacion import Canalizacion
+from mi_app.comandos import ComandoQueInvalida
+from mi_app.importacion import ImportadorCatalogo, SincronizadorCatalogo, TAMANO_LOTE
+from mi_app.models import Comentario, LibroEstadisticas
 
-class Command(BaseCommand):
+# Ruta por defecto al CSV incluido en el proyecto
+CSV_POR_DEFECTO = os.path.join(os.path.dirname(__file__), 'data', 'BD_LIBRERIA.csv')
+# Con más libros tocados, rankings y similares se rehacen enteros en lugar de libro a libro
+LIMITE_INCREMENTAL = 2000
+
+
+class Command(ComandoQueInvalida):
     help = "Importa datos de libros desde un archivo CSV"
 
-    # Ruta fija al archivo CSV
-    CSV_FILE_PATH = r"C:\Users\Valen\Downloads\ENTORNOS\ENTORNO_4_NOV\ENTORNO_4_NOV\ENTORNO_4_NOV\mi_proyecto\mi_app\management\commands\data\BD_LIBRERIA.csv"
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            'ruta_csv', nargs='?', default=CSV_POR_DEFECTO,
+            help="Ruta al archivo CSV (por defecto data/BD_LIBRERIA.csv)",
+        )
+        parser.add_argument(
+            '--lote', type=int, default=TAMANO_LOTE,
+            help=f"Filas por bloque y por transacción (por defecto {TAMANO_LOTE})",
+        )
+        parser.add_argument(
+            '--sincronizar', action='store_true',
+            help="Toma el archivo como el catálogo completo: crea, actualiza y borra por Book_ID "
+                 "y no escribe las filas sin cambios",
+        )
+        parser.add_argument(
+            '--conservar-ausentes', action='store_true',
+            help="Con --sincronizar, no borra los libros que faltan en el archivo",
+        )
+        parser.add_argument(
+            '--procesos', '--workers', type=int, default=1, dest='procesos',
+            help="Procesos que interpretan y validan el CSV en paralelo (por defecto 1, sin procesos aparte)",
+        )
+        parser.add_argument(
+            '--validar', '--dry-run', action='store_true', dest='validar',
+            help="Solo interpreta y valida el archivo, sin escribir en la base de datos",
+        )
 
-    def handle(self, *args, **kwargs):
+    def invalida(self, options):
+        # --validar no escribe nada
+        return not options['validar']
+
+    def handle(self, *args, **options):
+        ruta = options['ruta_csv']
         # Verificar si el archivo existe
-        if not os.path.exists(self.CSV_FILE_PATH):
-            self.stderr.write(f"El archivo {self.CSV_FILE_PATH} no existe. Verifica la ruta.")
-            return
-
-        # Leer el archivo CSV
-        with open(self.CSV_FILE_PATH, 'r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                # Convertir anio_publicacion a entero, si es posible
-                try:
-                    anio_publicacion = int(float(row.get('Publication_Year', 0)))
-                except ValueError:
-                    anio_publicacion = None  # Valor por defecto si no es un número
-
-                # Crear o recuperar autores
-                autor_nombres = row['Authors'].split(", ")
-                autores = []
-                for autor_nombre in autor_nombres:
-                    autor, created = Autor.objects.get_or_create(nombre=autor_nombre)
-                    autores.append(autor)
-
-                # Crear libro
-                libro, created = Libro.objects.get_or_create(
-                    titulo=row['Title'],
-                    anio_publicacion=anio_publicacion,
-                    idioma=row.get('language_code', 'eng'),
-                    calificacion_promedio=row.get('average_rating', 0.0),
-                    total_calificaciones=row.get('Ratings_Count', 0),
-                    reseñas_texto=row.get('Text_Reviews', 0),
-                )
-                # Asociar autores al libro
-                libro.autores.set(autores)
-                libro.save()
-                self.stdout.write(f"Libro '{libro.titulo}' importado correctamente.")
+        if not os.path.exists(ruta):
+            raise CommandError(f"El archivo {ruta} no existe. Verifica la ruta.")
+        if options['lote'] < 1:
+            raise CommandError("El tamaño de lote debe ser mayor que cero.")
+        if options['procesos'] < 1:
+            raise CommandError("El número de procesos debe ser mayor que cero.")
+
+        canalizacion = Canalizacion(ruta, options['procesos'], options['lote'])
+        if options['validar']:
+            return self._validar(canalizacion)
+        if options['sincronizar']:
+            return self._sincronizar(canalizacion, options)
+
+        importador = ImportadorCatalogo()
+        estadisticas_previas = LibroEstadisticas.objects.count()
+        inicio = time.perf_counter()
+        canalizacion.ejecutar(importador.importar_preparadas, self._progreso(inicio, "procesadas"))
+        filas = canalizacion.filas
+
+        # bulk_create no emite señales: rankings y cachés se rehacen a mano
+        filas_ranking = rankings.recalcular_todo()
+        if similares.disponible():
+            similares.recalcular_todo()
+        else:
+            self.stdout.write(self.style.WARNING(
+                "numpy/scipy no están instalados: los libros similares de los libros nuevos no se calculan."
+            ))
+        invalidar('autor', 'libro')
+        cambios.marcar_recarga()
+
+        transcurrido = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"Importación terminada en {transcurrido:.1f}s ({filas / max(transcurrido, 1e-9):.0f} filas/s): "
+            f"{importador.libros_creados} libros y {importador.autores_creados} autores creados, "
+            f"{LibroEstadisticas.objects.count() - estadisticas_previas} estadísticas cargadas, "
+            f"{filas_ranking} filas de ranking, {importador.omitidas} filas omitidas."
+        ))
+        self._informe(canalizacion)
+
+    def _progreso(self, inicio, verbo):
+        def progreso(filas):
+            transcurrido = time.perf_counter() - inicio
+            self.stdout.write(f"{filas} filas {verbo} ({filas / max(transcurrido, 1e-9):.0f} filas/s)")
+        return progreso
+
+    def _informe(self, canalizacion):
+        for linea in canalizacion.informe():
+            self.stdout.write(f"  {linea}")
+
+    def _validar(self, canalizacion):
+        canalizacion.ejecutar(progreso=self._progreso(time.perf_counter(), "validadas"))
+        for numero, externo, problemas in canalizacion.ejemplos:
+            self.stdout.write(self.style.WARNING(
+                f"Registro {numero}" + (f" (Book_ID {externo})" if externo else "") + f": {'; '.join(problemas)}"
+            ))
+        estilo = self.style.WARNING if canalizacion.con_problemas else self.style.SUCCESS
+        self.stdout.write(estilo(
+            f"Validación terminada: {canalizacion.filas} filas, {canalizacion.con_problemas} con problemas. "
+            "No se ha escrito nada."
+        ))
+        self._informe(canalizacion)
+
+    def _sincronizar(self, canalizacion, options):
+        sincronizador = SincronizadorCatalogo()
+        inicio = time.perf_counter()
+        canalizacion.ejecutar(sincronizador.importar_preparadas, self._progreso(inicio, "comparadas"))
+        filas = canalizacion.filas
+
+        eliminar = not options['conservar_ausentes']
+        if eliminar and not sincronizador.vistos:
+            # Un archivo vacío o sin Book_ID vaciaría el catálogo
+            self.stdout.write(self.style.WARNING(
+                "El archivo no tiene filas con Book_ID: no se borra ningún libro."
+            ))
+            eliminar = False
+
+        # Los borrados cuentan para el límite: cada uno rehace grupos y listas ajenas
+        tocados = sincronizador.tocados
+        # Los libros nuevos necesitan su lista de similares y entrar en las ajenas
+        con_vecinos = {*sincronizador.creados, *sincronizador.autores_cambiados}
+        completo = len(tocados) + (sincronizador.ausentes if eliminar else 0) > LIMITE_INCREMENTAL
+        if eliminar:
+            sincronizador.eliminar_ausentes(incremental=not completo)
+        if completo:
+            rankings.recalcular_todo()
+            if similares.disponible():
+                similares.recalcular_todo()
+            else:
+                similares.actualizar_libros(con_vecinos)
+            cambios.marcar_recarga()
+        elif tocados:
+            rankings.actualizar_libros(tocados)
+            similares.actualizar_libros(con_vecinos)
+            cambios.registrar('autor', sincronizador.autores_nuevos)
+            cambios.registrar('libro', tocados)
+            titulos = sincronizador.titulos_cambiados
+            for desde in range(0, len(titulos), TAMANO_LOTE):
+                cambios.registrar('comentario', Comentario.objects.filter(
+                    libro_id__in=titulos[desde:desde + TAMANO_LOTE]
+                ).values_list('id', flat=True))
+        if tocados or sincronizador.autores_nuevos:
+            invalidar('autor', 'libro', 'comentario')
+
+        transcurrido = time.perf_counter() - inicio
+        self.stdout.write(self.style.SUCCESS(
+            f"Sincronización terminada en {transcurrido:.1f}s ({filas / max(transcurrido, 1e-9):.0f} filas/s): "
+            f"{sincronizador.libros_creados} libros creados, {sincronizador.actualizados} actualizados, "
+            f"{sincronizador.eliminados} eliminados y {sincronizador.sin_cambios} sin cambios; "
+            f"{sincronizador.autores_creados} autores creados, {sincronizador.omitidas} filas omitidas."
+        ))
+        self._informe(canalizacion)
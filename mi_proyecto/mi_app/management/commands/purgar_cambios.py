@@ -0,0 +1,22 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from mi_app.cambios import purgar
+
+
+class Command(BaseCommand):
+    help = (
+        "Borra del registro de cambios las entradas antiguas. Los navegadores que "
+        "se quedaron atrás recargan las tablas completas"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dias', type=float, default=7, help="Antigüedad mínima de las entradas a borrar")
+
+    def handle(self, *args, **options):
+        if options['dias'] < 0:
+            raise CommandError("--dias no puede ser negativo.")
+        borradas = purgar(timezone.now() - timedelta(days=options['dias']))
+        self.stdout.write(self.style.SUCCESS(f"{borradas} entradas del registro de cambios borradas."))
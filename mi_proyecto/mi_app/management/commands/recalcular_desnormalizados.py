@@ -0,0 +1,30 @@
+import time
+from django.core.management.base import CommandError
+from mi_app import cambios, facetas
+from mi_app.cache_versionada import invalidar
+from mi_app.comandos import ComandoQueInvalida
+from mi_app.desnormalizacion import recalcular_todo, TAMANO_LOTE
+
+
+class Command(ComandoQueInvalida):
+    help = "Reconstruye Libro.autores_nombres, Libro.num_comentarios y las facetas de todo el catálogo"
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--lote', type=int, default=TAMANO_LOTE,
+            help=f"Libros por bloque de actualización (por defecto {TAMANO_LOTE})",
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] < 1:
+            raise CommandError("El tamaño de lote debe ser mayor que cero.")
+        inicio = time.perf_counter()
+        total = recalcular_todo(tamano=options['lote'])
+        combinaciones = facetas.recalcular_todo()
+        invalidar('libro')
+        cambios.marcar_recarga()
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} libros y {combinaciones} combinaciones de facetas recalculados "
+            f"en {time.perf_counter() - inicio:.1f}s."
+        ))
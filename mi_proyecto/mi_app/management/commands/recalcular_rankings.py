@@ -0,0 +1,14 @@
+import time
+from mi_app.comandos import ComandoQueInvalida
+from mi_app.rankings import recalcular_todo, TOP_N
+
+
+class Command(ComandoQueInvalida):
+    help = f"Reconstruye los rankings precalculados (los {TOP_N} mejores por idioma, década, autor y global)"
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+        total = recalcular_todo()
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} filas de ranking escritas en {time.perf_counter() - inicio:.1f}s."
+        ))
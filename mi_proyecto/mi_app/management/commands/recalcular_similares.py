@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import CommandError
+
+from mi_app import similares
+from mi_app.comandos import ComandoQueInvalida
+
+
+class Command(ComandoQueInvalida):
+    help = (
+        f"Reconstruye los {similares.TOP_K} libros similares de cada libro (autores y lectores "
+        "en común) con matrices dispersas de NumPy/SciPy"
+    )
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--bloque', type=int, default=similares.TAMANO_BLOQUE,
+            help="Filas de la matriz que se multiplican a la vez (memoria frente a velocidad)",
+        )
+
+    def handle(self, *args, **options):
+        if not similares.disponible():
+            raise CommandError("Este comando necesita numpy y scipy: pip install numpy scipy")
+        if options['bloque'] < 1:
+            raise CommandError("--bloque debe ser mayor que cero.")
+        inicio = time.perf_counter()
+        total = similares.recalcular_todo(options['bloque'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{total} filas de libros similares escritas en {time.perf_counter() - inicio:.1f}s."
+        ))
@@ -0,0 +1,297 @@
+# Instrumentación por vista: número de consultas SQL, tiempo de base de datos,
+# tiempo de serialización, tiempo total y bytes de respuesta.
+#
+# MetricasMiddleware mide cada petición, añade la cabecera Server-Timing y
+# acumula histogramas en memoria (por proceso) que la vista /metrics/ expone
+# en el formato de texto de Prometheus. También puede avisar (o fallar, en
+# modo estricto) cuando una vista supera su presupuesto de consultas.
+#
+# Las respuestas transmitidas (StreamingHttpResponse) consultan la base de
+# datos mientras se envía el cuerpo, después de salir del middleware: su
+# contenido se envuelve para que esas consultas sigan midiéndose y la
+# petición se registra al agotarse el cuerpo. No llevan Server-Timing, porque
+# las cabeceras salen antes de que se conozcan los tiempos.
+#
+# En modo estricto la consulta que supera el presupuesto lanza la excepción
+# en el acto, dentro de la transacción de la vista, así que una escritura que
+# se pase se revierte en lugar de confirmarse.
+#
+# Ajustes:
+#   MI_APP_SERVER_TIMING            añade Server-Timing (por defecto, DEBUG)
+#   MI_APP_PRESUPUESTO_CONSULTAS    máximo de consultas por petición (None = sin límite)
+#   MI_APP_PRESUPUESTOS_POR_VISTA   {'mi_app:obtener_libros': 5, ...}
+#   MI_APP_PRESUPUESTO_ESTRICTO     lanza PresupuestoConsultasExcedido en vez de avisar
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+LIMITES_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LIMITES_CONSULTAS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class PresupuestoConsultasExcedido(Exception):
+    pass
+
+
+_CONTROL_TRANSACCION = ('SAVEPOINT', 'RELEASE', 'ROLLBACK')
+
+
+class _Medicion:
+    def __init__(self, request=None):
+        self.request = request
+        self.consultas = 0
+        self.tiempo_bd = 0.0
+        self.tiempo_serializacion = 0.0
+        # Ya se lanzó PresupuestoConsultasExcedido para esta petición
+        self.excedida = False
+
+    def _comprobar(self, sql):
+        # Solo en modo estricto y con la vista ya resuelta (antes no hay
+        # presupuesto). Los puntos de guardado cuentan pero no fallan: una
+        # excepción al liberar uno dejaría la transacción a medias
+        coincidencia = getattr(self.request, 'resolver_match', None)
+        if self.excedida or coincidencia is None or not getattr(settings, 'MI_APP_PRESUPUESTO_ESTRICTO', False):
+            return
+        if sql.lstrip().upper().startswith(_CONTROL_TRANSACCION):
+            return
+        presupuesto = presupuesto_para(coincidencia.view_name)
+        if presupuesto is not None and self.consultas >= presupuesto:
+            self.excedida = True
+            raise PresupuestoConsultasExcedido(
+                f'{coincidencia.view_name} superó su presupuesto de {presupuesto} consultas'
+            )
+
+    def __call__(self, execute, sql, params, many, context):
+        self._comprobar(sql)
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.consultas += 1
+            self.tiempo_bd += time.perf_counter() - inicio
+
+
+# Medición de la petición en curso. Las conexiones son locales a cada hilo y
+# las vistas async consultan desde hilos de sync_to_async, que heredan el
+# contexto; por eso la medición viaja en una ContextVar y no en la conexión.
+_medicion_actual = ContextVar('mi_app_medicion', default=None)
+
+
+def _envoltura_consultas(execute, sql, params, many, context):
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    return medicion(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def instrumentar_conexion(sender, connection, **kwargs):
+    if _envoltura_consultas not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_envoltura_consultas)
+
+
+class _Histograma:
+    def __init__(self, limites):
+        self.limites = limites
+        self.cubetas = [0] * len(limites)
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, valor):
+        for i, limite in enumerate(self.limites):
+            if valor <= limite:
+                self.cubetas[i] += 1
+        self.suma += valor
+        self.cuenta += 1
+
+
+class _MetricasVista:
+    def __init__(self):
+        self.duracion = _Histograma(LIMITES_SEGUNDOS)
+        self.consultas = _Histograma(LIMITES_CONSULTAS)
+        self.tiempo_bd = 0.0
+        self.tiempo_serializacion = 0.0
+        self.bytes = 0
+        self.presupuesto_excedido = 0
+
+
+class RegistroMetricas:
+    """Acumulador de métricas por vista, seguro entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._vistas = {}
+
+    def registrar(self, vista, duracion, medicion, bytes_respuesta, excedido):
+        with self._lock:
+            metricas = self._vistas.setdefault(vista, _MetricasVista())
+            metricas.duracion.observar(duracion)
+            metricas.consultas.observar(medicion.consultas)
+            metricas.tiempo_bd += medicion.tiempo_bd
+            metricas.tiempo_serializacion += medicion.tiempo_serializacion
+            metricas.bytes += bytes_respuesta
+            metricas.presupuesto_excedido += int(excedido)
+
+    def reiniciar(self):
+        with self._lock:
+            self._vistas.clear()
+
+    def prometheus(self):
+        """Devuelve las métricas en el formato de texto de Prometheus."""
+        with self._lock:
+            vistas = sorted(self._vistas.items())
+            lineas = []
+            for nombre, tipo, ayuda in (
+                ('mi_app_peticion_segundos', 'histogram', 'Duración total de la petición'),
+                ('mi_app_consultas_bd', 'histogram', 'Consultas SQL por petición'),
+            ):
+                lineas.append(f'# HELP {nombre} {ayuda}')
+                lineas.append(f'# TYPE {nombre} {tipo}')
+                for vista, metricas in vistas:
+                    histograma = metricas.duracion if nombre == 'mi_app_peticion_segundos' else metricas.consultas
+                    lineas.extend(_lineas_histograma(nombre, vista, histograma))
+            for nombre, atributo, ayuda in (
+                ('mi_app_bd_segundos_total', 'tiempo_bd', 'Tiempo acumulado en la base de datos'),
+                ('mi_app_serializacion_segundos_total', 'tiempo_serializacion', 'Tiempo acumulado serializando respuestas'),
+                ('mi_app_respuesta_bytes_total', 'bytes', 'Bytes de respuesta enviados'),
+                ('mi_app_presupuesto_excedido_total', 'presupuesto_excedido', 'Peticiones que superaron el presupuesto de consultas'),
+            ):
+                lineas.append(f'# HELP {nombre} {ayuda}')
+                lineas.append(f'# TYPE {nombre} counter')
+                for vista, metricas in vistas:
+                    lineas.append(f'{nombre}{{vista="{vista}"}} {getattr(metricas, atributo)}')
+        return '\n'.join(lineas) + '\n'
+
+
+def _lineas_histograma(nombre, vista, histograma):
+    for limite, cuenta in zip(histograma.limites, histograma.cubetas):
+        yield f'{nombre}_bucket{{vista="{vista}",le="{limite}"}} {cuenta}'
+    yield f'{nombre}_bucket{{vista="{vista}",le="+Inf"}} {histograma.cuenta}'
+    yield f'{nombre}_sum{{vista="{vista}"}} {histograma.suma}'
+    yield f'{nombre}_count{{vista="{vista}"}} {histograma.cuenta}'
+
+
+REGISTRO = RegistroMetricas()
+
+
+@contextmanager
+def medir_serializacion(request):
+    """Suma al request el tiempo que tarda el bloque (codificar la respuesta)."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicion = getattr(request, '_medicion', None)
+        if medicion is not None:
+            medicion.tiempo_serializacion += time.perf_counter() - inicio
+
+
+def presupuesto_para(vista):
+    por_vista = getattr(settings, 'MI_APP_PRESUPUESTOS_POR_VISTA', {})
+    return por_vista.get(vista, getattr(settings, 'MI_APP_PRESUPUESTO_CONSULTAS', None))
+
+
+# Fin del iterador del cuerpo
+_FIN = object()
+
+
+class MetricasMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion = request._medicion = _Medicion(request)
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        return self._terminar(request, response, medicion, inicio)
+
+    async def __acall__(self, request):
+        medicion = request._medicion = _Medicion(request)
+        token = _medicion_actual.set(medicion)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _medicion_actual.reset(token)
+        return self._terminar(request, response, medicion, inicio)
+
+    def _terminar(self, request, response, medicion, inicio):
+        if response.streaming:
+            flujo = self._aflujo if response.is_async else self._flujo
+            response.streaming_content = flujo(request, response.streaming_content, medicion, inicio)
+            return response
+        duracion = time.perf_counter() - inicio
+        self._registrar(request, medicion, duracion, len(response.content))
+        if getattr(settings, 'MI_APP_SERVER_TIMING', settings.DEBUG):
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={medicion.tiempo_bd * 1000:.2f};desc="{medicion.consultas} consultas"',
+                f'serializacion;dur={medicion.tiempo_serializacion * 1000:.2f}',
+                f'total;dur={duracion * 1000:.2f}',
+            ])
+        return response
+
+    def _flujo(self, request, contenido, medicion, inicio):
+        # Cada trozo se genera con la medición activa, sea cual sea el hilo o
+        # el contexto desde el que el servidor recorre el cuerpo
+        enviados = 0
+        iterador = iter(contenido)
+        try:
+            while True:
+                token = _medicion_actual.set(medicion)
+                try:
+                    trozo = next(iterador, _FIN)
+                finally:
+                    _medicion_actual.reset(token)
+                if trozo is _FIN:
+                    break
+                enviados += len(trozo)
+                yield trozo
+        finally:
+            self._registrar(request, medicion, time.perf_counter() - inicio, enviados)
+
+    async def _aflujo(self, request, contenido, medicion, inicio):
+        enviados = 0
+        iterador = aiter(contenido)
+        try:
+            while True:
+                token = _medicion_actual.set(medicion)
+                try:
+                    trozo = await anext(iterador, _FIN)
+                finally:
+                    _medicion_actual.reset(token)
+                if trozo is _FIN:
+                    break
+                enviados += len(trozo)
+                yield trozo
+        finally:
+            self._registrar(request, medicion, time.perf_counter() - inicio, enviados)
+
+    def _registrar(self, request, medicion, duracion, bytes_respuesta):
+        coincidencia = getattr(request, 'resolver_match', None)
+        vista = coincidencia.view_name if coincidencia else 'sin_resolver'
+        presupuesto = presupuesto_para(vista)
+        excedido = presupuesto is not None and medicion.consultas > presupuesto
+        REGISTRO.registrar(vista, duracion, medicion, bytes_respuesta, excedido)
+        # En modo estricto la excepción ya salió de la consulta que se pasó
+        if excedido and not medicion.excedida:
+            logger.warning(f'{vista} ejecutó {medicion.consultas} consultas (presupuesto: {presupuesto})')
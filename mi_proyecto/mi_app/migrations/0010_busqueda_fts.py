@@ -0,0 +1,55 @@
+from django.db import migrations
+
+# Copia congelada del índice tal como era en esta migración: los cambios
+# posteriores en mi_app/busqueda.py no deben alterar el historial
+
+# (tabla FTS, tabla de contenido, columna indexada)
+TABLAS_FTS = (
+    ('mi_app_libro_fts', 'mi_app_libro', 'titulo'),
+    ('mi_app_autor_fts', 'mi_app_autor', 'nombre'),
+    ('mi_app_comentario_fts', 'mi_app_comentario', 'texto'),
+)
+
+
+def _sentencias(fts, tabla, columna):
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{columna}, content='{tabla}', content_rowid='id', "
+        f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {tabla} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columna}) VALUES (new.id, new.{columna}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {tabla} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columna}) VALUES ('delete', old.id, old.{columna}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {columna} ON {tabla} BEGIN "
+        f"INSERT INTO {fts}({fts}, rowid, {columna}) VALUES ('delete', old.id, old.{columna}); "
+        f"INSERT INTO {fts}(rowid, {columna}) VALUES (new.id, new.{columna}); END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def instalar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for fts, tabla, columna in TABLAS_FTS:
+        for sentencia in _sentencias(fts, tabla, columna):
+            schema_editor.execute(sentencia)
+
+
+def eliminar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for fts, _, _ in TABLAS_FTS:
+        for sufijo in ('_ai', '_ad', '_au'):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}{sufijo}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0009_alter_libro_idioma'),
+    ]
+
+    operations = [
+        migrations.RunPython(instalar, eliminar),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0010_busqueda_fts'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='autor',
+            name='nombre',
+            field=models.CharField(max_length=255, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='comentario',
+            name='usuario',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='comentarios', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='libro',
+            name='anio_publicacion',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='libro',
+            name='idioma',
+            field=models.CharField(default='Español', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='comentario',
+            index=models.Index(fields=['libro', 'fecha', 'id'], name='comentario_libro_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comentario',
+            index=models.Index(fields=['fecha', 'id'], name='comentario_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+TAMANO_LOTE = 2000
+
+
+def poblar(apps, schema_editor):
+    # Solo modelos históricos: el código de mi_app puede cambiar después de esta migración
+    Libro = apps.get_model('mi_app', 'Libro')
+    Comentario = apps.get_model('mi_app', 'Comentario')
+    conteo = (
+        Comentario.objects.filter(libro=OuterRef('pk'))
+        .order_by().values('libro').annotate(total=Count('id')).values('total')
+    )
+    Libro.objects.update(num_comentarios=Coalesce(Subquery(conteo), 0))
+
+    Relacion = Libro.autores.through
+    ultimo = 0
+    while True:
+        ids = list(Libro.objects.filter(id__gt=ultimo).order_by('id').values_list('id', flat=True)[:TAMANO_LOTE])
+        if not ids:
+            return
+        nombres = {libro_id: [] for libro_id in ids}
+        filas = (
+            Relacion.objects.filter(libro_id__in=ids).order_by('libro_id', 'id').values_list('libro_id', 'autor__nombre')
+        )
+        for libro_id, nombre in filas:
+            nombres[libro_id].append(nombre)
+        Libro.objects.bulk_update(
+            [Libro(id=libro_id, autores_nombres=", ".join(lista)) for libro_id, lista in nombres.items()],
+            ['autores_nombres'],
+        )
+        ultimo = ids[-1]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0011_comentario_indices_fecha'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='autores_nombres',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='num_comentarios',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(poblar, migrations.RunPython.noop),
+    ]
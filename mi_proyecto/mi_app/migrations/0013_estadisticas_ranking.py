@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0012_libro_desnormalizado'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibroEstadisticas',
+            fields=[
+                ('libro', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='estadisticas', serialize=False, to='mi_app.libro')),
+                ('calificacion_promedio', models.FloatField()),
+                ('num_calificaciones', models.PositiveIntegerField(default=0)),
+                ('total_calificaciones', models.PositiveIntegerField(default=0)),
+                ('resenas_texto', models.PositiveIntegerField(default=0)),
+                ('estrellas_1', models.PositiveIntegerField(default=0)),
+                ('estrellas_2', models.PositiveIntegerField(default=0)),
+                ('estrellas_3', models.PositiveIntegerField(default=0)),
+                ('estrellas_4', models.PositiveIntegerField(default=0)),
+                ('estrellas_5', models.PositiveIntegerField(default=0)),
+                ('puntuacion', models.FloatField(db_index=True, default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RankingLibro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('global', 'Global'), ('idioma', 'Idioma'), ('decada', 'Década'), ('autor', 'Autor')], max_length=10)),
+                ('clave', models.CharField(blank=True, max_length=100)),
+                ('posicion', models.PositiveSmallIntegerField()),
+                ('puntuacion', models.FloatField()),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mi_app.libro')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('tipo', 'clave', 'posicion'), name='ranking_tipo_clave_posicion_uniq')],
+            },
+        ),
+    ]
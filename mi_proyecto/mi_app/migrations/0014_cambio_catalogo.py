@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0013_estadisticas_ranking'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CambioCatalogo',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('modelo', models.CharField(choices=[('autor', 'Autor'), ('libro', 'Libro'), ('comentario', 'Comentario'), ('*', 'Todos')], max_length=10)),
+                ('objeto_id', models.BigIntegerField(null=True)),
+                ('accion', models.CharField(choices=[('guardado', 'Guardado'), ('eliminado', 'Eliminado'), ('recarga', 'Recarga completa')], max_length=10)),
+                ('fecha', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0014_cambio_catalogo'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibroSimilar',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('posicion', models.PositiveSmallIntegerField()),
+                ('puntuacion', models.FloatField()),
+                ('libro', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mi_app.libro')),
+                ('similar', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='mi_app.libro')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('libro', 'posicion'), name='similar_libro_posicion_uniq')],
+            },
+        ),
+    ]
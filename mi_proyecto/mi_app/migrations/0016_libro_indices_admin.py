@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0015_libro_similar'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='libro',
+            name='anio_publicacion',
+            field=models.PositiveIntegerField(blank=True, db_index=True, null=True),
+        ),
+    ]
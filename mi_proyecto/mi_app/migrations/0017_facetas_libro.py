@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:17
+
+from django.db import migrations, models
+from django.db.models import Count
+
+TAMANO_LOTE = 5000
+
+
+def poblar(apps, schema_editor):
+    # Solo modelos históricos: el código de mi_app puede cambiar después de esta migración
+    Libro = apps.get_model('mi_app', 'Libro')
+    FacetaLibro = apps.get_model('mi_app', 'FacetaLibro')
+    filas = Libro.objects.order_by().values_list('idioma', 'anio_publicacion').annotate(total=Count('id'))
+    FacetaLibro.objects.bulk_create(
+        [FacetaLibro(idioma=idioma, anio=anio, cuantos=total) for idioma, anio, total in filas],
+        batch_size=TAMANO_LOTE,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0016_libro_indices_admin'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FacetaLibro',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idioma', models.CharField(max_length=100)),
+                ('anio', models.PositiveIntegerField(null=True)),
+                ('cuantos', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='libro',
+            index=models.Index(fields=['idioma', 'anio_publicacion'], name='libro_idioma_anio_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='facetalibro',
+            index=models.Index(fields=['idioma', 'anio'], name='faceta_idioma_anio_idx'),
+        ),
+        migrations.RunPython(poblar, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mi_app', '0017_facetas_libro'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='libro',
+            name='hash_contenido',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='libro',
+            name='id_externo',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
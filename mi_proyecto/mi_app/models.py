@@ -11,9 +11,32 @@ class Autor(models.Model):
 
 class Libro(models.Model):
     titulo = models.CharField(max_length=255)
-    anio_publicacion = models.PositiveIntegerField(null=True, blank=True)  # Para permitir años opcionales
+    # Índices para los filtros laterales del admin (ver admin.py) y las facetas
+    # (ver facetas.py): el de idioma es el compuesto de Meta.indexes
+    anio_publicacion = models.PositiveIntegerField(null=True, blank=True, db_index=True)  # Para permitir años opcionales
     idioma = models.CharField(max_length=100, default='Español')
     autores = models.ManyToManyField(Autor, related_name='libros')
+    # Campos desnormalizados, mantenidos por las señales de desnormalizacion.py
+    autores_nombres = models.TextField(blank=True, default='', editable=False)
+    num_comentarios = models.PositiveIntegerField(default=0, editable=False)
+    # Book_ID del CSV de origen y hash del contenido importado (ver importacion.py)
+    id_externo = models.CharField(max_length=64, null=True, blank=True, unique=True)
+    hash_contenido = models.CharField(max_length=32, blank=True, default='', editable=False)
+
+    class Meta:
+        indexes = [
+            # Idioma solo o idioma + año/década: el filtro de las facetas
+            models.Index(fields=['idioma', 'anio_publicacion'], name='libro_idioma_anio_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        libro = super().from_db(db, field_names, values)
+        # Idioma y año leídos, para mover los contadores de facetas al guardar
+        # sin volver a consultarlos (ver facetas.py)
+        if 'idioma' in libro.__dict__ and 'anio_publicacion' in libro.__dict__:
+            libro._faceta_leida = (libro.idioma, libro.anio_publicacion)
+        return libro
 
     def __str__(self):
         return self.titulo
@@ -25,5 +48,111 @@ class Comentario(models.Model):
     texto = models.TextField()
     fecha = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # Índices para la paginación por cursor ordenada por (fecha, id)
+        indexes = [
+            models.Index(fields=['libro', 'fecha', 'id'], name='comentario_libro_fecha_idx'),
+            models.Index(fields=['fecha', 'id'], name='comentario_fecha_idx'),
+        ]
+
     def __str__(self):
         return f'Comentario de {self.usuario.username} en {self.libro.titulo}'
+
+
+class LibroEstadisticas(models.Model):
+    # Calificaciones del CSV en una tabla aparte para no ensanchar Libro
+    libro = models.OneToOneField(Libro, on_delete=models.CASCADE, primary_key=True, related_name='estadisticas')
+    calificacion_promedio = models.FloatField()
+    num_calificaciones = models.PositiveIntegerField(default=0)
+    total_calificaciones = models.PositiveIntegerField(default=0)
+    resenas_texto = models.PositiveIntegerField(default=0)
+    estrellas_1 = models.PositiveIntegerField(default=0)
+    estrellas_2 = models.PositiveIntegerField(default=0)
+    estrellas_3 = models.PositiveIntegerField(default=0)
+    estrellas_4 = models.PositiveIntegerField(default=0)
+    estrellas_5 = models.PositiveIntegerField(default=0)
+    # Promedio bayesiano usado para ordenar los rankings (ver rankings.py)
+    puntuacion = models.FloatField(default=0, db_index=True)
+
+    # Un libro con pocas calificaciones se acerca a MEDIA_PREVIA en lugar de
+    # encabezar el ranking con un 5.0 de un solo voto
+    MEDIA_PREVIA = 4.0
+    VOTOS_PREVIOS = 1000
+
+    @classmethod
+    def calcular_puntuacion(cls, promedio, votos):
+        return (promedio * votos + cls.MEDIA_PREVIA * cls.VOTOS_PREVIOS) / (votos + cls.VOTOS_PREVIOS)
+
+    def save(self, *args, **kwargs):
+        self.puntuacion = self.calcular_puntuacion(self.calificacion_promedio, self.num_calificaciones)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f'Estadísticas de {self.libro_id}'
+
+
+class RankingLibro(models.Model):
+    # Clasificaciones precalculadas: las N mejores por idioma, década, autor y global
+    TIPOS = [('global', 'Global'), ('idioma', 'Idioma'), ('decada', 'Década'), ('autor', 'Autor')]
+
+    tipo = models.CharField(max_length=10, choices=TIPOS)
+    clave = models.CharField(max_length=100, blank=True)
+    posicion = models.PositiveSmallIntegerField()
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='+')
+    puntuacion = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['tipo', 'clave', 'posicion'], name='ranking_tipo_clave_posicion_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.tipo}:{self.clave} #{self.posicion}'
+
+
+class LibroSimilar(models.Model):
+    # Vecinos precalculados de cada libro por autores y lectores en común (ver similares.py)
+    libro = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='+')
+    posicion = models.PositiveSmallIntegerField()
+    similar = models.ForeignKey(Libro, on_delete=models.CASCADE, related_name='+')
+    puntuacion = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['libro', 'posicion'], name='similar_libro_posicion_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.libro_id} #{self.posicion}: {self.similar_id}'
+
+
+class FacetaLibro(models.Model):
+    # Libros por (idioma, año), mantenido por las señales de facetas.py. Sin
+    # restricción única: dos altas simultáneas de una combinación nueva pueden
+    # crear dos filas y las lecturas siempre suman
+    idioma = models.CharField(max_length=100)
+    anio = models.PositiveIntegerField(null=True)
+    cuantos = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['idioma', 'anio'], name='faceta_idioma_anio_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.idioma} {self.anio}: {self.cuantos}'
+
+
+class CambioCatalogo(models.Model):
+    # Registro de cambios para la sincronización incremental (/cambios/, ver
+    # cambios.py). El id es el número de secuencia que usan los clientes
+    MODELOS = [('autor', 'Autor'), ('libro', 'Libro'), ('comentario', 'Comentario'), ('*', 'Todos')]
+    ACCIONES = [('guardado', 'Guardado'), ('eliminado', 'Eliminado'), ('recarga', 'Recarga completa')]
+
+    modelo = models.CharField(max_length=10, choices=MODELOS)
+    objeto_id = models.BigIntegerField(null=True)
+    accion = models.CharField(max_length=10, choices=ACCIONES)
+    fecha = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f'#{self.pk} {self.accion} {self.modelo}:{self.objeto_id}'
@@ -0,0 +1,89 @@
+# Paginación por cursor (keyset) para listados ordenados por (fecha, id).
+#
+# En lugar de OFFSET, cada página continúa desde la última fila vista usando
+# una condición sobre (fecha, id) que aprovecha los índices compuestos de
+# Comentario, así que el coste de una página no depende de su posición.
+import base64
+from datetime import datetime
+
+from django.db.models import Q
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 200
+
+
+class CursorInvalido(ValueError):
+    pass
+
+
+def codificar_cursor(fecha, pk):
+    texto = f'{fecha.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        fecha, pk = base64.urlsafe_b64decode(cursor + relleno).decode().split('|')
+        return datetime.fromisoformat(fecha), int(pk)
+    except (ValueError, UnicodeDecodeError) as error:
+        raise CursorInvalido('Cursor inválido.') from error
+
+
+def leer_limite(params):
+    try:
+        limite = int(params.get('limit', LIMITE_POR_DEFECTO))
+    except ValueError:
+        return LIMITE_POR_DEFECTO
+    return min(max(limite, 1), LIMITE_MAXIMO)
+
+
+def _preparar(queryset, params):
+    limite = leer_limite(params)
+    antes = params.get('before')
+    if antes:
+        fecha, pk = decodificar_cursor(antes)
+        consulta = (
+            queryset.filter(Q(fecha__gt=fecha) | Q(fecha=fecha, id__gt=pk))
+            .order_by('fecha', 'id')[:limite + 1]
+        )
+        return consulta, limite, 'before'
+    despues = params.get('after')
+    if despues:
+        fecha, pk = decodificar_cursor(despues)
+        queryset = queryset.filter(Q(fecha__lt=fecha) | Q(fecha=fecha, id__lt=pk))
+    return queryset.order_by('-fecha', '-id')[:limite + 1], limite, 'after' if despues else None
+
+
+def _resultado(filas, limite, modo):
+    hay_mas = len(filas) > limite
+    if modo == 'before':
+        filas = filas[:limite][::-1]
+        hay_siguiente, hay_anterior = bool(filas), hay_mas
+    else:
+        filas = filas[:limite]
+        hay_siguiente, hay_anterior = hay_mas, modo == 'after' and bool(filas)
+    return {
+        'results': filas,
+        'siguiente': codificar_cursor(filas[-1]['fecha'], filas[-1]['id']) if hay_siguiente else None,
+        'anterior': codificar_cursor(filas[0]['fecha'], filas[0]['id']) if hay_anterior else None,
+    }
+
+
+def paginar(queryset, params):
+    """Devuelve una página de ``queryset`` (un ``values()`` con 'fecha' e 'id').
+
+    Las filas van de la más reciente a la más antigua. ``after`` continúa
+    hacia filas más antiguas y ``before`` hacia filas más recientes que el
+    cursor. El resultado incluye los cursores para pedir la página siguiente
+    (más antigua) y la anterior (más reciente); ``None`` si no hay más filas.
+    Lanza ``CursorInvalido`` si un cursor no se puede decodificar.
+    """
+    consulta, limite, modo = _preparar(queryset, params)
+    return _resultado(list(consulta), limite, modo)
+
+
+async def apaginar(queryset, params):
+    """Versión asíncrona de ``paginar`` para vistas ``async def``."""
+    consulta, limite, modo = _preparar(queryset, params)
+    return _resultado([fila async for fila in consulta], limite, modo)
@@ -0,0 +1,241 @@
+# Clasificaciones precalculadas de los libros mejor valorados.
+#
+# RankingLibro guarda, para cada grupo (global, idioma, década y autor), los
+# TOP_N libros con mayor LibroEstadisticas.puntuacion. /libros/ranking/ solo
+# lee esa tabla; nunca ordena el catálogo entero por petición.
+#
+# recalcular_todo() reconstruye todos los grupos con funciones de ventana
+# (importación masiva, comando recalcular_rankings). Para escrituras sueltas,
+# actualizar_libros() solo rehace los grupos donde el libro está o debería
+# entrar. Las señales de este módulo no la llaman en el acto: acumulan los
+# libros tocados (y los grupos que pierden un libro al borrarlo) y la
+# ejecutan una sola vez al confirmarse la transacción (ver al_confirmar.py).
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Min, Q, Value, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .al_confirmar import AlConfirmar
+from .cache_versionada import invalidar
+from .models import Autor, Libro, LibroEstadisticas, RankingLibro
+
+TOP_N = 50
+TIPOS = ('global', 'idioma', 'decada', 'autor')
+TAMANO_LOTE = 5000
+
+def decada(anio):
+    return None if anio is None else str(anio // 10 * 10)
+
+
+def grupos_de(idioma, anio, autor_ids):
+    """Grupos (tipo, clave) en los que compite un libro."""
+    grupos = {('global', ''), ('idioma', idioma)}
+    if anio is not None:
+        grupos.add(('decada', decada(anio)))
+    grupos.update(('autor', str(autor_id)) for autor_id in autor_ids)
+    return grupos
+
+
+def _borrar_grupos(por_tipo):
+    for tipo, claves in por_tipo.items():
+        RankingLibro.objects.filter(tipo=tipo, clave__in=claves).delete()
+
+
+def _por_tipo(grupos):
+    por_tipo = defaultdict(list)
+    for tipo, clave in grupos:
+        por_tipo[tipo].append(clave)
+    return por_tipo
+
+
+def _filas(tipo, claves=None):
+    return [
+        RankingLibro(tipo=tipo, clave=str(clave), posicion=posicion, libro_id=libro_id, puntuacion=puntuacion)
+        for clave, posicion, libro_id, puntuacion in _filas_por_tipo(tipo, claves)
+    ]
+
+
+def recalcular_grupos(grupos):
+    """Rehace los grupos indicados: una consulta por tipo más un borrado y una inserción."""
+    por_tipo = _por_tipo(set(grupos))
+    if not por_tipo:
+        return
+    filas = []
+    for tipo, claves in por_tipo.items():
+        filas.extend(_filas(tipo, claves))
+    with transaction.atomic():
+        _borrar_grupos(por_tipo)
+        RankingLibro.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+    invalidar('ranking')
+
+
+def actualizar_libros(libro_ids):
+    """Actualiza los rankings tras cambiar las estadísticas o los datos de estos libros.
+
+    Un grupo se rehace si alguno de los libros ya figura en él con datos que
+    dejaron de ser ciertos (otra puntuación, o ya no pertenece al grupo) o si
+    ahora tiene puntuación suficiente para entrar.
+    """
+    libro_ids = set(libro_ids)
+    if not libro_ids:
+        return
+    actuales = defaultdict(dict)
+    for tipo, clave, libro_id, puntuacion in RankingLibro.objects.filter(libro_id__in=libro_ids).values_list(
+        'tipo', 'clave', 'libro_id', 'puntuacion'
+    ):
+        actuales[libro_id][(tipo, clave)] = puntuacion
+    datos = list(
+        LibroEstadisticas.objects.filter(libro_id__in=libro_ids)
+        .values_list('libro_id', 'puntuacion', 'libro__idioma', 'libro__anio_publicacion')
+    )
+    autores = defaultdict(list)
+    if datos:
+        for libro_id, autor_id in Libro.autores.through.objects.filter(
+            libro_id__in=[fila[0] for fila in datos]
+        ).values_list('libro_id', 'autor_id'):
+            autores[libro_id].append(autor_id)
+
+    sucios = set()
+    aspirantes = {}
+    con_estadisticas = set()
+    for libro_id, puntuacion, idioma, anio in datos:
+        con_estadisticas.add(libro_id)
+        grupos = grupos_de(idioma, anio, autores[libro_id])
+        for grupo, anterior in actuales[libro_id].items():
+            # Figura con otra puntuación o en un grupo al que ya no pertenece
+            if grupo not in grupos or anterior != puntuacion:
+                sucios.add(grupo)
+        for grupo in grupos - actuales[libro_id].keys():
+            aspirantes[grupo] = max(aspirantes.get(grupo, puntuacion), puntuacion)
+    # Libros que estaban en rankings pero ya no tienen estadísticas
+    for libro_id, grupos in actuales.items():
+        if libro_id not in con_estadisticas:
+            sucios.update(grupos)
+
+    pendientes = {grupo: puntuacion for grupo, puntuacion in aspirantes.items() if grupo not in sucios}
+    if pendientes:
+        condicion = Q()
+        for tipo, claves in _por_tipo(pendientes).items():
+            condicion |= Q(tipo=tipo, clave__in=claves)
+        umbrales = {
+            (tipo, clave): (cuantos, minimo)
+            for tipo, clave, cuantos, minimo in RankingLibro.objects.filter(condicion)
+            .values('tipo', 'clave').annotate(cuantos=Count('id'), minimo=Min('puntuacion'))
+            .values_list('tipo', 'clave', 'cuantos', 'minimo')
+        }
+        for grupo, puntuacion in pendientes.items():
+            cuantos, minimo = umbrales.get(grupo, (0, None))
+            if cuantos < TOP_N or puntuacion >= minimo:
+                sucios.add(grupo)
+    recalcular_grupos(sucios)
+
+
+def _filas_por_tipo(tipo, claves=None):
+    """(clave, posicion, libro_id, puntuacion) de los TOP_N de cada grupo del tipo, en una consulta.
+
+    Con ``claves`` solo se calculan esos grupos del tipo.
+    """
+    if tipo == 'autor':
+        base = Libro.autores.through.objects.filter(libro__estadisticas__isnull=False)
+        clave, libro, puntuacion = F('autor_id'), F('libro_id'), F('libro__estadisticas__puntuacion')
+    else:
+        base = LibroEstadisticas.objects.all()
+        libro, puntuacion = F('libro_id'), F('puntuacion')
+        if tipo == 'global':
+            clave = Value('')
+        elif tipo == 'idioma':
+            clave = F('libro__idioma')
+        else:
+            base = base.filter(libro__anio_publicacion__isnull=False)
+            # División entera: 1987 -> 198 -> 1980
+            clave = F('libro__anio_publicacion') / 10 * 10
+    base = base.annotate(grupo=clave)
+    if claves is not None and tipo != 'global':
+        base = base.filter(grupo__in=[clave if tipo == 'idioma' else int(clave) for clave in claves])
+    return (
+        base.annotate(
+            libro_ranking=libro, puntuacion_ranking=puntuacion,
+            posicion=Window(RowNumber(), partition_by=[clave], order_by=[puntuacion.desc(), libro.asc()]),
+        )
+        .filter(posicion__lte=TOP_N)
+        .values_list('grupo', 'posicion', 'libro_ranking', 'puntuacion_ranking')
+    )
+
+
+@transaction.atomic
+def recalcular_todo():
+    """Reconstruye todos los rankings. Devuelve el número de filas escritas."""
+    RankingLibro.objects.all().delete()
+    total = 0
+    for tipo in TIPOS:
+        filas = _filas(tipo)
+        RankingLibro.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+        total += len(filas)
+    invalidar('ranking')
+    return total
+
+
+# Los dos recálculos leen las filas ya confirmadas, así que da igual cuál
+# corra primero
+_libros_pendientes = AlConfirmar(lambda libros: actualizar_libros(libros))
+_grupos_pendientes = AlConfirmar(lambda grupos: recalcular_grupos(grupos))
+
+
+def programar(libro_ids):
+    """Actualiza los rankings de estos libros cuando se confirme la transacción en curso."""
+    _libros_pendientes.agregar(libro_ids)
+
+
+def programar_grupos(grupos):
+    """Rehace estos grupos cuando se confirme la transacción en curso."""
+    _grupos_pendientes.agregar(grupos)
+
+
+@receiver(post_save, sender=LibroEstadisticas)
+def estadisticas_guardadas(sender, instance, **kwargs):
+    programar([instance.libro_id])
+
+
+@receiver(post_delete, sender=LibroEstadisticas)
+def estadisticas_eliminadas(sender, instance, **kwargs):
+    programar([instance.libro_id])
+
+
+@receiver(post_save, sender=Libro)
+def libro_guardado(sender, instance, created, **kwargs):
+    # Un libro recién creado todavía no tiene estadísticas
+    if not created:
+        programar([instance.pk])
+
+
+@receiver(m2m_changed, sender=Libro.autores.through)
+def autores_de_libro_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        programar([instance.pk])
+    else:
+        # autor.libros.add/remove/clear: el grupo del autor se rehace entero
+        programar_grupos([('autor', str(instance.pk))])
+
+
+@receiver(pre_delete, sender=Libro)
+def libro_por_eliminar(sender, instance, **kwargs):
+    # Sus filas de ranking se borran en cascada: hay que rellenar esos grupos
+    instance._grupos_ranking = set(
+        RankingLibro.objects.filter(libro_id=instance.pk).values_list('tipo', 'clave')
+    )
+
+
+@receiver(post_delete, sender=Libro)
+def libro_eliminado(sender, instance, **kwargs):
+    programar_grupos(getattr(instance, '_grupos_ranking', ()))
+
+
+@receiver(post_delete, sender=Autor)
+def autor_eliminado(sender, instance, **kwargs):
+    _borrar_grupos({'autor': [str(instance.pk)]})
+    invalidar('ranking')
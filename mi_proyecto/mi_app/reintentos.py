@@ -0,0 +1,55 @@
+# Reintento de transacciones de escritura ante bloqueos de SQLite.
+#
+# Con varios procesos escribiendo a la vez, SQLite puede responder "database
+# is locked" aunque haya busy_timeout (por ejemplo, si una transacción de
+# lectura intenta pasar a escritura mientras otra escribe). El decorador
+# escritura_atomica ejecuta la vista en transaction.atomic y, si falla por
+# bloqueo, la repite con esperas crecientes y aleatorias.
+#
+# Ajustes:
+#   MI_APP_REINTENTOS_ESCRITURA   intentos totales (por defecto 5)
+#   MI_APP_REINTENTOS_ESPERA      espera inicial en segundos (por defecto 0.05)
+import functools
+import logging
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+MENSAJES_BLOQUEO = ('database is locked', 'database table is locked')
+ESPERA_MAXIMA = 1.0
+
+
+def es_bloqueo(error):
+    return any(mensaje in str(error) for mensaje in MENSAJES_BLOQUEO)
+
+
+def escritura_atomica(vista):
+    """Como ``transaction.atomic`` para vistas, con reintentos si la base está bloqueada."""
+    @functools.wraps(vista)
+    def envoltura(*args, **kwargs):
+        # Dentro de otra transacción no se puede repetir solo una parte
+        if transaction.get_connection().in_atomic_block:
+            with transaction.atomic():
+                return vista(*args, **kwargs)
+        intentos = getattr(settings, 'MI_APP_REINTENTOS_ESCRITURA', 5)
+        espera = getattr(settings, 'MI_APP_REINTENTOS_ESPERA', 0.05)
+        for intento in range(1, intentos + 1):
+            confirmada = []
+            try:
+                with transaction.atomic():
+                    # Primer callback de on_commit: marca que el COMMIT ya se hizo
+                    transaction.on_commit(lambda: confirmada.append(True))
+                    return vista(*args, **kwargs)
+            except OperationalError as error:
+                # Un fallo posterior al COMMIT (en otro callback) no se reintenta:
+                # repetir la vista duplicaría la escritura
+                if confirmada or intento == intentos or not es_bloqueo(error):
+                    raise
+                pausa = min(espera * 2 ** (intento - 1), ESPERA_MAXIMA) * random.uniform(0.5, 1.5)
+                logger.info('%s: base bloqueada, reintento %d en %.3fs', vista.__name__, intento, pausa)
+                time.sleep(pausa)
+    return envoltura
@@ -0,0 +1,37 @@
+# Señales que renuevan la versión de caché de cada modelo en cada escritura,
+# ya sea desde las vistas AJAX, el admin o el shell.
+from django.contrib.auth.models import User
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_versionada import invalidar
+from .models import Autor, Comentario, Libro
+
+
+@receiver([post_save, post_delete], sender=Autor)
+def autor_modificado(sender, **kwargs):
+    invalidar('autor')
+
+
+@receiver([post_save, post_delete], sender=Libro)
+def libro_modificado(sender, **kwargs):
+    invalidar('libro')
+
+
+@receiver(m2m_changed, sender=Libro.autores.through)
+def autores_de_libro_modificados(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidar('libro')
+
+
+@receiver([post_save, post_delete], sender=Comentario)
+def comentario_modificado(sender, **kwargs):
+    invalidar('comentario')
+
+
+@receiver([post_save, post_delete], sender=User)
+def usuario_modificado(sender, update_fields=None, **kwargs):
+    # Cada inicio de sesión guarda last_login; eso no afecta a ningún listado
+    if update_fields and set(update_fields) == {'last_login'}:
+        return
+    invalidar('usuario')
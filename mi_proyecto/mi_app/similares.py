@@ -0,0 +1,365 @@
+# Recomendaciones "libros similares" precalculadas.
+#
+# Cada libro se describe con un vector binario de características: sus
+# autores y los usuarios que lo comentaron. La similitud entre dos libros es
+# el coseno de sus vectores, que con valores 0/1 es
+#     compartidas / sqrt(características de A * características de B)
+# LibroSimilar guarda los TOP_K vecinos de cada libro; /libros/<id>/similares/
+# los lee con una consulta por el índice (libro, posicion).
+#
+# recalcular_todo() construye la matriz dispersa libros x características con
+# NumPy/SciPy y multiplica por bloques de filas (comando recalcular_similares).
+# Para escrituras sueltas, actualizar_libros() recalcula con consultas los
+# vecinos de los libros tocados y corrige las listas de los libros que los
+# tienen (o deberían tenerlos) como vecinos. Las señales acumulan los libros
+# y la actualización se hace al confirmarse la transacción (ver
+# al_confirmar.py). Un libro que baja de puntuación sigue en las listas ajenas
+# hasta la siguiente reconstrucción completa: solo se sabe qué libro debería
+# sustituirlo recalculando esa lista entera.
+#
+# La actualización incremental corre al confirmar la escritura, dentro de la
+# petición, así que su coste está acotado: de cada libro tocado se miran sus
+# MAX_LECTORES últimos lectores y, de cada autor o lector, sus
+# MAX_LIBROS_POR_CARACTERISTICA libros más recientes. Un lector con miles de
+# comentarios no arrastra el catálogo entero; para libros y lectores por
+# debajo de esos topes el resultado es el mismo que el de recalcular_todo().
+#
+# NumPy y SciPy solo hacen falta para la reconstrucción completa.
+import math
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .al_confirmar import AlConfirmar
+from .cache_versionada import invalidar
+from .models import Autor, Comentario, Libro, LibroSimilar
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - dependencia opcional
+    np = sparse = None
+
+TOP_K = 20
+# Filas de la matriz que se multiplican a la vez en la reconstrucción completa
+TAMANO_BLOQUE = 2000
+TAMANO_LOTE = 5000
+# Parámetros por consulta en las listas IN (SQLite admite 999 en versiones antiguas)
+MAX_PARAMETROS = 900
+# Topes de la actualización incremental (ver la cabecera)
+MAX_LECTORES = 100
+MAX_LIBROS_POR_CARACTERISTICA = 100
+
+def disponible():
+    """True si están NumPy y SciPy (necesarios para recalcular_todo)."""
+    return np is not None and sparse is not None
+
+
+def _trozos(valores, tamano=MAX_PARAMETROS):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tamano):
+        yield valores[inicio:inicio + tamano]
+
+
+def _ordenar(puntuaciones):
+    """Los TOP_K ``(similar_id, puntuacion)`` de mayor puntuación; empates por id."""
+    return sorted(puntuaciones.items(), key=lambda par: (-par[1], par[0]))[:TOP_K]
+
+
+def _filas(libro_id, vecinos):
+    return [
+        LibroSimilar(libro_id=libro_id, posicion=posicion, similar_id=similar_id, puntuacion=puntuacion)
+        for posicion, (similar_id, puntuacion) in enumerate(vecinos, start=1)
+    ]
+
+
+# --- Reconstrucción completa (NumPy/SciPy) ---
+
+def _matriz():
+    """Matriz CSR libros x características normalizada por filas y los ids de sus filas."""
+    Relacion = Libro.autores.through
+    autores = np.array(list(Relacion.objects.values_list('libro_id', 'autor_id')), dtype=np.int64).reshape(-1, 2)
+    lectores = np.array(
+        list(Comentario.objects.values_list('libro_id', 'usuario_id').distinct()), dtype=np.int64,
+    ).reshape(-1, 2)
+    libro_ids = np.unique(np.concatenate([autores[:, 0], lectores[:, 0]]))
+    autor_ids = np.unique(autores[:, 1])
+    usuario_ids = np.unique(lectores[:, 1])
+    # Columnas: primero los autores y a continuación los usuarios
+    filas = np.searchsorted(libro_ids, np.concatenate([autores[:, 0], lectores[:, 0]]))
+    columnas = np.concatenate([
+        np.searchsorted(autor_ids, autores[:, 1]),
+        len(autor_ids) + np.searchsorted(usuario_ids, lectores[:, 1]),
+    ])
+    matriz = sparse.csr_matrix(
+        (np.ones(len(filas)), (filas, columnas)), shape=(len(libro_ids), len(autor_ids) + len(usuario_ids)),
+    )
+    # Las parejas repetidas se suman al construir la matriz: el vector es binario
+    matriz.data[:] = 1.0
+    normas = np.sqrt(np.diff(matriz.indptr))
+    return (sparse.diags(1.0 / normas) @ matriz).tocsr(), libro_ids
+
+
+def _vecinos_bloque(bloque, inicio, libro_ids):
+    """Recorre las filas de un bloque de similitudes y devuelve sus TOP_K vecinos."""
+    for fila in range(bloque.shape[0]):
+        desde, hasta = bloque.indptr[fila], bloque.indptr[fila + 1]
+        columnas = bloque.indices[desde:hasta]
+        valores = bloque.data[desde:hasta]
+        # Sin el propio libro (la diagonal de la matriz completa)
+        propia = columnas != inicio + fila
+        columnas, valores = columnas[propia], valores[propia]
+        if len(valores) > TOP_K:
+            # Descarta lo que no puede entrar antes de ordenar con desempate
+            umbral = np.partition(valores, len(valores) - TOP_K)[len(valores) - TOP_K]
+            seleccion = valores >= umbral
+            columnas, valores = columnas[seleccion], valores[seleccion]
+        similares = libro_ids[columnas]
+        orden = np.lexsort((similares, -valores))[:TOP_K]
+        yield int(libro_ids[inicio + fila]), [
+            (int(similares[i]), float(valores[i])) for i in orden
+        ]
+
+
+@transaction.atomic
+def recalcular_todo(tamano_bloque=TAMANO_BLOQUE):
+    """Reconstruye todos los vecinos. Devuelve el número de filas escritas."""
+    if not disponible():
+        raise RuntimeError("La reconstrucción completa necesita numpy y scipy.")
+    LibroSimilar.objects.all().delete()
+    matriz, libro_ids = _matriz()
+    traspuesta = matriz.T.tocsc()
+    total = 0
+    filas = []
+    for inicio in range(0, matriz.shape[0], tamano_bloque):
+        bloque = (matriz[inicio:inicio + tamano_bloque] @ traspuesta).tocsr()
+        for libro_id, vecinos in _vecinos_bloque(bloque, inicio, libro_ids):
+            filas.extend(_filas(libro_id, vecinos))
+        if len(filas) >= TAMANO_LOTE:
+            LibroSimilar.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+            total += len(filas)
+            filas = []
+    LibroSimilar.objects.bulk_create(filas, batch_size=TAMANO_LOTE)
+    total += len(filas)
+    invalidar('similares')
+    return total
+
+
+# --- Actualización incremental (consultas) ---
+
+def _ultimos(filas, grupo, orden, cuantos):
+    """Las ``cuantos`` filas de cada ``grupo`` con mayor ``orden``."""
+    return filas.annotate(
+        numero=Window(RowNumber(), partition_by=[F(grupo)], order_by=F(orden).desc()),
+    ).filter(numero__lte=cuantos)
+
+
+def _caracteristicas(libro_ids):
+    """``{libro_id: {('a', autor_id) | ('u', usuario_id)}}`` de estos libros.
+
+    De los lectores solo cuentan los de los últimos MAX_LECTORES comentarios.
+    """
+    resultado = defaultdict(set)
+    Relacion = Libro.autores.through
+    for trozo in _trozos(libro_ids):
+        for libro_id, autor_id in Relacion.objects.filter(libro_id__in=trozo).values_list('libro_id', 'autor_id'):
+            resultado[libro_id].add(('a', autor_id))
+        comentarios = _ultimos(Comentario.objects.filter(libro_id__in=trozo), 'libro_id', 'id', MAX_LECTORES)
+        for libro_id, usuario_id in comentarios.values_list('libro_id', 'usuario_id'):
+            resultado[libro_id].add(('u', usuario_id))
+    return resultado
+
+
+def _candidatos(caracteristicas):
+    """``{libro_id: {características compartidas con alguna de las dadas}}``.
+
+    De cada autor o lector, solo sus MAX_LIBROS_POR_CARACTERISTICA libros o
+    comentarios más recientes.
+    """
+    autores = {valor for tipo, valor in caracteristicas if tipo == 'a'}
+    usuarios = {valor for tipo, valor in caracteristicas if tipo == 'u'}
+    resultado = defaultdict(set)
+    Relacion = Libro.autores.through
+    for trozo in _trozos(autores):
+        relaciones = _ultimos(
+            Relacion.objects.filter(autor_id__in=trozo), 'autor_id', 'libro_id', MAX_LIBROS_POR_CARACTERISTICA,
+        )
+        for libro_id, autor_id in relaciones.values_list('libro_id', 'autor_id'):
+            resultado[libro_id].add(('a', autor_id))
+    for trozo in _trozos(usuarios):
+        comentarios = _ultimos(
+            Comentario.objects.filter(usuario_id__in=trozo), 'usuario_id', 'id', MAX_LIBROS_POR_CARACTERISTICA,
+        )
+        for libro_id, usuario_id in comentarios.values_list('libro_id', 'usuario_id'):
+            resultado[libro_id].add(('u', usuario_id))
+    return resultado
+
+
+def _tamanos(libro_ids):
+    """Número de características de cada libro (autores + lectores distintos)."""
+    tamanos = defaultdict(int)
+    Relacion = Libro.autores.through
+    for trozo in _trozos(libro_ids):
+        for libro_id, cuantos in (
+            Relacion.objects.filter(libro_id__in=trozo).values('libro_id')
+            .annotate(cuantos=Count('id')).values_list('libro_id', 'cuantos')
+        ):
+            tamanos[libro_id] += cuantos
+        for libro_id, cuantos in (
+            Comentario.objects.filter(libro_id__in=trozo).values('libro_id')
+            .annotate(cuantos=Count('usuario_id', distinct=True)).values_list('libro_id', 'cuantos')
+        ):
+            tamanos[libro_id] += cuantos
+    return tamanos
+
+
+def similitudes(libro_ids):
+    """``{libro_id: {otro_id: coseno}}`` con todos los libros que comparten algo con cada uno."""
+    propias = _caracteristicas(libro_ids)
+    todas = set().union(*propias.values()) if propias else set()
+    compartidas = _candidatos(todas)
+    # Con el tamaño real de cada libro, no el de sus características acotadas
+    tamanos = _tamanos(set(compartidas) | set(libro_ids))
+    resultado = {}
+    for libro_id in libro_ids:
+        mias = propias.get(libro_id, set())
+        puntuaciones = {}
+        for otro_id, suyas in compartidas.items():
+            if otro_id == libro_id:
+                continue
+            comunes = len(mias & suyas)
+            if comunes:
+                puntuaciones[otro_id] = comunes / math.sqrt(tamanos[libro_id] * tamanos[otro_id])
+        resultado[libro_id] = puntuaciones
+    return resultado
+
+
+def _listas(libro_ids):
+    listas = defaultdict(dict)
+    for trozo in _trozos(libro_ids):
+        for libro_id, similar_id, puntuacion in (
+            LibroSimilar.objects.filter(libro_id__in=trozo).values_list('libro_id', 'similar_id', 'puntuacion')
+        ):
+            listas[libro_id][similar_id] = puntuacion
+    return listas
+
+
+def actualizar_libros(libro_ids):
+    """Recalcula los vecinos de estos libros tras cambiar sus autores o lectores.
+
+    También corrige las listas ajenas: donde el libro ya figura se actualiza
+    su puntuación (o se quita si ya no comparte nada) y donde no figura entra
+    si supera al último vecino.
+    """
+    # Los libros ya eliminados no tienen lista que rehacer
+    libro_ids = {
+        libro_id for trozo in _trozos(set(libro_ids))
+        for libro_id in Libro.objects.filter(id__in=trozo).values_list('id', flat=True)
+    }
+    if not libro_ids:
+        return
+    puntuaciones = similitudes(libro_ids)
+    # Libros que ya tienen a alguno de estos como vecino
+    tienen = defaultdict(set)
+    for trozo in _trozos(libro_ids):
+        for libro_id, similar_id in (
+            LibroSimilar.objects.filter(similar_id__in=trozo).values_list('libro_id', 'similar_id')
+        ):
+            tienen[libro_id].add(similar_id)
+    ajenos = (set(tienen) | {otro for p in puntuaciones.values() for otro in p}) - libro_ids
+    listas = _listas(ajenos)
+
+    nuevas = {libro_id: _ordenar(puntuaciones[libro_id]) for libro_id in libro_ids}
+    for otro_id in ajenos:
+        lista = dict(listas.get(otro_id, {}))
+        cambiada = False
+        for libro_id in libro_ids:
+            # El coseno es simétrico: la puntuación de otro -> libro ya está calculada
+            puntuacion = puntuaciones[libro_id].get(otro_id)
+            if libro_id in lista:
+                if puntuacion is None:
+                    del lista[libro_id]
+                else:
+                    lista[libro_id] = puntuacion
+                cambiada = True
+            elif puntuacion is not None and (len(lista) < TOP_K or puntuacion > min(lista.values())):
+                lista[libro_id] = puntuacion
+                cambiada = True
+        if cambiada:
+            nuevas[otro_id] = _ordenar(lista)
+
+    with transaction.atomic():
+        for trozo in _trozos(nuevas):
+            LibroSimilar.objects.filter(libro_id__in=trozo).delete()
+        LibroSimilar.objects.bulk_create(
+            [fila for libro_id, vecinos in nuevas.items() for fila in _filas(libro_id, vecinos)],
+            batch_size=TAMANO_LOTE,
+        )
+    invalidar('similares')
+
+
+_pendientes = AlConfirmar(lambda libros: actualizar_libros(libros))
+
+
+def programar(libro_ids):
+    """Actualiza los vecinos de estos libros cuando se confirme la transacción en curso."""
+    _pendientes.agregar(libro_ids)
+
+
+def _otros_comentarios(instance):
+    return Comentario.objects.filter(libro_id=instance.libro_id, usuario_id=instance.usuario_id).exclude(
+        pk=instance.pk
+    ).exists()
+
+
+@receiver(post_save, sender=Comentario)
+def comentario_guardado(sender, instance, created, **kwargs):
+    # Solo el primer comentario de un usuario en un libro añade una característica
+    if created and not _otros_comentarios(instance):
+        programar([instance.libro_id])
+
+
+@receiver(post_delete, sender=Comentario)
+def comentario_eliminado(sender, instance, **kwargs):
+    if not _otros_comentarios(instance):
+        programar([instance.libro_id])
+
+
+@receiver(m2m_changed, sender=Libro.autores.through)
+def autores_de_libro_cambiados(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        programar([instance.pk])
+    elif pk_set:
+        # autor.libros.add/remove; tras autor.libros.clear() no se sabe qué
+        # libros eran y se corrigen en la siguiente reconstrucción
+        programar(pk_set)
+
+
+@receiver(pre_delete, sender=Autor)
+def autor_por_eliminar(sender, instance, **kwargs):
+    # La relación con sus libros se borra en cascada, sin señales m2m
+    instance._libros_similares = list(instance.libros.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Autor)
+def autor_eliminado(sender, instance, **kwargs):
+    programar(getattr(instance, '_libros_similares', ()))
+
+
+@receiver(pre_delete, sender=Libro)
+def libro_por_eliminar(sender, instance, **kwargs):
+    # Sus filas se borran en cascada: las listas que lo contenían se rehacen
+    instance._con_similar = list(
+        LibroSimilar.objects.filter(similar_id=instance.pk).values_list('libro_id', flat=True)
+    )
+
+
+@receiver(post_delete, sender=Libro)
+def libro_eliminado(sender, instance, **kwargs):
+    programar(getattr(instance, '_con_similar', ()))
@@ -0,0 +1,101 @@
+# Respuestas JSON transmitidas por bloques para los listados sin paginar.
+#
+# En lugar de construir la lista completa y luego la cadena JSON entera, las
+# filas se leen del cursor por bloques (iterator()/aiterator() con chunk_size)
+# y se codifican y envían según llegan: el primer byte sale en cuanto está la
+# primera fila y la memoria del worker no crece con el número de filas.
+#
+# Hay dos formatos: JSON (una lista, opcionalmente envuelta en un objeto) y
+# NDJSON (una fila JSON por línea), que se elige con ?formato=ndjson o con la
+# cabecera Accept: application/x-ndjson.
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+FILAS_POR_BLOQUE = 500
+TIPO_NDJSON = 'application/x-ndjson'
+
+
+def quiere_ndjson(request):
+    return request.GET.get('formato') == 'ndjson' or TIPO_NDJSON in request.headers.get('Accept', '')
+
+
+class _Codificador:
+    """Convierte filas en fragmentos de texto, agrupadas de a FILAS_POR_BLOQUE."""
+
+    def __init__(self, clave, ndjson):
+        self.json = DjangoJSONEncoder()
+        self.ndjson = ndjson
+        self.apertura = '' if ndjson else ('{"%s": [' % clave if clave else '[')
+        self.cierre = '' if ndjson else (']}' if clave else ']')
+        self.separador = ''
+        self.bloque = []
+
+    def agregar(self, fila):
+        """Añade una fila y devuelve el bloque pendiente cuando está lleno."""
+        if self.ndjson:
+            self.bloque.append(self.json.encode(fila) + '\n')
+        else:
+            self.bloque.append(self.separador + self.json.encode(fila))
+            self.separador = ','
+        if len(self.bloque) >= FILAS_POR_BLOQUE:
+            return self.vaciar()
+        return None
+
+    def vaciar(self):
+        texto = ''.join(self.bloque)
+        self.bloque = []
+        return texto
+
+
+def _codificar(filas, clave, ndjson):
+    codificador = _Codificador(clave, ndjson)
+    yield codificador.apertura
+    for fila in filas:
+        bloque = codificador.agregar(fila)
+        if bloque:
+            yield bloque
+    yield codificador.vaciar() + codificador.cierre
+
+
+async def _codificar_async(filas, clave, ndjson):
+    codificador = _Codificador(clave, ndjson)
+    yield codificador.apertura
+    async for fila in filas:
+        bloque = codificador.agregar(fila)
+        if bloque:
+            yield bloque
+    yield codificador.vaciar() + codificador.cierre
+
+
+def _respuesta(contenido, ndjson):
+    return StreamingHttpResponse(contenido, content_type=TIPO_NDJSON if ndjson else 'application/json')
+
+
+def json_sync(queryset, clave=None, ndjson=False):
+    """Transmite ``queryset`` (un ``values()``) leyendo el cursor con ``iterator()``.
+
+    Con ``clave`` la lista va envuelta en un objeto: ``{"clave": [...]}``.
+    La consulta se ejecuta al consumir la respuesta, no al crearla.
+    """
+    filas = queryset.iterator(chunk_size=FILAS_POR_BLOQUE)
+    return _respuesta(_codificar(filas, clave, ndjson), ndjson)
+
+
+def json_async(queryset, clave=None, ndjson=False):
+    """Como ``json_sync`` pero leyendo con ``aiterator()``, para servidores ASGI."""
+    filas = queryset.aiterator(chunk_size=FILAS_POR_BLOQUE)
+    return _respuesta(_codificar_async(filas, clave, ndjson), ndjson)
+
+
+def responder(request, queryset, clave=None):
+    """Elige el iterador según el servidor y el formato según la petición.
+
+    Bajo WSGI un iterador async tendría que consumirse entero antes de enviar
+    nada, así que allí se usa el iterador síncrono aunque la vista sea async.
+    En NDJSON se ignora ``clave``.
+    """
+    ndjson = quiere_ndjson(request)
+    if isinstance(request, ASGIRequest):
+        return json_async(queryset, clave, ndjson)
+    return json_sync(queryset, clave, ndjson)
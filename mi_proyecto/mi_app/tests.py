@@ -1,3 +1,1533 @@
-from django.test import TestCase
+import csv
+import gzip
+import importlib
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connections, transaction
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import ResolverMatch
+from django.utils import timezone
+
+from mi_proyecto.routers import COOKIE_PRIMARIA, EnrutadoMiddleware, LecturaEscrituraRouter
+
+from . import (
+    autocompletado, benchmark, busqueda, cambios, canalizacion, compresion, datatables, exportacion, facetas,
+    paginacion, rankings, similares,
+)
+from .admin import ComentarioAdmin
+from .autenticacion import UsuarioEnCacheBackend, _clave_usuario, leer_token
+from .cache_versionada import json_versionado, versiones
+from .compresion import DISPONIBLES, IDENTIDAD, negociar
+from .importacion import normalizar_estadisticas, normalizar_fila, preparar_fila
+from .lotes import LoteLibros
+from .metricas import REGISTRO, PresupuestoConsultasExcedido
+from .models import (
+    Autor, CambioCatalogo, Comentario, FacetaLibro, Libro, LibroEstadisticas, LibroSimilar, RankingLibro,
+)
+from .reintentos import escritura_atomica
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class BusquedaTests(TestCase):
+    # Índice FTS5: acentos y mayúsculas plegados, prefijos, relevancia por
+    # origen y LIKE cuando la base no tiene el índice
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.force_login(self.admin)
+        marquez = Autor.objects.create(nombre='Gabriel García Márquez')
+        self.cien = Libro.objects.create(titulo='Cien años de soledad', anio_publicacion=1967, idioma='spa')
+        self.cien.autores.add(marquez)
+        self.rayuela = Libro.objects.create(titulo='Rayuela', anio_publicacion=1963, idioma='spa')
+        self.otro = Libro.objects.create(titulo='Bestiario', anio_publicacion=1951, idioma='spa')
+        self.comentario = Comentario.objects.create(libro=self.otro, usuario=self.admin, texto='Mejor que Rayuela')
+        self.assertTrue(busqueda.indice_disponible('default'))
+
+    def test_acentos_mayusculas_y_prefijos(self):
+        self.assertEqual(busqueda.buscar_libros('CIEN ANOS'), [self.cien.pk])
+        self.assertEqual(busqueda.buscar_libros('garcia marq'), [self.cien.pk])
+        self.assertEqual(busqueda.buscar_libros('sol'), [self.cien.pk])
+        self.assertEqual([nombre for _, nombre in busqueda.buscar_autores('gab')], ['Gabriel García Márquez'])
+        # La sintaxis de FTS5 del usuario no rompe la consulta
+        self.assertEqual(busqueda.buscar_libros('"cien* (soledad'), [self.cien.pk])
+        self.assertEqual(busqueda.buscar_libros('¿?'), [])
+
+    def test_titulo_antes_que_comentario(self):
+        self.assertEqual(busqueda.buscar_libros('rayuela'), [self.rayuela.pk, self.otro.pk])
+        self.assertEqual(busqueda.buscar_libros('rayuela', incluir_comentarios=False), [self.rayuela.pk])
+
+    def test_vista_buscar(self):
+        datos = self.client.get('/libros/buscar/', {'q': 'rayuela', 'limite': 1}).json()
+        self.assertEqual([libro['titulo'] for libro in datos['results']], ['Rayuela'])
+        datos = self.client.get('/libros/buscar/', {'q': 'garcia', 'limite': 'x'}).json()
+        self.assertEqual(datos['results'][0]['autores_nombres'], 'Gabriel García Márquez')
+
+    def test_sin_indice_usa_like(self):
+        with mock.patch.dict(busqueda._disponible, {'default': False}):
+            # Sin plegado de acentos ni ranking, pero con los mismos orígenes
+            self.assertEqual(busqueda.buscar_libros('garcia'), [])
+            self.assertEqual(busqueda.buscar_libros('García'), [self.cien.pk])
+            self.assertEqual(set(busqueda.buscar_libros('rayuela')), {self.rayuela.pk, self.otro.pk})
+            self.assertEqual(busqueda.buscar_autores('márquez'), [(self.cien.autores.get().pk, 'Gabriel García Márquez')])
+            self.assertEqual(list(Libro.objects.filter(busqueda.filtro_libros('Márquez'))), [self.cien])
+
+    def test_busqueda_del_admin(self):
+        respuesta = self.client.get('/admin/mi_app/autor/', {'q': 'garcia'})
+        self.assertEqual([autor.nombre for autor in respuesta.context['cl'].result_list], ['Gabriel García Márquez'])
+        # Comentarios por su texto o por el título de su libro
+        for termino in ('mejor', 'bestiario'):
+            respuesta = self.client.get('/admin/mi_app/comentario/', {'q': termino})
+            self.assertEqual(list(respuesta.context['cl'].result_list), [self.comentario], termino)
+        respuesta = self.client.get('/admin/mi_app/comentario/', {'q': 'soledad'})
+        self.assertEqual(list(respuesta.context['cl'].result_list), [])
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class BenchmarkTests(TestCase):
+    # Prueba de humo: el banco de pruebas corre de punta a punta con un catálogo mínimo
+
+    def test_genera_catalogo_y_guarda_linea_base(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'base.json')
+            call_command(
+                'benchmark', libros=30, peticiones=3, usar_bd_actual=True,
+                salida=ruta, stdout=io.StringIO(),
+            )
+            with open(ruta, encoding='utf-8') as archivo:
+                resultado = json.load(archivo)
+            # Comparar contra la misma ejecución no puede detectar regresiones en consultas
+            salida = io.StringIO()
+            call_command(
+                'benchmark', libros=30, peticiones=3, usar_bd_actual=True,
+                comparar=ruta, umbral=10000, stdout=salida,
+            )
+
+        self.assertEqual(resultado['catalogo']['libros'], 30)
+        for datos in resultado['escenarios'].values():
+            self.assertEqual(datos['errores'], 0)
+            self.assertLessEqual(datos['p50_ms'], datos['p99_ms'])
+        self.assertIn('Sin regresiones', salida.getvalue())
+
+    def test_memoria_pico_sin_resource(self):
+        # Windows no tiene el módulo resource
+        with mock.patch.dict('sys.modules', {'resource': None}):
+            self.assertIsNone(benchmark.rss_pico_mb())
+        self.assertGreater(benchmark.rss_pico_mb(), 0)
+
+
+class CargaEventosTests(TestCase):
+    # Prueba de humo del canal SSE: todas las conexiones reciben el cambio con
+    # una sola lectura del registro por intervalo y se liberan al cerrarse
+
+    @override_settings(MI_APP_EVENTOS_INTERVALO=0.05)
+    def test_suscriptores_reciben_el_cambio(self):
+        with tempfile.TemporaryDirectory() as carpeta:
+            ruta = os.path.join(carpeta, 'eventos.json')
+            call_command(
+                'benchmark_eventos', suscriptores=20, segundos=0, espera=10,
+                usar_bd_actual=True, salida=ruta, stdout=io.StringIO(),
+            )
+            with open(ruta, encoding='utf-8') as archivo:
+                resultado = json.load(archivo)
+
+        self.assertEqual(resultado['errores'], 0)
+        self.assertEqual(resultado['eventos_recibidos'], 20)
+        self.assertLess(resultado['lecturas_registro'], 20)
+        self.assertEqual(resultado['suscriptores_restantes'], 0)
+
+
+class CacheVersionadaTests(TestCase):
+    # La versión de un modelo solo cambia cuando se confirma la escritura
+
+    def test_version_nueva_al_confirmar(self):
+        antes = versiones(['libro'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Libro.objects.create(titulo='Rayuela', anio_publicacion=1963)
+            # Una lectura concurrente aún ve la versión anterior
+            self.assertEqual(versiones(['libro']), antes)
+        self.assertNotEqual(versiones(['libro']), antes)
+
+    def test_comandos_exigen_cache_compartida(self):
+        with self.assertRaisesMessage(CommandError, "caché local a cada proceso"):
+            call_command('recalcular_rankings', stdout=io.StringIO())
+        call_command('recalcular_rankings', '--cache-local', stdout=io.StringIO())
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class DataTablesTests(TestCase):
+    # Modo servidor de /libros/: solo la página pedida, con el orden, los
+    # filtros y los dos totales que espera DataTables
+    COLUMNAS = ('id', 'titulo', 'autores_nombres', 'anio_publicacion', 'idioma')
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('lectora', password='clave'))
+        cortazar, borges = Autor.objects.create(nombre='Julio Cortázar'), Autor.objects.create(nombre='Borges')
+        for titulo, anio, idioma, autor in (
+            ('Rayuela', 1963, 'spa', cortazar), ('Bestiario', 1951, 'spa', cortazar),
+            ('Ficciones', 1944, 'spa', borges), ('Labyrinths', 1962, 'eng', borges), ('Hopscotch', 1966, 'eng', cortazar),
+        ):
+            Libro.objects.create(titulo=titulo, anio_publicacion=anio, idioma=idioma).autores.add(autor)
+
+    def _pedir(self, **parametros):
+        consulta = {'draw': 1, 'start': 0, 'length': 10}
+        for indice, nombre in enumerate(self.COLUMNAS):
+            consulta[f'columns[{indice}][data]'] = nombre
+        consulta.update(parametros)
+        respuesta = self.client.get('/libros/', consulta)
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.json()
+
+    def _titulos(self, datos):
+        return [libro['titulo'] for libro in datos['data']]
+
+    def test_draw_y_totales(self):
+        datos = self._pedir(draw=7)
+        self.assertEqual((datos['draw'], datos['recordsTotal'], datos['recordsFiltered']), (7, 5, 5))
+        self.assertEqual(set(datos['data'][0]), set(self.COLUMNAS))
+        # La respuesta en caché devuelve el draw de cada petición
+        self.assertEqual(self._pedir(draw=8)['draw'], 8)
+        self.assertEqual(self._pedir(draw='x')['draw'], 0)
+        datos = self._pedir(**{'search[value]': 'borges'})
+        self.assertEqual((datos['recordsTotal'], datos['recordsFiltered']), (5, 2))
+
+    def test_start_y_length_acotados(self):
+        ordenados = list(Libro.objects.order_by('id').values_list('titulo', flat=True))
+        self.assertEqual(self._titulos(self._pedir(start=3, length=1)), ordenados[3:4])
+        self.assertEqual(self._titulos(self._pedir(start=-5, length=2)), ordenados[:2])
+        self.assertEqual(self._titulos(self._pedir(start='x', length='y')), ordenados)
+        with mock.patch.object(datatables, 'MAX_FILAS_POR_PAGINA', 2):
+            self.assertEqual(self._titulos(self._pedir(length=-1)), ordenados[:2])
+            self.assertEqual(self._titulos(self._pedir(length=1000)), ordenados[:2])
+            self.assertEqual(self._pedir(length=1000)['recordsFiltered'], 5)
+
+    def test_orden_por_cada_columna(self):
+        for indice, nombre in enumerate(self.COLUMNAS):
+            for direccion, prefijo in (('asc', ''), ('desc', '-')):
+                esperados = list(Libro.objects.order_by(prefijo + nombre, 'id').values_list('titulo', flat=True))
+                datos = self._pedir(**{'order[0][column]': indice, 'order[0][dir]': direccion})
+                self.assertEqual(self._titulos(datos), esperados, (nombre, direccion))
+        # Varios criterios en el orden en que llegan
+        datos = self._pedir(**{
+            'order[0][column]': 4, 'order[0][dir]': 'asc', 'order[1][column]': 3, 'order[1][dir]': 'desc',
+        })
+        self.assertEqual(self._titulos(datos), ['Hopscotch', 'Labyrinths', 'Rayuela', 'Bestiario', 'Ficciones'])
+
+    def test_busqueda_global_y_por_columna(self):
+        self.assertEqual(
+            sorted(self._titulos(self._pedir(**{'search[value]': 'cortázar'}))), ['Bestiario', 'Hopscotch', 'Rayuela']
+        )
+        self.assertEqual(self._titulos(self._pedir(**{'search[value]': '1944'})), ['Ficciones'])
+        datos = self._pedir(**{'columns[4][search][value]': 'eng', 'columns[2][search][value]': 'cortázar'})
+        self.assertEqual((self._titulos(datos), datos['recordsFiltered']), (['Hopscotch'], 1))
+        # Un valor no numérico en una columna numérica no encuentra nada
+        datos = self._pedir(**{'columns[3][search][value]': 'mil'})
+        self.assertEqual((datos['data'], datos['recordsFiltered'], datos['recordsTotal']), ([], 0, 5))
+
+
+class DesnormalizacionTests(TestCase):
+    # autores_nombres y num_comentarios siguen a las ediciones y la migración los rellena
+
+    def setUp(self):
+        self.staff = User.objects.create_user('admin', password='clave', is_staff=True)
+        self.cortazar = Autor.objects.create(nombre='Julio Cortázar')
+        self.libro = Libro.objects.create(titulo='Rayuela', anio_publicacion=1963, idioma='spa')
+        self.libro.autores.add(self.cortazar)
+
+    def test_editar_libro_conserva_los_autores_nuevos(self):
+        borges = Autor.objects.create(nombre='Jorge Luis Borges')
+        bioy = Autor.objects.create(nombre='Adolfo Bioy Casares')
+        self.client.force_login(self.staff)
+        respuesta = self.client.post(
+            f'/libros/editar/{self.libro.pk}/',
+            json.dumps({'titulo': 'Seis problemas', 'anio_publicacion': 1942, 'idioma': 'spa', 'autores': [borges.pk, bioy.pk]}),
+            content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.libro.refresh_from_db()
+        self.assertEqual(self.libro.titulo, 'Seis problemas')
+        self.assertEqual(self.libro.autores_nombres, 'Jorge Luis Borges, Adolfo Bioy Casares')
+
+    def test_migracion_rellena_con_modelos_historicos(self):
+        Comentario.objects.create(libro=self.libro, usuario=self.staff, texto='Imprescindible')
+        Libro.objects.update(autores_nombres='', num_comentarios=0)
+        migracion = importlib.import_module('mi_app.migrations.0012_libro_desnormalizado')
+        migracion.poblar(apps, None)
+        self.libro.refresh_from_db()
+        self.assertEqual((self.libro.autores_nombres, self.libro.num_comentarios), ('Julio Cortázar', 1))
+
+
+@override_settings(REPLICAS_LECTURA=['replica'])
+class EnrutadoTests(SimpleTestCase):
+    # Decisiones del router sin ejecutar consultas: no necesita una réplica real
+
+    def _atender(self, nombre_vista, cookies=None, escribir=False):
+        router = LecturaEscrituraRouter()
+        lecturas = []
+        peticion = RequestFactory().get('/')
+        peticion.COOKIES.update(cookies or {})
+        peticion.resolver_match = ResolverMatch(lambda request: None, (), {}, url_name=nombre_vista)
+
+        def vista(request):
+            middleware.process_view(request, None, (), {})
+            lecturas.append(router.db_for_read(Libro))
+            if escribir:
+                router.db_for_write(Libro)
+                lecturas.append(router.db_for_read(Libro))
+            # Sesiones y usuarios nunca se leen de la réplica
+            self.assertEqual(router.db_for_read(User), 'default')
+            return HttpResponse()
+
+        middleware = EnrutadoMiddleware(vista)
+        return lecturas, middleware(peticion)
+
+    def test_vistas_de_lectura_usan_la_replica(self):
+        for vista in ('obtener_libros', 'buscar_autores'):
+            lecturas, respuesta = self._atender(vista)
+            self.assertEqual(lecturas, ['replica'])
+            self.assertNotIn(COOKIE_PRIMARIA, respuesta.cookies)
+
+    def test_escrituras_y_otras_vistas_usan_la_primaria(self):
+        lecturas, _ = self._atender('agregar_libro')
+        self.assertEqual(lecturas, ['default'])
+        self.assertEqual(LecturaEscrituraRouter().db_for_write(Libro), 'default')
+        # Fuera de una petición (shell, comandos) también se lee de la primaria
+        self.assertEqual(LecturaEscrituraRouter().db_for_read(Libro), 'default')
+
+    def test_escribir_fija_la_primaria_en_la_peticion_y_con_cookie(self):
+        lecturas, respuesta = self._atender('obtener_libros', escribir=True)
+        self.assertEqual(lecturas, ['replica', 'default'])
+        self.assertIn(COOKIE_PRIMARIA, respuesta.cookies)
+
+        lecturas, _ = self._atender('obtener_libros', cookies={COOKIE_PRIMARIA: '1'})
+        self.assertEqual(lecturas, ['default'])
+
+    def test_sin_replicas_todo_va_a_la_primaria(self):
+        with override_settings(REPLICAS_LECTURA=[]):
+            lecturas, _ = self._atender('obtener_libros')
+        self.assertEqual(lecturas, ['default'])
+
+    def test_no_se_migran_las_replicas(self):
+        router = LecturaEscrituraRouter()
+        self.assertTrue(router.allow_migrate('default', 'mi_app'))
+        self.assertFalse(router.allow_migrate('replica', 'mi_app'))
+
+
+@skipUnless('replica' in settings.DATABASES, "requiere el perfil settings_replicas_local")
+class ReplicaLocalTests(TransactionTestCase):
+    # Dos bases locales (primaria y réplica en espejo): las consultas llegan a la
+    # réplica. TransactionTestCase porque la réplica es otra conexión y no ve
+    # lo que la primaria no haya confirmado
+    databases = '__all__'
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('lector', password='clave')
+        self.client.force_login(self.usuario)
+        Libro.objects.create(titulo='Rayuela', anio_publicacion=1963, idioma='spa')
+
+    def test_listado_lee_de_la_replica(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            respuesta = self.client.get('/libros/', {'draw': 1, 'start': 0, 'length': 10})
+        self.assertEqual(respuesta.json()['recordsTotal'], 1)
+        self.assertTrue(any('mi_app_libro' in consulta['sql'] for consulta in replica.captured_queries))
+
+    def test_escritura_va_a_la_primaria(self):
+        with CaptureQueriesContext(connections['replica']) as replica:
+            respuesta = self.client.post(
+                '/autores/agregar/', json.dumps({'nombre': 'Cortázar'}),
+                content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(replica.captured_queries, [])
+        self.assertIn(COOKIE_PRIMARIA, respuesta.cookies)
+
+
+@override_settings(MI_APP_REINTENTOS_ESCRITURA=3)
+@mock.patch('mi_app.reintentos.time.sleep')
+class ReintentosTests(TransactionTestCase):
+    # escritura_atomica repite la vista solo si la base está bloqueada, hasta
+    # MI_APP_REINTENTOS_ESCRITURA intentos, y nunca tras el COMMIT
+
+    def _vista(self, *errores, despues_del_commit=None):
+        llamadas = []
+
+        def vista(request):
+            llamadas.append(request)
+            Autor.objects.create(nombre=f'Intento {len(llamadas)}')
+            if despues_del_commit:
+                transaction.on_commit(despues_del_commit)
+            if len(llamadas) <= len(errores):
+                raise errores[len(llamadas) - 1]
+            return 'hecho'
+
+        return escritura_atomica(vista), llamadas
+
+    def test_reintenta_si_la_base_esta_bloqueada(self, dormir):
+        bloqueo = OperationalError('database is locked')
+        vista, llamadas = self._vista(bloqueo, bloqueo)
+        self.assertEqual(vista('peticion'), 'hecho')
+        self.assertEqual(len(llamadas), 3)
+        self.assertEqual(dormir.call_count, 2)
+        # Los intentos fallidos se revirtieron
+        self.assertEqual(list(Autor.objects.values_list('nombre', flat=True)), ['Intento 3'])
+
+    def test_se_rinde_tras_el_ultimo_intento(self, dormir):
+        vista, llamadas = self._vista(*[OperationalError('database table is locked')] * 3)
+        with self.assertRaisesMessage(OperationalError, 'locked'):
+            vista('peticion')
+        self.assertEqual(len(llamadas), 3)
+        self.assertFalse(Autor.objects.exists())
+
+    def test_otros_errores_no_se_reintentan(self, dormir):
+        for error in (OperationalError('no such table: mi_app_autor'), IntegrityError('UNIQUE constraint failed')):
+            with self.subTest(error=error):
+                vista, llamadas = self._vista(error)
+                with self.assertRaises(type(error)):
+                    vista('peticion')
+                self.assertEqual(len(llamadas), 1)
+        dormir.assert_not_called()
+
+    def test_fallo_tras_el_commit_no_repite_la_escritura(self, dormir):
+        def falla():
+            raise OperationalError('database is locked')
+
+        vista, llamadas = self._vista(despues_del_commit=falla)
+        with self.assertRaises(OperationalError):
+            vista('peticion')
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(Autor.objects.count(), 1)
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class LotesTests(TestCase):
+    # /libros/lote/ y /autores/lote/: todo o nada, un resultado por operación
+    # y un número de consultas que no crece con el tamaño del lote
+
+    def setUp(self):
+        self.staff = User.objects.create_user('admin', password='clave', is_staff=True)
+        self.usuario = User.objects.create_user('lectora', password='clave')
+        self.autor = Autor.objects.create(nombre='Cortázar')
+        self.client.force_login(self.staff)
+
+    def _lote(self, url, operaciones, usuario=None):
+        if usuario is not None:
+            self.client.force_login(usuario)
+        return self.client.post(
+            url, json.dumps({'operaciones': operaciones}),
+            content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+        )
+
+    def _catalogo(self, cuantos):
+        """Libros con autor, comentario, estadísticas, rankings y vecinos similares."""
+        autores = Autor.objects.bulk_create([Autor(nombre=f'Autor {cuantos}-{i}') for i in range(cuantos)])
+        libros = Libro.objects.bulk_create([
+            Libro(titulo=f'Libro {i}', anio_publicacion=1900 + i, idioma='spa' if i % 2 else 'eng')
+            for i in range(cuantos)
+        ])
+        Libro.autores.through.objects.bulk_create([
+            Libro.autores.through(libro_id=libro.pk, autor_id=autor.pk) for libro, autor in zip(libros, autores)
+        ])
+        Comentario.objects.bulk_create([Comentario(libro=libro, usuario=self.usuario, texto='...') for libro in libros])
+        LibroEstadisticas.objects.bulk_create([
+            LibroEstadisticas(libro=libro, calificacion_promedio=4.0, num_calificaciones=i, puntuacion=i)
+            for i, libro in enumerate(libros)
+        ])
+        # Cada libro figura como vecino del libro del autor de la casa
+        conservado = Libro.objects.create(titulo='Rayuela', anio_publicacion=1963, idioma='spa')
+        LibroSimilar.objects.bulk_create([
+            LibroSimilar(libro=conservado, posicion=posicion, similar=libro, puntuacion=1)
+            for posicion, libro in enumerate(libros, 1)
+        ])
+        facetas.recalcular_todo()
+        rankings.recalcular_todo()
+        return autores, libros
+
+    def test_lote_invalido_no_aplica_nada(self):
+        respuesta = self._lote('/libros/lote/', [
+            {'op': 'crear', 'datos': {'titulo': 'Bestiario', 'anio_publicacion': 1951, 'idioma': 'spa', 'autores': [self.autor.pk]}},
+            {'op': 'crear', 'datos': {'titulo': 'Sin autores', 'anio_publicacion': 1951, 'idioma': 'spa', 'autores': [999]}},
+            {'op': 'eliminar', 'id': 999},
+        ])
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual([r['ok'] for r in respuesta.json()['resultados']], [True, False, False])
+        self.assertIn('999', respuesta.json()['resultados'][1]['error'])
+        self.assertFalse(Libro.objects.exists())
+        self.assertEqual(self._lote('/libros/lote/', []).status_code, 400)
+
+    def test_resultados_por_operacion(self):
+        rayuela = Libro.objects.create(titulo='Rayuela', anio_publicacion=1963, idioma='spa')
+        bestiario = Libro.objects.create(titulo='Bestiario', anio_publicacion=1951, idioma='spa')
+        # Dentro del presupuesto de consultas de la vista
+        with self.assertNoLogs('mi_app.metricas', 'WARNING'):
+            respuesta = self._lote('/libros/lote/', [
+                {'op': 'eliminar', 'id': bestiario.pk},
+                {'op': 'actualizar', 'id': rayuela.pk, 'datos': {'titulo': 'Rayuela', 'anio_publicacion': 1963, 'idioma': 'fra', 'autores': [self.autor.pk]}},
+                {'op': 'crear', 'datos': {'titulo': 'Final del juego', 'anio_publicacion': 1956, 'idioma': 'spa', 'autores': [self.autor.pk]}},
+            ])
+        self.assertEqual(respuesta.status_code, 200)
+        resultados = respuesta.json()['resultados']
+        self.assertEqual([r['estado'] for r in resultados], ['eliminado', 'actualizado', 'creado'])
+        self.assertEqual(resultados[0]['id'], bestiario.pk)
+        self.assertEqual(
+            sorted(Libro.objects.values_list('titulo', 'idioma', 'autores_nombres')),
+            [('Final del juego', 'spa', 'Cortázar'), ('Rayuela', 'fra', 'Cortázar')],
+        )
+
+        respuesta = self._lote('/autores/lote/', [
+            {'op': 'actualizar', 'id': self.autor.pk, 'datos': {'nombre': 'Julio Cortázar'}},
+            {'op': 'crear', 'datos': {'nombre': 'Borges'}},
+        ])
+        self.assertEqual([r['estado'] for r in respuesta.json()['resultados']], ['actualizado', 'creado'])
+        self.assertEqual(Libro.objects.get(titulo='Rayuela').autores_nombres, 'Julio Cortázar')
+
+    def test_solo_el_personal_actualiza_o_elimina(self):
+        libro = Libro.objects.create(titulo='Rayuela', anio_publicacion=1963, idioma='spa')
+        for url, pk in (('/libros/lote/', libro.pk), ('/autores/lote/', self.autor.pk)):
+            respuesta = self._lote(url, [{'op': 'eliminar', 'id': pk}], usuario=self.usuario)
+            self.assertEqual(respuesta.status_code, 403)
+        self.assertTrue(Libro.objects.filter(pk=libro.pk).exists())
+        self.assertTrue(Autor.objects.filter(pk=self.autor.pk).exists())
+        respuesta = self._lote('/autores/lote/', [{'op': 'crear', 'datos': {'nombre': 'Borges'}}], usuario=self.usuario)
+        self.assertEqual(respuesta.status_code, 200)
+
+    def test_permiso_antes_de_validar(self):
+        with CaptureQueriesContext(connections['default']) as consultas:
+            respuesta = self._lote('/libros/lote/', [{'op': 'eliminar', 'id': 999}], usuario=self.usuario)
+        self.assertEqual(respuesta.status_code, 403)
+        self.assertFalse([c for c in consultas.captured_queries if 'mi_app_' in c['sql']])
+
+    def test_intercambiar_nombres_de_autores(self):
+        borges = Autor.objects.create(nombre='Borges')
+        respuesta = self._lote('/autores/lote/', [
+            {'op': 'actualizar', 'id': self.autor.pk, 'datos': {'nombre': 'Borges'}},
+            {'op': 'actualizar', 'id': borges.pk, 'datos': {'nombre': 'Cortázar'}},
+        ])
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(
+            dict(Autor.objects.values_list('pk', 'nombre')), {self.autor.pk: 'Borges', borges.pk: 'Cortázar'}
+        )
+
+    def test_eliminar_renueva_caches_e_indice(self):
+        # Lo que hacían las señales de borrado (ver lotes.py) y lo que mantienen los triggers
+        autores, libros = self._catalogo(3)
+        antes = versiones(['libro', 'comentario', 'autor', 'ranking'])
+        with self.captureOnCommitCallbacks(execute=True):
+            self._lote('/libros/lote/', [{'op': 'eliminar', 'id': libros[0].pk}])
+            self._lote('/autores/lote/', [{'op': 'eliminar', 'id': autores[1].pk}])
+        despues = versiones(['libro', 'comentario', 'autor', 'ranking'])
+        self.assertTrue(all(despues[modelo] != antes[modelo] for modelo in antes))
+        self.assertEqual(set(busqueda.buscar_libros('Libro', incluir_comentarios=False)), {libros[1].pk, libros[2].pk})
+        self.assertEqual(busqueda.buscar_autores(autores[1].nombre), [])
+        self.assertEqual(Libro.objects.get(pk=libros[1].pk).autores_nombres, '')
+
+    def _consultas_al_eliminar(self, url, ids):
+        with self.captureOnCommitCallbacks(execute=True):
+            with CaptureQueriesContext(connections['default']) as consultas:
+                respuesta = self._lote(url, [{'op': 'eliminar', 'id': pk} for pk in ids])
+        self.assertEqual(respuesta.status_code, 200)
+        # Sin las de sesión y usuario, que no dependen del lote
+        return len([c for c in consultas.captured_queries if 'mi_app_' in c['sql']])
+
+    def test_eliminar_libros_con_consultas_constantes(self):
+        consultas = []
+        for cuantos in (10, 40):
+            _, libros = self._catalogo(cuantos)
+            CambioCatalogo.objects.all().delete()
+            consultas.append(self._consultas_al_eliminar('/libros/lote/', [libro.pk for libro in libros]))
+            ids = [libro.pk for libro in libros]
+            self.assertFalse(Comentario.objects.filter(libro_id__in=ids).exists())
+            self.assertFalse(LibroSimilar.objects.filter(similar_id__in=ids).exists())
+            self.assertFalse(LibroEstadisticas.objects.filter(libro_id__in=ids).exists())
+            eliminados = CambioCatalogo.objects.filter(accion='eliminado')
+            self.assertEqual(eliminados.filter(modelo='libro').count(), cuantos)
+            self.assertEqual(eliminados.filter(modelo='comentario').count(), cuantos)
+            contadores = {(i, a): c for i, a, c in FacetaLibro.objects.values_list('idioma', 'anio', 'cuantos') if c}
+            self.assertEqual(contadores, {('spa', 1963): 1})
+            # Los grupos se rehicieron al confirmar
+            self.assertFalse(RankingLibro.objects.exists())
+            Libro.objects.all().delete()
+        self.assertEqual(consultas[0], consultas[1])
+
+    def test_eliminar_autores_con_consultas_constantes(self):
+        consultas = []
+        for cuantos in (10, 40):
+            autores, libros = self._catalogo(cuantos)
+            consultas.append(self._consultas_al_eliminar('/autores/lote/', [autor.pk for autor in autores]))
+            self.assertFalse(Autor.objects.filter(pk__in=[autor.pk for autor in autores]).exists())
+            nombres = Libro.objects.filter(pk__in=[libro.pk for libro in libros]).values_list('autores_nombres', flat=True)
+            self.assertEqual(set(nombres), {''})
+            self.assertFalse(RankingLibro.objects.filter(tipo='autor').exists())
+            Libro.objects.all().delete()
+        self.assertEqual(consultas[0], consultas[1])
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class RankingsTests(TestCase):
+    # La actualización incremental deja los mismos grupos que la reconstrucción
+    # completa, y borrar libros rehace sus grupos al confirmar, no por fila
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('lectora', password='clave')
+        cortazar, borges = Autor.objects.create(nombre='Cortázar'), Autor.objects.create(nombre='Borges')
+        self.libros = []
+        with self.captureOnCommitCallbacks(execute=True):
+            for titulo, anio, idioma, autor, promedio, votos in (
+                ('Rayuela', 1963, 'spa', cortazar, 4.2, 3000), ('Bestiario', 1951, 'spa', cortazar, 4.9, 2),
+                ('Ficciones', 1944, 'spa', borges, 4.5, 5000), ('Labyrinths', 1962, 'eng', borges, 4.4, 800),
+            ):
+                libro = Libro.objects.create(titulo=titulo, anio_publicacion=anio, idioma=idioma)
+                libro.autores.add(autor)
+                LibroEstadisticas.objects.create(libro=libro, calificacion_promedio=promedio, num_calificaciones=votos)
+                self.libros.append(libro)
+
+    def _rankings(self):
+        return sorted(RankingLibro.objects.values_list('tipo', 'clave', 'posicion', 'libro_id', 'puntuacion'))
+
+    def _completos(self):
+        rankings.recalcular_todo()
+        return self._rankings()
+
+    def test_puntuacion_bayesiana(self):
+        # Pocos votos acercan la puntuación a la media previa
+        self.assertAlmostEqual(LibroEstadisticas.calcular_puntuacion(5.0, 1), (5.0 + 4000) / 1001)
+        self.assertAlmostEqual(LibroEstadisticas.calcular_puntuacion(3.0, 0), LibroEstadisticas.MEDIA_PREVIA)
+        bestiario = LibroEstadisticas.objects.get(libro=self.libros[1])
+        self.assertAlmostEqual(bestiario.puntuacion, LibroEstadisticas.calcular_puntuacion(4.9, 2))
+        # Un 4.9 de dos votos no supera a Rayuela (4.2 de 3000)
+        self.assertLess(bestiario.puntuacion, LibroEstadisticas.objects.get(libro=self.libros[0]).puntuacion)
+
+    def test_incremental_coincide_con_la_reconstruccion(self):
+        rayuela, bestiario, ficciones, labyrinths = self.libros
+        self.assertEqual(self._rankings(), self._completos())
+        with self.captureOnCommitCallbacks(execute=True):
+            estadisticas = LibroEstadisticas.objects.get(libro=bestiario)
+            estadisticas.num_calificaciones = 9000
+            estadisticas.save()
+            labyrinths.anio_publicacion = 1970
+            labyrinths.save()
+        global_ = [libro_id for tipo, _, _, libro_id, _ in self._rankings() if tipo == 'global']
+        self.assertEqual(global_[0], bestiario.pk)
+        self.assertEqual(self._rankings(), self._completos())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            with CaptureQueriesContext(connections['default']) as consultas:
+                Libro.objects.filter(pk__in=[rayuela.pk, ficciones.pk]).delete()
+        # Los grupos se rehacen al confirmar, una vez para todos los libros borrados
+        self.assertFalse([c for c in consultas.captured_queries if c['sql'].startswith('INSERT INTO "mi_app_rankinglibro"')])
+        for callback in callbacks:
+            callback()
+        global_ = [libro_id for tipo, _, _, libro_id, _ in self._rankings() if tipo == 'global']
+        self.assertEqual(global_, [bestiario.pk, labyrinths.pk])
+        self.assertEqual(self._rankings(), self._completos())
+
+    def test_vista_ranking(self):
+        rayuela, _, ficciones, labyrinths = self.libros
+        self.client.force_login(self.usuario)
+        datos = self.client.get('/libros/ranking/', {'limite': 2}).json()
+        self.assertEqual([libro['id'] for libro in datos['results']], [ficciones.pk, labyrinths.pk])
+        self.assertEqual(datos['results'][0]['num_calificaciones'], 5000)
+        self.assertEqual(self.client.get('/libros/ranking/', {'por': 'idioma'}).json()['claves'], ['eng', 'spa'])
+        datos = self.client.get('/libros/ranking/', {'por': 'decada', 'clave': '1960'}).json()
+        self.assertEqual([libro['id'] for libro in datos['results']], [labyrinths.pk, rayuela.pk])
+        self.assertEqual(self.client.get('/libros/ranking/', {'por': 'editorial'}).status_code, 400)
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class AutenticacionTests(TestCase):
+    # Sesión y usuario desde la caché sin guardar la contraseña, y tokens de
+    # lectura que no tocan ni la sesión ni la tabla de usuarios
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('lectora', password='clave')
+
+    def _consultas_de_autenticacion(self, consultas):
+        return [c['sql'] for c in consultas.captured_queries if 'auth_user' in c['sql'] or 'django_session' in c['sql']]
+
+    def test_usuario_en_cache_sin_contrasena(self):
+        self.client.login(username='lectora', password='clave')
+        self.assertEqual(self.client.get('/libros/ranking/').status_code, 200)
+        datos = cache.get(_clave_usuario(self.usuario.pk))
+        self.assertNotIn('password', datos)
+        self.assertNotIn(self.usuario.password, datos.values())
+        with CaptureQueriesContext(connections['default']) as consultas:
+            self.assertEqual(self.client.get('/libros/ranking/').status_code, 200)
+        self.assertEqual(self._consultas_de_autenticacion(consultas), [])
+
+        # Desactivarlo invalida la copia
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.is_active = False
+            self.usuario.save()
+        self.assertEqual(self.client.get('/libros/ranking/').status_code, 302)
+
+    def test_usuario_en_cache_guarda_solo_lo_cargado(self):
+        datos = {'id': self.usuario.pk, 'username': 'lectora', 'is_active': True, 'is_staff': False,
+                 'is_superuser': False, 'hash_sesion': self.usuario.get_session_auth_hash()}
+        cache.set(_clave_usuario(self.usuario.pk), datos)
+        usuario = UsuarioEnCacheBackend().get_user(self.usuario.pk)
+        self.assertEqual(usuario.get_session_auth_hash(), self.usuario.get_session_auth_hash())
+        usuario.first_name = 'Lectora'
+        usuario.save()
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.usuario.first_name, 'Lectora')
+        self.assertTrue(self.usuario.check_password('clave'))
+
+    def test_token_de_lectura(self):
+        self.client.login(username='lectora', password='clave')
+        token = self.client.post('/api/token/', HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()['token']
+        self.assertEqual(leer_token(token).pk, self.usuario.pk)
+        self.client.logout()
+
+        with CaptureQueriesContext(connections['default']) as consultas:
+            respuesta = self.client.get('/libros/ranking/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self._consultas_de_autenticacion(consultas), [])
+
+        alterado = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+        self.assertIsNone(leer_token(alterado))
+        self.assertEqual(self.client.get('/libros/ranking/', HTTP_AUTHORIZATION=f'Bearer {alterado}').status_code, 401)
+        # Las escrituras siguen exigiendo sesión y CSRF
+        respuesta = self.client.post('/api/token/', HTTP_AUTHORIZATION=f'Bearer {token}', HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertEqual(respuesta.status_code, 403)
+
+        caducado = time.time() + settings.MI_APP_TOKEN_API_SEGUNDOS + 1
+        with mock.patch('django.core.signing.time.time', return_value=caducado):
+            self.assertIsNone(leer_token(token))
+            self.assertEqual(self.client.get('/libros/ranking/', HTTP_AUTHORIZATION=f'Bearer {token}').status_code, 401)
+
+
+class CompresionTests(TestCase):
+    # json_versionado guarda cada respuesta ya comprimida por codificación y
+    # la sirve (o responde 304) sin volver a llamar a la vista ni comprimir
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.llamadas = 0
+
+        @json_versionado('libro')
+        def vista(request):
+            self.llamadas += 1
+            return {'results': [{'titulo': 'Rayuela'}] * 50}
+
+        self.vista = vista
+
+    def _pedir(self, codificacion, **cabeceras):
+        return self.vista(self.factory.get('/libros/', HTTP_ACCEPT_ENCODING=codificacion, **cabeceras))
+
+    def test_negociacion(self):
+        def negociada(cabecera):
+            return negociar(self.factory.get('/', HTTP_ACCEPT_ENCODING=cabecera))
+
+        self.assertEqual(negociada('gzip, deflate'), 'gzip')
+        self.assertEqual(negociada(''), IDENTIDAD)
+        self.assertEqual(negociada('gzip;q=0, identity'), IDENTIDAD)
+        self.assertEqual(negociada('deflate'), IDENTIDAD)
+        self.assertEqual(negociada('*'), DISPONIBLES[0])
+        if 'br' in DISPONIBLES:
+            self.assertEqual(negociada('gzip, br'), 'br')
+            self.assertEqual(negociada('br;q=0.5, gzip'), 'gzip')
+
+    def test_una_etiqueta_por_codificacion(self):
+        plana, comprimida = self._pedir(''), self._pedir('gzip')
+        self.assertNotIn('Content-Encoding', plana)
+        self.assertEqual(comprimida['Content-Encoding'], 'gzip')
+        self.assertEqual(json.loads(gzip.decompress(comprimida.content)), json.loads(plana.content))
+        self.assertNotEqual(plana['ETag'], comprimida['ETag'])
+        for respuesta in (plana, comprimida):
+            self.assertIn('Accept-Encoding', respuesta['Vary'])
+
+        # El ETag de una codificación no valida la otra
+        self.assertEqual(self._pedir('gzip', HTTP_IF_NONE_MATCH=comprimida['ETag']).status_code, 304)
+        self.assertEqual(self._pedir('', HTTP_IF_NONE_MATCH=comprimida['ETag']).status_code, 200)
+        # Una escritura confirmada cambia la versión y el ETag
+        with self.captureOnCommitCallbacks(execute=True):
+            Libro.objects.create(titulo='Bestiario')
+        self.assertEqual(self._pedir('gzip', HTTP_IF_NONE_MATCH=comprimida['ETag']).status_code, 200)
+
+    def test_reutiliza_los_bytes_guardados(self):
+        with mock.patch('mi_app.cache_versionada.comprimir', wraps=compresion.comprimir) as comprimir:
+            self._pedir('')
+            # Otra codificación parte de los bytes guardados, sin llamar a la vista
+            primera = self._pedir('gzip')
+            self.assertEqual((self.llamadas, comprimir.call_count), (1, 2))
+            # La segunda petición en gzip sirve los bytes ya comprimidos
+            segunda = self._pedir('gzip')
+            self.assertEqual((self.llamadas, comprimir.call_count), (1, 2))
+        self.assertEqual(segunda.content, primera.content)
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class VistasAsincronasTests(TestCase):
+    # Las vistas de lectura async devuelven lo mismo que las síncronas a las
+    # que sustituyeron y siguen exigiendo sesión
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('lectora', password='clave')
+        cortazar, borges = Autor.objects.create(nombre='Julio Cortázar'), Autor.objects.create(nombre='Jorge Luis Borges')
+        self.rayuela = Libro.objects.create(titulo='Rayuela', anio_publicacion=1963, idioma='spa')
+        self.rayuela.autores.add(cortazar)
+        Libro.objects.create(titulo='Antología', anio_publicacion=1940, idioma='spa').autores.add(borges, cortazar)
+
+    async def _json(self, url, **extra):
+        respuesta = await self.async_client.get(url, **extra)
+        self.assertEqual(respuesta.status_code, 200)
+        if respuesta.streaming:
+            return json.loads(b''.join([trozo async for trozo in respuesta.streaming_content]))
+        return json.loads(respuesta.content)
+
+    async def test_mismos_datos_que_las_vistas_sincronas(self):
+        await self.async_client.aforce_login(self.usuario)
+        # Lo que construían las vistas síncronas, con el ORM síncrono
+        autores = await sync_to_async(lambda: list(Autor.objects.order_by('id').values('id', 'nombre')))()
+        libros = await sync_to_async(lambda: [
+            {
+                'id': libro.id, 'titulo': libro.titulo,
+                'autores_nombres': ', '.join(autor.nombre for autor in libro.autores.all()),
+                'anio_publicacion': libro.anio_publicacion, 'idioma': libro.idioma,
+            }
+            for libro in Libro.objects.prefetch_related('autores').order_by('id')
+        ])()
+        self.assertEqual(await self._json('/autores/'), autores)
+        self.assertEqual(await self._json('/libros/'), {'data': libros})
+        # Desde la caché, los mismos datos
+        self.assertEqual(await self._json('/libros/'), {'data': libros})
+        self.assertEqual(await self._json(f'/libros/{self.rayuela.pk}/'), {
+            'id': self.rayuela.pk, 'titulo': 'Rayuela', 'anio_publicacion': 1963, 'idioma': 'spa',
+            'autores': [autores[0]],
+        })
+        self.assertEqual(
+            await self._json('/autores/buscar/', data={'q': 'cortá'}, headers={'x-requested-with': 'XMLHttpRequest'}),
+            {'results': [{'id': autores[0]['id'], 'text': 'Julio Cortázar'}]},
+        )
+        respuesta = await self.async_client.get('/libros/999999/')
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_sin_sesion_redirige_al_login(self):
+        for url in (
+            '/autores/', '/autores/buscar/', '/libros/', f'/libros/{self.rayuela.pk}/', '/libros/facetas/',
+            '/libros/buscar/', '/libros/ranking/', f'/libros/{self.rayuela.pk}/similares/',
+            f'/libros/{self.rayuela.pk}/comentarios/', '/comentarios/todos/', '/cambios/',
+        ):
+            with self.subTest(url=url):
+                respuesta = self.client.get(url)
+                self.assertRedirects(respuesta, f'{settings.LOGIN_URL}?next={url}', fetch_redirect_response=False)
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class StreamingTests(TestCase):
+    # Listados transmitidos por bloques: JSON válido con cualquier número de
+    # filas y NDJSON pedido por ?formato= o por Accept
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(User.objects.create_user('lectora', password='clave'))
+        for i in range(5):
+            Libro.objects.create(titulo=f'Libro "{i}"\n', anio_publicacion=1990 + i, idioma='spa')
+
+    def _cuerpo(self, respuesta):
+        self.assertEqual(respuesta.status_code, 200)
+        return b''.join(respuesta.streaming_content) if respuesta.streaming else respuesta.content
+
+    @mock.patch('mi_app.streaming.FILAS_POR_BLOQUE', 2)
+    def test_lista_json_transmitida_por_bloques(self):
+        respuesta = self.client.get('/libros/')
+        self.assertEqual(respuesta['Content-Type'], 'application/json')
+        trozos = list(respuesta.streaming_content)
+        # Apertura, dos bloques llenos y el último con el cierre
+        self.assertEqual(len([trozo for trozo in trozos if trozo]), 4)
+        datos = json.loads(b''.join(trozos))
+        self.assertEqual([libro['titulo'] for libro in datos['data']], [f'Libro "{i}"\n' for i in range(5)])
+        self.assertEqual(json.loads(self._cuerpo(self.client.get('/autores/'))), [])
+
+    def test_ndjson_por_parametro_o_por_accept(self):
+        for extra in ({'data': {'formato': 'ndjson'}}, {'headers': {'accept': 'application/x-ndjson'}}):
+            with self.subTest(**extra):
+                respuesta = self.client.get('/libros/', **extra)
+                self.assertEqual(respuesta['Content-Type'], 'application/x-ndjson')
+                lineas = self._cuerpo(respuesta).decode().splitlines()
+                self.assertEqual([json.loads(linea)['anio_publicacion'] for linea in lineas], list(range(1990, 1995)))
+        # El formato es parte de la clave de la caché: JSON sigue siendo JSON
+        self.assertEqual(len(json.loads(self._cuerpo(self.client.get('/libros/')))['data']), 5)
+
+    async def test_transmision_asincrona(self):
+        await self.async_client.aforce_login(await User.objects.aget(username='lectora'))
+        with mock.patch('mi_app.streaming.FILAS_POR_BLOQUE', 2):
+            respuesta = await self.async_client.get('/libros/', {'formato': 'ndjson'})
+            cuerpo = b''.join([trozo async for trozo in respuesta.streaming_content])
+        self.assertEqual(len(cuerpo.splitlines()), 5)
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class PaginacionTests(TestCase):
+    # Cursores de comentarios: 'after' hacia los más antiguos, 'before' hacia
+    # los más recientes, sin saltos ni repeticiones aunque la fecha empate
+
+    def setUp(self):
+        usuario = User.objects.create_user('lectora', password='clave')
+        self.client.force_login(usuario)
+        self.libro = Libro.objects.create(titulo='Rayuela')
+        Comentario.objects.bulk_create(Comentario(libro=self.libro, usuario=usuario, texto=str(i)) for i in range(7))
+        # Los cuatro más antiguos tienen la misma fecha: el id deshace el empate
+        ahora = timezone.now()
+        for i, comentario in enumerate(Comentario.objects.order_by('id')):
+            comentario.fecha = ahora - timedelta(minutes=min(i, 3))
+            comentario.save(update_fields=['fecha'])
+        self.esperados = list(Comentario.objects.order_by('-fecha', '-id').values_list('id', flat=True))
+
+    def _pagina(self, **parametros):
+        respuesta = self.client.get(f'/libros/{self.libro.pk}/comentarios/', {'limit': 2, **parametros})
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.json()
+        return [comentario['id'] for comentario in datos['results']], datos['siguiente'], datos['anterior']
+
+    def test_after_y_before_recorren_en_orden_estable(self):
+        paginas = []
+        ids, siguiente, anterior = self._pagina()
+        self.assertIsNone(anterior)
+        paginas.append(ids)
+        while siguiente:
+            ids, siguiente, anterior = self._pagina(after=siguiente)
+            paginas.append(ids)
+        self.assertEqual([pk for ids in paginas for pk in ids], self.esperados)
+        self.assertEqual([len(ids) for ids in paginas], [2, 2, 2, 1])
+        # De vuelta hacia las más recientes con 'before', página a página
+        for esperada in reversed(paginas[:-1]):
+            ids, _, anterior = self._pagina(before=anterior)
+            self.assertEqual(ids, esperada)
+        self.assertIsNone(anterior)
+
+    def test_cursor_invalido(self):
+        for cursor in ('no-es-un-cursor', paginacion.codificar_cursor(timezone.now(), 1)[:-3] + '!!!'):
+            respuesta = self.client.get(f'/libros/{self.libro.pk}/comentarios/', {'after': cursor})
+            self.assertEqual(respuesta.status_code, 400)
+            self.assertEqual(respuesta.json(), {'error': 'Cursor inválido.'})
+        self.assertEqual(self.client.get('/comentarios/todos/', {'before': 'x'}).status_code, 400)
+        self.assertEqual(paginacion.leer_limite({'limit': '10000'}), paginacion.LIMITE_MAXIMO)
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class CambiosTests(TestCase):
+    # /cambios/ y cambios.leer(): páginas con 'mas', última acción por objeto,
+    # recarga tras purgar y margen para los ids aún sin confirmar
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('lectora', password='clave')
+        self.client.force_login(self.usuario)
+        CambioCatalogo.objects.all().delete()
+
+    def _cambios(self, desde):
+        return self.client.get('/cambios/', {'desde': desde}).json()
+
+    def test_paginas_y_ultima_accion(self):
+        rayuela = Libro.objects.create(titulo='Rayuela')
+        bestiario = Libro.objects.create(titulo='Bestiario')
+        bestiario.titulo = 'Bestiario (reedición)'
+        bestiario.save()
+        pk_bestiario = bestiario.pk
+        bestiario.delete()
+        # Guardado pero ya no existe: se entrega como eliminado
+        cambios.registrar('libro', [999])
+
+        hasta, mas, recargar, _ = cambios.leer(0, limite=2)
+        self.assertEqual((hasta, mas, recargar), (CambioCatalogo.objects.order_by('id')[1].pk, True, False))
+        _, mas, _, por_modelo = cambios.leer(hasta, limite=10)
+        self.assertFalse(mas)
+        self.assertEqual(por_modelo['libro'], {pk_bestiario: cambios.ELIMINADO, 999: cambios.GUARDADO})
+
+        datos = self._cambios(0)
+        self.assertEqual(datos['hasta'], cambios.ultima_secuencia())
+        self.assertEqual([libro['id'] for libro in datos['libros']['actualizados']], [rayuela.pk])
+        self.assertEqual(sorted(datos['libros']['eliminados']), [pk_bestiario, 999])
+        self.assertEqual(self._cambios(datos['hasta'])['libros'], {'actualizados': [], 'eliminados': []})
+        self.assertEqual(self.client.get('/cambios/', {'desde': 'x'}).status_code, 400)
+
+    def test_recarga_tras_purgar_o_marcar(self):
+        for titulo in ('Rayuela', 'Bestiario', 'Ficciones'):
+            Libro.objects.create(titulo=titulo)
+        desde = CambioCatalogo.objects.order_by('id').first().pk
+        self.assertEqual(cambios.purgar(timezone.now() + timedelta(minutes=1)), 2)
+        # El cliente necesitaba entradas ya purgadas
+        self.assertEqual(self._cambios(desde)['recargar'], True)
+        self.assertEqual(self._cambios(desde + 1)['recargar'], False)
+        ultima = cambios.ultima_secuencia()
+        cambios.marcar_recarga()
+        datos = self._cambios(ultima)
+        self.assertEqual((datos['recargar'], datos['hasta']), (True, cambios.ultima_secuencia()))
+
+    def test_margen_para_transacciones_en_vuelo(self):
+        anterior = cambios.ultima_secuencia()
+        Libro.objects.create(titulo='Rayuela')
+        with override_settings(MI_APP_CAMBIOS_MARGEN_SEGUNDOS=60):
+            # Recién escrita: otra transacción con un id menor podría no haber confirmado
+            self.assertEqual(cambios.ultima_secuencia(), anterior)
+            self.assertEqual(cambios.leer(anterior)[0], anterior)
+            CambioCatalogo.objects.update(fecha=timezone.now() - timedelta(minutes=2))
+            hasta, _, _, por_modelo = cambios.leer(anterior)
+        self.assertEqual(hasta, CambioCatalogo.objects.get().pk)
+        self.assertEqual(list(por_modelo['libro'].values()), [cambios.GUARDADO])
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class AutocompletadoTests(TestCase):
+    # Índice de prefijos de autores: sin acentos, ordenado por tipo de
+    # coincidencia y sin consultas por tecla mientras no cambien los autores
+
+    def setUp(self):
+        cache.clear()
+        self.usuario = User.objects.create_user('lectora', password='clave')
+
+    def test_sin_acentos_ni_mayusculas(self):
+        self.assertEqual(autocompletado.normalizar('  Gabriel García   MÁRQUEZ '), 'gabriel garcia marquez')
+        self.assertEqual(autocompletado.normalizar('Ångström'), 'angstrom')
+        indice = autocompletado.IndicePrefijos([(1, 'Gabriel García Márquez')])
+        for texto in ('garcía már', 'GARCIA MAR', 'marquez', 'Gabriel'):
+            self.assertEqual(indice.buscar(texto), [(1, 'Gabriel García Márquez')], texto)
+        self.assertEqual(indice.buscar('arquez'), [])
+        self.assertEqual(indice.buscar('   '), [])
+
+    def test_orden_exacto_prefijo_y_palabra_posterior(self):
+        indice = autocompletado.IndicePrefijos([
+            (1, 'Gabriel García Márquez'), (2, 'Marcel Proust'), (3, 'Ana Mar'), (4, 'Mar'), (5, 'Martí'),
+        ])
+        # Exacto, empieza por el texto (el más corto antes), palabra posterior (la más a la izquierda antes)
+        self.assertEqual([autor_id for autor_id, _ in indice.buscar('mar')], [4, 5, 2, 3, 1])
+        self.assertEqual([autor_id for autor_id, _ in indice.buscar('mar', limite=2)], [4, 5])
+
+    def test_reconstruye_al_cambiar_la_version_de_autor(self):
+        Autor.objects.create(nombre='Julio Cortázar')
+        self.assertEqual([nombre for _, nombre in autocompletado.buscar('cor')], ['Julio Cortázar'])
+        with self.captureOnCommitCallbacks(execute=True):
+            Autor.objects.create(nombre='Cornelio Díaz')
+        self.assertEqual(
+            [nombre for _, nombre in autocompletado.buscar('cor')], ['Cornelio Díaz', 'Julio Cortázar'],
+        )
+
+    def test_tecla_sin_consultas(self):
+        Autor.objects.create(nombre='Julio Cortázar')
+        self.client.force_login(self.usuario)
+        cabeceras = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        self.client.get('/autores/buscar/', {'q': 'j'}, **cabeceras)
+        with self.assertNumQueries(0):
+            respuesta = self.client.get('/autores/buscar/', {'q': 'julio cort'}, **cabeceras)
+        self.assertEqual(respuesta.json()['results'], [{'id': Autor.objects.get().pk, 'text': 'Julio Cortázar'}])
+
+
+@override_settings(REPLICAS_LECTURA=[], MI_APP_PRESUPUESTOS_POR_VISTA={})
+class MetricasTests(TestCase):
+    # Histogramas por vista en /metrics/, listados transmitidos medidos hasta
+    # el último byte y presupuesto de consultas (aviso o error que revierte)
+
+    def setUp(self):
+        REGISTRO.reiniciar()
+        self.addCleanup(REGISTRO.reiniciar)
+        self.staff = User.objects.create_user('admin', password='clave', is_staff=True)
+        self.client.force_login(self.staff)
+        for nombre in ('Cortázar', 'Borges'):
+            Autor.objects.create(nombre=nombre)
+
+    def _vista(self, nombre):
+        return REGISTRO._vistas[nombre]
+
+    def test_prometheus_con_histogramas_por_vista(self):
+        self.client.get('/libros/facetas/')
+        self.client.get('/libros/facetas/', {'idioma': 'spa'})
+        self.client.get('/acerca/')
+        texto = self.client.get('/metrics/').content.decode()
+        self.assertIn('# TYPE mi_app_peticion_segundos histogram', texto)
+        self.assertIn('# TYPE mi_app_respuesta_bytes_total counter', texto)
+        self.assertIn('mi_app_peticion_segundos_count{vista="mi_app:facetas_libros"} 2', texto)
+        self.assertIn('mi_app_peticion_segundos_count{vista="mi_app:acerca"} 1', texto)
+        consultas = self._vista('mi_app:facetas_libros').consultas
+        self.assertIn(
+            f'mi_app_consultas_bd_bucket{{vista="mi_app:facetas_libros",le="+Inf"}} 2', texto
+        )
+        self.assertIn(f'mi_app_consultas_bd_sum{{vista="mi_app:facetas_libros"}} {consultas.suma}', texto)
+        # Las cubetas son acumulativas
+        self.assertEqual(consultas.cubetas, sorted(consultas.cubetas))
+        self.assertEqual(self.client.get('/metrics/', {'_': 1}).status_code, 200)
+        self.client.force_login(User.objects.create_user('lectora', password='clave'))
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+    def test_listado_transmitido_medido_hasta_el_final(self):
+        with CaptureQueriesContext(connections['default']) as capturadas:
+            respuesta = self.client.get('/autores/')
+            cuerpo = b''.join(respuesta.streaming_content)
+        self.assertEqual(len(json.loads(cuerpo)), 2)
+        metricas = self._vista('mi_app:obtener_autores')
+        # También la consulta de los autores, que corre al enviar el cuerpo
+        self.assertEqual(metricas.consultas.suma, len(capturadas.captured_queries))
+        self.assertEqual(metricas.bytes, len(cuerpo))
+        self.assertNotIn('Server-Timing', respuesta)
+
+    async def test_listado_transmitido_async(self):
+        await self.async_client.aforce_login(self.staff)
+        respuesta = await self.async_client.get('/autores/', {'formato': 'ndjson'})
+        cuerpo = b''.join([trozo async for trozo in respuesta.streaming_content])
+        self.assertEqual(len(cuerpo.splitlines()), 2)
+        self.assertEqual(self._vista('mi_app:obtener_autores').bytes, len(cuerpo))
+
+    @override_settings(MI_APP_SERVER_TIMING=True, MI_APP_PRESUPUESTOS_POR_VISTA={'mi_app:facetas_libros': 0})
+    def test_presupuesto_excedido_avisa(self):
+        with self.assertLogs('mi_app.metricas', 'WARNING') as registro:
+            respuesta = self.client.get('/libros/facetas/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('db;dur=', respuesta['Server-Timing'])
+        self.assertIn('mi_app:facetas_libros ejecutó', registro.output[0])
+        self.assertEqual(self._vista('mi_app:facetas_libros').presupuesto_excedido, 1)
+
+    def test_modo_estricto_revierte_la_escritura(self):
+        def crear(nombre):
+            return self.client.post(
+                '/autores/lote/', json.dumps([{'op': 'crear', 'datos': {'nombre': nombre}}]),
+                content_type='application/json', HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+            )
+
+        # La primera petición además carga el usuario en la caché de autenticación
+        crear('Bioy Casares')
+        previas = self._vista('mi_app:lote_autores').consultas.suma
+        self.assertEqual(crear('Borges (hijo)').status_code, 200)
+        necesarias = int(self._vista('mi_app:lote_autores').consultas.suma - previas)
+        # Sin sitio para la última escritura (el registro de cambios, antes de
+        # liberar el punto de guardado) el autor ya insertado no se confirma
+        with override_settings(
+            MI_APP_PRESUPUESTO_ESTRICTO=True, MI_APP_PRESUPUESTOS_POR_VISTA={'mi_app:lote_autores': necesarias - 2},
+        ):
+            with self.assertRaises(PresupuestoConsultasExcedido):
+                crear('Silvina Ocampo')
+        self.assertFalse(Autor.objects.filter(nombre='Silvina Ocampo').exists())
+
+
+class SimilaresTests(TestCase):
+    # Vecinos por autores y lectores en común: la actualización incremental y
+    # la reconstrucción con NumPy/SciPy deben dar las mismas listas
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('lectora', password='clave')
+        otro = User.objects.create_user('lector', password='clave')
+        cortazar, borges = Autor.objects.create(nombre='Cortázar'), Autor.objects.create(nombre='Borges')
+        self.libros = [Libro.objects.create(titulo=titulo) for titulo in ('Rayuela', 'Bestiario', 'Ficciones')]
+        self.libros[0].autores.add(cortazar)
+        self.libros[1].autores.add(cortazar)
+        self.libros[2].autores.add(borges)
+        Comentario.objects.create(libro=self.libros[0], usuario=otro, texto='...')
+        Comentario.objects.create(libro=self.libros[2], usuario=otro, texto='...')
+
+    def _listas(self):
+        return list(LibroSimilar.objects.order_by('libro_id', 'posicion').values_list('libro_id', 'similar_id'))
+
+    def test_comentario_actualiza_vecinos_y_la_vista_los_sirve(self):
+        rayuela, bestiario, ficciones = self.libros
+        similares.actualizar_libros([libro.pk for libro in self.libros])
+        with self.captureOnCommitCallbacks(execute=True):
+            Comentario.objects.create(libro=bestiario, usuario=self.usuario, texto='...')
+            Comentario.objects.create(libro=ficciones, usuario=self.usuario, texto='...')
+        self.client.force_login(self.usuario)
+        respuesta = self.client.get(f'/libros/{bestiario.pk}/similares/')
+        self.assertEqual([libro['id'] for libro in respuesta.json()['results']], [rayuela.pk, ficciones.pk])
+        self.assertEqual(self.client.get('/libros/0/similares/').status_code, 404)
+
+    def test_lector_con_muchos_comentarios_acota_los_candidatos(self):
+        voraz = User.objects.create_user('voraz', password='clave')
+        libros = [Libro.objects.create(titulo=f'Libro {numero}') for numero in range(6)]
+        for libro in libros:
+            Comentario.objects.create(libro=libro, usuario=voraz, texto='...')
+        ultimo, penultimo = libros[-1], libros[-2]
+        completas = similares.similitudes([ultimo.pk])[ultimo.pk]
+        self.assertEqual(set(completas), {libro.pk for libro in libros[:-1]})
+        with mock.patch.object(similares, 'MAX_LIBROS_POR_CARACTERISTICA', 2):
+            acotadas = similares.similitudes([ultimo.pk])[ultimo.pk]
+        # Solo los comentarios más recientes del lector; la puntuación no cambia
+        self.assertEqual(acotadas, {penultimo.pk: completas[penultimo.pk]})
+
+    @skipUnless(similares.disponible(), "requiere numpy y scipy")
+    def test_reconstruccion_completa_coincide_con_la_incremental(self):
+        similares.recalcular_todo(tamano_bloque=2)
+        completa = self._listas()
+        LibroSimilar.objects.all().delete()
+        similares.actualizar_libros([libro.pk for libro in self.libros])
+        self.assertEqual(self._listas(), completa)
+
+
+class AdminEscalaTests(TestCase):
+    # Presupuesto de consultas de los listados del admin: no crece con el
+    # número de filas (nada de una consulta por fila ni COUNT(*) de la tabla)
+    PRESUPUESTO = 6
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', 'admin@example.com', 'clave')
+        self.client.force_login(self.admin)
+
+    def _crear(self, cuantos):
+        autor = Autor.objects.create(nombre=f'Autor {Autor.objects.count()}')
+        for i in range(cuantos):
+            libro = Libro.objects.create(titulo=f'Libro {i}', anio_publicacion=1990 + i % 20, idioma='spa')
+            libro.autores.add(autor)
+            Comentario.objects.create(libro=libro, usuario=self.admin, texto=f'Comentario {i}')
+
+    def _consultas(self, url):
+        with CaptureQueriesContext(connections['default']) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas), respuesta
+
+    def test_presupuesto_de_consultas_no_depende_de_las_filas(self):
+        urls = ('/admin/mi_app/comentario/', '/admin/mi_app/libro/', '/admin/mi_app/libro/?decada=2000&idioma=spa')
+        self._crear(3)
+        for url in urls:
+            self._consultas(url)  # Opciones de los filtros en caché
+        pocas = {url: self._consultas(url)[0] for url in urls}
+        self._crear(60)
+        for url in urls:
+            self._consultas(url)
+            muchas, _ = self._consultas(url)
+            self.assertEqual(muchas, pocas[url], url)
+            self.assertLessEqual(muchas, self.PRESUPUESTO, url)
+
+    @override_settings(MI_APP_ADMIN_MAX_CONTEO=10)
+    def test_paginas_por_cursor_recorren_todo_sin_repetir(self):
+        self._crear(25)
+        vistos = []
+        with mock.patch.object(ComentarioAdmin, 'list_per_page', 10):
+            _, respuesta = self._consultas('/admin/mi_app/comentario/')
+            self.assertContains(respuesta, 'Más de 10')
+            while respuesta.context['url_siguiente']:
+                vistos += [comentario.pk for comentario in respuesta.context['cl'].result_list]
+                _, respuesta = self._consultas('/admin/mi_app/comentario/' + respuesta.context['url_siguiente'])
+            vistos += [comentario.pk for comentario in respuesta.context['cl'].result_list]
+        self.assertEqual(vistos, list(Comentario.objects.order_by('-fecha', '-id').values_list('id', flat=True)))
+
+    @override_settings(MI_APP_ADMIN_MAX_CONTEO=10)
+    def test_estimacion_del_motor_no_es_una_cota(self):
+        self._crear(3)
+        # La estimación puede pasarse del total real: se muestra como aproximada
+        with mock.patch('mi_app.admin.conteo_estimado', return_value=1000000):
+            _, respuesta = self._consultas('/admin/mi_app/comentario/')
+        self.assertContains(respuesta, '≈ 1000000')
+        self.assertNotContains(respuesta, 'Más de')
+        # Con filtros no se usa la estimación: el conteo exacto de las filas
+        with mock.patch('mi_app.admin.conteo_estimado', return_value=1000000):
+            _, respuesta = self._consultas('/admin/mi_app/libro/?idioma=spa')
+        self.assertNotContains(respuesta, '≈')
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class FacetasTests(TestCase):
+    # Los contadores por (idioma, año) siguen a las escrituras sueltas y en
+    # lote, y la tabla de libros filtrada por facetas no cuenta la tabla entera
+
+    def setUp(self):
+        self.usuario = User.objects.create_user('lectora', password='clave')
+        self.autor = Autor.objects.create(nombre='Cortázar')
+        self.libros = [
+            Libro.objects.create(titulo=titulo, anio_publicacion=anio, idioma=idioma)
+            for titulo, anio, idioma in (
+                ('Rayuela', 1963, 'spa'), ('Bestiario', 1951, 'spa'),
+                ('Hopscotch', 1963, 'eng'), ('Sin fecha', None, 'eng'),
+            )
+        ]
+
+    def _contadores(self):
+        conteo = {}
+        for idioma, anio, cuantos in FacetaLibro.objects.values_list('idioma', 'anio', 'cuantos'):
+            conteo[idioma, anio] = conteo.get((idioma, anio), 0) + cuantos
+        return {clave: cuantos for clave, cuantos in conteo.items() if cuantos}
+
+    def _esperados(self):
+        facetas.recalcular_todo()
+        return self._contadores()
+
+    def test_contadores_siguen_las_escrituras(self):
+        rayuela, bestiario, _, sin_fecha = self.libros
+        rayuela.idioma = 'eng'
+        rayuela.save()
+        sin_fecha.anio_publicacion = 1951
+        sin_fecha.save(update_fields=['anio_publicacion'])
+        bestiario.titulo = 'Bestiario (reedición)'
+        bestiario.save(update_fields=['titulo'])
+        Libro.objects.filter(pk=bestiario.pk).delete()
+        lote = LoteLibros([
+            {'op': 'crear', 'datos': {'titulo': 'Final del juego', 'anio_publicacion': 1956, 'idioma': 'spa', 'autores': [self.autor.pk]}},
+            {'op': 'actualizar', 'id': rayuela.pk, 'datos': {'titulo': 'Rayuela', 'anio_publicacion': 1963, 'idioma': 'fra', 'autores': [self.autor.pk]}},
+        ])
+        self.assertTrue(lote.validar())
+        lote.aplicar()
+        contadores = self._contadores()
+        self.assertEqual(contadores, {('eng', 1963): 1, ('eng', 1951): 1, ('spa', 1956): 1, ('fra', 1963): 1})
+        self.assertEqual(contadores, self._esperados())
+
+    def test_migracion_rellena_con_modelos_historicos(self):
+        esperados = self._esperados()
+        FacetaLibro.objects.all().delete()
+        migracion = importlib.import_module('mi_app.migrations.0017_facetas_libro')
+        migracion.poblar(apps, None)
+        self.assertEqual(self._contadores(), esperados)
+
+    def test_endpoint_y_tabla_filtrada(self):
+        self.client.force_login(self.usuario)
+        datos = self.client.get('/libros/facetas/', {'idioma': 'eng'}).json()
+        self.assertEqual(datos['total'], 2)
+        self.assertEqual(datos['idiomas'], [{'valor': 'eng', 'cuantos': 2}, {'valor': 'spa', 'cuantos': 2}])
+        self.assertEqual(datos['decadas'], [{'valor': 1960, 'cuantos': 1}])
+        self.assertEqual(datos['sin_anio'], 1)
+        self.assertEqual(self.client.get('/libros/facetas/', {'decada': '1965'}).status_code, 400)
+
+        with CaptureQueriesContext(connections['default']) as consultas:
+            respuesta = self.client.get('/libros/', {'draw': 1, 'start': 0, 'length': 10, 'idioma': 'spa', 'decada': 1960})
+        self.assertEqual(respuesta.json()['recordsTotal'], 1)
+        self.assertEqual([libro['titulo'] for libro in respuesta.json()['data']], ['Rayuela'])
+        # El total sale de FacetaLibro: ningún COUNT sobre la tabla de libros
+        self.assertFalse([c for c in consultas.captured_queries if 'COUNT(' in c['sql'] and 'mi_app_libro' in c['sql']])
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class ImportacionTests(TestCase):
+    # La importación masiva escribe en bloques, no duplica libros ni autores
+    # (dentro del archivo ni al repetirla) y omite las filas sin título
+
+    CABECERA = ['Book_ID', 'Authors', 'Publication_Year', 'Title', 'language_code', 'average_rating', 'Ratings_Count']
+    FILAS = [
+        ['1', 'Julio Cortázar', '1963', 'Rayuela', 'spa', '4.1', '10'],
+        ['2', 'Julio Cortázar, Julio Cortázar', '1951', 'Bestiario', 'spa', '3.9', '5'],
+        ['3', 'Jorge Luis Borges, Adolfo Bioy Casares', '1942', 'Seis problemas', 'spa', 'n/d', '3'],
+        # La misma clave (título, año, idioma) que la primera fila
+        ['4', 'Julio Cortázar', '1963', 'Rayuela', 'spa', '4.0', '8'],
+        ['5', 'Jorge Luis Borges', '', '   ', 'spa', '4.5', '20'],
+        ['6', 'Jorge Luis Borges', '-1', 'Ficciones', '', '4.5', '20'],
+    ]
+
+    def _importar(self, filas):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8', delete=False) as archivo:
+            csv.writer(archivo).writerows([self.CABECERA, *filas])
+        self.addCleanup(os.unlink, archivo.name)
+        salida = io.StringIO()
+        call_command('importar_libros_csv', archivo.name, '--lote', '2', '--cache-local', stdout=salida)
+        return salida.getvalue()
+
+    def test_cuenta_filas_y_omite_duplicadas(self):
+        salida = self._importar(self.FILAS)
+        self.assertIn("4 libros y 3 autores creados, 3 estadísticas cargadas", salida)
+        self.assertIn("2 filas omitidas", salida)
+        self.assertEqual(
+            sorted(Libro.objects.values_list('titulo', 'anio_publicacion', 'idioma')),
+            [('Bestiario', 1951, 'spa'), ('Ficciones', None, 'eng'), ('Rayuela', 1963, 'spa'),
+             ('Seis problemas', 1942, 'spa')],
+        )
+        self.assertEqual(Libro.objects.get(titulo='Bestiario').autores.count(), 1)
+        self.assertEqual(
+            Libro.objects.get(titulo='Seis problemas').autores_nombres, 'Jorge Luis Borges, Adolfo Bioy Casares'
+        )
+        # La calificación no numérica deja el libro sin estadísticas
+        self.assertFalse(LibroEstadisticas.objects.filter(libro__titulo='Seis problemas').exists())
+        self.assertEqual(Libro.objects.get(titulo='Rayuela').estadisticas.num_calificaciones, 10)
+        self.assertEqual(RankingLibro.objects.filter(tipo='global').count(), 3)
+
+    def test_repetir_no_duplica(self):
+        self._importar(self.FILAS)
+        nueva = ['7', 'Adolfo Bioy Casares', '1940', 'La invención de Morel', 'spa', '4.0', '9']
+        salida = self._importar([*self.FILAS, nueva])
+        self.assertIn("1 libros y 0 autores creados, 1 estadísticas cargadas", salida)
+        self.assertIn("6 filas omitidas", salida)
+        self.assertEqual(Libro.objects.count(), 5)
+        self.assertEqual(Autor.objects.count(), 3)
+
+
+class SincronizacionTests(TestCase):
+    # --sincronizar solo escribe las filas nuevas, cambiadas o eliminadas
+    # según el Book_ID y el hash guardados
+
+    CABECERA = ['Book_ID', 'Authors', 'Publication_Year', 'Title', 'language_code', 'average_rating', 'Ratings_Count']
+    FILAS = [
+        ['1', 'Julio Cortázar', '1963', 'Rayuela', 'spa', '4.1', '10'],
+        ['2', 'Julio Cortázar', '1951', 'Bestiario', 'spa', '3.9', '5'],
+        ['3', 'Jorge Luis Borges', '1944', 'Ficciones', 'spa', '4.5', '20'],
+    ]
+
+    def _sincronizar(self, filas):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8', delete=False) as archivo:
+            csv.writer(archivo).writerows([self.CABECERA, *filas])
+        self.addCleanup(os.unlink, archivo.name)
+        with CaptureQueriesContext(connections['default']) as consultas:
+            call_command('importar_libros_csv', archivo.name, '--sincronizar', '--cache-local', stdout=io.StringIO())
+        return [c['sql'] for c in consultas.captured_queries if c['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+
+    def test_solo_escribe_lo_que_cambia(self):
+        # Un libro anterior sin Book_ID se adopta en lugar de duplicarse
+        rayuela = Libro.objects.create(titulo='Rayuela', anio_publicacion=1963, idioma='spa')
+        self._sincronizar(self.FILAS)
+        self.assertEqual(
+            dict(Libro.objects.values_list('id_externo', 'titulo')), {'1': 'Rayuela', '2': 'Bestiario', '3': 'Ficciones'}
+        )
+        self.assertEqual(Libro.objects.get(id_externo='1').pk, rayuela.pk)
+        bestiario = Libro.objects.get(id_externo='2')
+        hash_bestiario = bestiario.hash_contenido
+
+        # El mismo archivo otra vez: ninguna escritura
+        self.assertEqual(self._sincronizar(self.FILAS), [])
+
+        filas = [
+            ['1', 'Julio Cortázar', '1963', 'Rayuela', 'fra', '4.2', '12'],
+            self.FILAS[1],
+            ['4', 'Jorge Luis Borges', '1949', 'El Aleph', 'spa', '4.4', '8'],
+        ]
+        CambioCatalogo.objects.all().delete()
+        self._sincronizar(filas)
+        self.assertEqual(dict(Libro.objects.values_list('id_externo', 'idioma')), {'1': 'fra', '2': 'spa', '4': 'spa'})
+        self.assertEqual(Libro.objects.get(id_externo='1').estadisticas.num_calificaciones, 12)
+        self.assertEqual(Libro.objects.get(pk=bestiario.pk).hash_contenido, hash_bestiario)
+        # Cambios registrados: el libro actualizado, el nuevo y el eliminado, nada de Bestiario
+        self.assertNotIn(bestiario.pk, CambioCatalogo.objects.values_list('objeto_id', flat=True))
+        self.assertEqual(CambioCatalogo.objects.filter(modelo='libro').count(), 3)
+        contadores = {(i, a): c for i, a, c in FacetaLibro.objects.values_list('idioma', 'anio', 'cuantos') if c}
+        facetas.recalcular_todo()
+        self.assertEqual(
+            contadores, {(i, a): c for i, a, c in FacetaLibro.objects.values_list('idioma', 'anio', 'cuantos') if c}
+        )
+
+    def test_ausentes_en_bloque_y_comentarios_del_titulo(self):
+        self._sincronizar(self.FILAS)
+        usuario = User.objects.create_user('lectora')
+        rayuela, bestiario = Libro.objects.get(id_externo='1'), Libro.objects.get(id_externo='2')
+        Comentario.objects.bulk_create(
+            Comentario(libro=libro, usuario=usuario, texto='Bueno') for libro in (rayuela, rayuela, bestiario)
+        )
+        CambioCatalogo.objects.all().delete()
+        # Rayuela cambia de título y desaparecen los otros dos
+        escrituras = self._sincronizar([['1', 'Julio Cortázar', '1963', 'Rayuela (1963)', 'spa', '4.1', '10']])
+        self.assertEqual(list(Libro.objects.values_list('titulo', flat=True)), ['Rayuela (1963)'])
+        self.assertFalse(Comentario.objects.filter(libro_id=bestiario.pk).exists())
+        # Un DELETE por tabla para los dos libros, sin borrados fila a fila
+        self.assertEqual(len([sql for sql in escrituras if sql.startswith('DELETE')]), 6)
+        registrados = set(CambioCatalogo.objects.values_list('modelo', 'objeto_id', 'accion'))
+        comentarios = Comentario.objects.filter(libro=rayuela).values_list('pk', flat=True)
+        self.assertTrue({('comentario', pk, cambios.GUARDADO) for pk in comentarios} <= registrados)
+        self.assertIn(('libro', bestiario.pk, cambios.ELIMINADO), registrados)
+        self.assertEqual(
+            len([1 for modelo, _, accion in registrados if modelo == 'comentario' and accion == cambios.ELIMINADO]), 1
+        )
+
+    def test_ausentes_cuentan_para_el_limite(self):
+        self._sincronizar(self.FILAS)
+        CambioCatalogo.objects.all().delete()
+        # Un solo libro escrito, pero dos borrados superan el límite
+        filas = [['1', 'Julio Cortázar', '1963', 'Rayuela', 'fra', '4.1', '10']]
+        with mock.patch('mi_app.management.commands.importar_libros_csv.LIMITE_INCREMENTAL', 2):
+            self._sincronizar(filas)
+        self.assertEqual(
+            list(CambioCatalogo.objects.values_list('modelo', 'accion')), [('*', cambios.RECARGA)]
+        )
+        self.assertEqual(Libro.objects.count(), 1)
+
+    def test_libro_nuevo_recibe_similares(self):
+        self._sincronizar(self.FILAS)
+        rayuela = Libro.objects.get(id_externo='1')
+        self._sincronizar([*self.FILAS, ['5', 'Julio Cortázar', '1966', 'Todos los fuegos el fuego', 'spa', '4.2', '7']])
+        nuevo = Libro.objects.get(id_externo='5')
+        self.assertIn(rayuela.pk, LibroSimilar.objects.filter(libro=nuevo).values_list('similar_id', flat=True))
+        self.assertTrue(LibroSimilar.objects.filter(libro=rayuela, similar=nuevo).exists())
+
+
+class CanalizacionTests(TestCase):
+    # Los rangos de bytes cortan entre registros aunque un campo entre
+    # comillas tenga saltos de línea, y el resultado no depende del número de procesos
+
+    def setUp(self):
+        filas = [['Book_ID', 'Authors', 'Publication_Year', 'Title', 'language_code', 'average_rating']]
+        for i in range(200):
+            titulo = f'Libro {i}' if i % 7 else f'Libro "{i}",\ncon salto de línea'
+            filas.append([str(i), f'Autora {i % 9}, Autor {i % 4}', '1999.0', titulo, 'spa', '4.0'])
+        filas[5][2] = 'hacia 1900'
+        filas[8][4] = 'español!'
+        filas[9][3] = ''
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', newline='', encoding='utf-8', delete=False) as archivo:
+            csv.writer(archivo).writerows(filas)
+        self.addCleanup(os.unlink, archivo.name)
+        self.ruta = archivo.name
+        with open(self.ruta, encoding='utf-8', newline='') as archivo:
+            self.esperadas = [preparar_fila(fila) for fila in csv.DictReader(archivo)]
+
+    def _preparadas(self, trabajadores):
+        recibidas = []
+        tuberia = canalizacion.Canalizacion(self.ruta, trabajadores, lote=50, tamano_rango=300)
+        tuberia.ejecutar(recibidas.extend)
+        self.assertGreater(tuberia.rangos, 10)
+        self.assertEqual(tuberia.con_problemas, 3)
+        return recibidas
+
+    def test_rangos_respetan_los_registros(self):
+        self.assertEqual(self._preparadas(1), self.esperadas)
+        self.assertEqual(self._preparadas(2), self.esperadas)
+
+    def test_validar_no_escribe(self):
+        salida = io.StringIO()
+        call_command('importar_libros_csv', self.ruta, '--dry-run', stdout=salida)
+        self.assertIn("Registro 5 (Book_ID 4): año no válido: 'hacia 1900'", salida.getvalue())
+        self.assertIn("200 filas, 3 con problemas", salida.getvalue())
+        self.assertFalse(Libro.objects.exists())
+
+
+@override_settings(REPLICAS_LECTURA=[])
+class ExportacionTests(TestCase):
+    # El CSV de libros se puede volver a importar y la memoria depende del
+    # tamaño del bloque, no del número de filas
+
+    def setUp(self):
+        self.staff = User.objects.create_user('admin', password='clave', is_staff=True)
+        libro = Libro.objects.create(titulo='Rayuela, edición crítica', anio_publicacion=1963, idioma='spa')
+        libro.autores.add(Autor.objects.create(nombre='Julio Cortázar'))
+        LibroEstadisticas.objects.create(libro=libro, calificacion_promedio=4.1, num_calificaciones=10, estrellas_5=7)
+        Comentario.objects.create(libro=libro, usuario=self.staff, texto='Imprescindible')
+
+    def test_csv_de_libros_con_el_formato_de_importacion(self):
+        texto = b''.join(exportacion.Exportacion('libros', 'csv')).decode()
+        fila = next(csv.DictReader(io.StringIO(texto)))
+        self.assertEqual(normalizar_fila(fila), ('Rayuela, edición crítica', 1963, 'spa', ['Julio Cortázar']))
+        self.assertEqual(normalizar_estadisticas(fila)['estrellas_5'], 7)
+
+    def test_memoria_acotada_por_el_bloque(self):
+        def pico():
+            tracemalloc.start()
+            for _ in exportacion.Exportacion('autores', 'ndjson', filas_por_bloque=50):
+                pass
+            _, maximo = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            return maximo
+
+        Autor.objects.bulk_create([Autor(nombre=f'Autor {i}') for i in range(100)])
+        pocas = pico()
+        Autor.objects.bulk_create([Autor(nombre=f'Otro autor {i}') for i in range(5000)])
+        self.assertLess(pico(), pocas * 2)
+
+    def test_endpoint_solo_personal_y_comprimido(self):
+        self.client.force_login(User.objects.create_user('lectora', password='clave'))
+        self.assertEqual(self.client.get('/exportar/comentarios/').status_code, 403)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get('/exportar/usuarios/').status_code, 400)
+        respuesta = self.client.get('/exportar/comentarios/', {'formato': 'ndjson', 'compresion': 'gzip'})
+        self.assertEqual(respuesta['Content-Disposition'], 'attachment; filename="comentarios.ndjson.gz"')
+        filas = [json.loads(linea) for linea in gzip.decompress(b''.join(respuesta.streaming_content)).splitlines()]
+        self.assertEqual([(fila['usuario'], fila['texto']) for fila in filas], [('admin', 'Imprescindible')])
+
+    @skipUnless(exportacion.columnar_disponible(), "requiere pyarrow")
+    def test_parquet_por_grupos_de_filas(self):
+        import pyarrow.parquet
+        Autor.objects.bulk_create([Autor(nombre=f'Autor {i}') for i in range(9)])
+        datos = b''.join(exportacion.Exportacion('autores', 'parquet', 'zstd', filas_por_bloque=4))
+        archivo = pyarrow.parquet.ParquetFile(io.BytesIO(datos))
+        self.assertEqual((archivo.metadata.num_rows, archivo.metadata.num_row_groups), (10, 3))
@@ -21,10 +21,16 @@ urlpatterns = [
     path('autores/editar/<int:autor_id>/', views.editar_autor, name='editar_autor'),
     path('autores/eliminar/<int:autor_id>/', views.eliminar_autor, name='eliminar_autor'),
     path('autores/buscar/', views.buscar_autores, name='buscar_autores'),
+    path('autores/lote/', views.lote_autores, name='lote_autores'),
 
     # Rutas para Libros
     path('libros/', views.obtener_libros, name='obtener_libros'),
+    path('libros/buscar/', views.buscar_libros, name='buscar_libros'),
+    path('libros/lote/', views.lote_libros, name='lote_libros'),
+    path('libros/ranking/', views.ranking_libros, name='ranking_libros'),
+    path('libros/facetas/', views.facetas_libros, name='facetas_libros'),
     path('libros/<int:libro_id>/', views.obtener_libro, name='obtener_libro'),
+    path('libros/<int:libro_id>/similares/', views.libros_similares, name='libros_similares'),
     path('libros/agregar/', views.agregar_libro, name='agregar_libro'),
     path('libros/editar/<int:libro_id>/', views.editar_libro, name='editar_libro'),
     path('libros/eliminar/<int:libro_id>/', views.eliminar_libro, name='eliminar_libro'),
@@ -36,6 +42,19 @@ urlpatterns = [
     path('comentarios/eliminar/<int:comentario_id>/', views.eliminar_comentario, name='eliminar_comentario'),
     path('comentarios/todos/', views.obtener_todos_comentarios, name='obtener_todos_comentarios'),
 
+    # Cambios incrementales del catálogo
+    path('cambios/', views.obtener_cambios, name='obtener_cambios'),
+    path('eventos/', views.eventos_catalogo, name='eventos_catalogo'),
+
+    # Exportación del catálogo por bloques (solo personal)
+    path('exportar/<str:tabla>/', views.exportar_catalogo, name='exportar_catalogo'),
+
+    # Token de lectura para la API JSON
+    path('api/token/', views.token_api, name='token_api'),
+
+    # Métricas de rendimiento (Prometheus)
+    path('metrics/', views.metricas, name='metricas'),
+
     # Opcional: redirecciones para cuentas
     path('accounts/login/', auth_views.LoginView.as_view(template_name='registration/login.html'), name='login_accounts'),
     path('accounts/logout/', auth_views.LogoutView.as_view(), name='logout_accounts'),
@@ -1,12 +1,20 @@
-from django.shortcuts import render, get_object_or_404, redirect
-from django.http import JsonResponse
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_POST
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
+from django.conf import settings
 from django.contrib import messages
-from .models import Autor, Libro, Comentario
+from .models import Autor, Libro, Comentario, LibroSimilar, RankingLibro
+from . import autocompletado, busqueda, cambios, datatables, eventos, exportacion, facetas, lotes, paginacion, rankings, similares, streaming
+from .autenticacion import emitir_token
+from .cache_versionada import json_versionado
+from .metricas import REGISTRO
+from .reintentos import escritura_atomica
 import json
+from asgiref.sync import sync_to_async
 from django.db.models import Q
 
 # Página principal (Home)
@@ -20,7 +28,9 @@ def acerca(request):
 # Página protegida (Index)
 @login_required
 def index(request):
-    return render(request, 'mi_app/index.html')
+    # Secuencia de cambios anterior a la carga de las tablas: el navegador pide
+    # /cambios/ desde aquí y no se pierde nada escrito mientras cargan
+    return render(request, 'mi_app/index.html', {'secuencia_cambios': cambios.ultima_secuencia()})
 
 # Registro de usuarios
 def signup(request):
@@ -42,13 +52,17 @@ def user_logout(request):
     return redirect('mi_app:login')
 
 # Vistas para Autores
+# Las vistas JSON de solo lectura son async: bajo ASGI una consulta lenta no
+# bloquea un worker completo y los listados se transmiten por bloques
 @login_required
-def obtener_autores(request):
-    autores = Autor.objects.all().values('id', 'nombre')
-    return JsonResponse(list(autores), safe=False)
+@json_versionado('autor')
+async def obtener_autores(request):
+    autores = Autor.objects.order_by('id').values('id', 'nombre')
+    return streaming.responder(request, autores)
 
 @login_required
 @require_POST
+@escritura_atomica
 def agregar_autor(request):
     if request.headers.get('x-requested-with') != 'XMLHttpRequest':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
@@ -67,6 +81,7 @@ def agregar_autor(request):
 
 @login_required
 @require_POST
+@escritura_atomica
 def editar_autor(request, autor_id):
     if not request.user.is_staff:
         return JsonResponse({'error': 'No tienes permiso para editar autores.'}, status=403)
@@ -86,6 +101,7 @@ def editar_autor(request, autor_id):
 
 @login_required
 @require_POST
+@escritura_atomica
 def eliminar_autor(request, autor_id):
     if not request.user.is_staff:
         return JsonResponse({'error': 'No tienes permiso para eliminar autores.'}, status=403)
@@ -99,45 +115,149 @@ def eliminar_autor(request, autor_id):
         return JsonResponse({'error': str(e)}, status=400)
 
 @login_required
-def buscar_autores(request):
+async def buscar_autores(request):
     if request.method == 'GET' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
         query = request.GET.get('q', '')
-        autores = Autor.objects.filter(Q(nombre__icontains=query))[:10]
-        resultados = [{'id': autor.id, 'text': autor.nombre} for autor in autores]
+        # Índice de prefijos en memoria: sin consultas por tecla (ver autocompletado.py)
+        autores = await autocompletado.abuscar(query, limite=10)
+        resultados = [{'id': autor_id, 'text': nombre} for autor_id, nombre in autores]
         return JsonResponse({'results': resultados})
     return JsonResponse({'error': 'Método no permitido'}, status=405)
 
 # Vistas para Libros
+# Los nombres de autores ya están desnormalizados en Libro: una sola tabla
+CAMPOS_LIBRO = ('id', 'titulo', 'autores_nombres', 'anio_publicacion', 'idioma')
+
+async def _aserializar_libros(libros):
+    return [libro async for libro in libros.values(*CAMPOS_LIBRO)]
+
+def _filtro_autores(valor):
+    return Q(autores_nombres__icontains=valor)
+
+def _filtro_numerico(campo):
+    def filtro(valor):
+        return Q(**{campo: int(valor)}) if valor.isdigit() else Q(pk__in=[])
+    return filtro
+
+def _busqueda_libros(valor):
+    condicion = Q(titulo__icontains=valor) | Q(idioma__iexact=valor) | _filtro_autores(valor)
+    if valor.isdigit():
+        condicion |= Q(id=int(valor)) | Q(anio_publicacion=int(valor))
+    return condicion
+
+COLUMNAS_LIBROS = {
+    'id': datatables.Columna(orden='id', filtro=_filtro_numerico('id')),
+    'titulo': datatables.Columna(orden='titulo', filtro=lambda valor: Q(titulo__icontains=valor)),
+    'autores_nombres': datatables.Columna(orden='autores_nombres', filtro=_filtro_autores),
+    'anio_publicacion': datatables.Columna(orden='anio_publicacion', filtro=_filtro_numerico('anio_publicacion')),
+    'idioma': datatables.Columna(orden='idioma', filtro=lambda valor: Q(idioma__icontains=valor)),
+}
+
 @login_required
-def obtener_libros(request):
-    libros = Libro.objects.prefetch_related('autores').all()
-    data = [
-        {
-            'id': libro.id,
-            'titulo': libro.titulo,
-            'autores_nombres': ", ".join([autor.nombre for autor in libro.autores.all()]),
-            'anio_publicacion': libro.anio_publicacion,
-            'idioma': libro.idioma,
+@json_versionado('libro', 'autor')
+async def obtener_libros(request):
+    # Filtros de facetas (?idioma=&decada=&anio=) sobre el índice (idioma, anio_publicacion)
+    try:
+        filtros = facetas.leer_filtros(request.GET)
+    except facetas.FiltroInvalido as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    libros = Libro.objects.filter(facetas.condicion(filtros))
+    # Modo servidor de DataTables: solo se consulta y serializa la página pedida
+    if datatables.es_peticion_datatables(request):
+        consulta = datatables.preparar(request, libros, COLUMNAS_LIBROS, _busqueda_libros)
+        # El total sale de los contadores de facetas; solo la búsqueda necesita un COUNT
+        total = await facetas.acontar(filtros)
+        filtrados = await consulta.filtrado.acount() if consulta.hay_filtros else total
+        return {
+            'draw': consulta.draw,
+            'recordsTotal': total,
+            'recordsFiltered': filtrados,
+            'data': await _aserializar_libros(consulta.pagina),
         }
-        for libro in libros
-    ]
-    return JsonResponse({'data': data})
+    return streaming.responder(request, libros.order_by('id').values(*CAMPOS_LIBRO), clave='data')
+
+# Conteos por idioma, década y año para los filtros actuales (?idioma=&decada=&anio=),
+# sumados desde FacetaLibro sin recorrer los libros (ver facetas.py)
+@login_required
+@json_versionado('libro')
+async def facetas_libros(request):
+    try:
+        filtros = facetas.leer_filtros(request.GET)
+    except facetas.FiltroInvalido as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    return await facetas.acalcular(filtros)
+
+# Búsqueda de libros por título, autores y comentarios, ordenada por relevancia
+@login_required
+async def buscar_libros(request):
+    query = request.GET.get('q', '').strip()
+    try:
+        limite = min(max(int(request.GET.get('limite', 20)), 1), 100)
+    except ValueError:
+        limite = 20
+    ids = await sync_to_async(busqueda.buscar_libros)(query, limite=limite)
+    libros = {libro['id']: libro for libro in await _aserializar_libros(Libro.objects.filter(id__in=ids))}
+    return JsonResponse({'results': [libros[i] for i in ids if i in libros]})
 
+# Rankings precalculados: ?por=global|idioma|decada|autor&clave=...&limite=N.
+# Sin clave (salvo en el global) devuelve las claves disponibles para ese tipo
 @login_required
-def obtener_libro(request, libro_id):
-    libro = get_object_or_404(Libro, id=libro_id)
-    autores = libro.autores.all()
+@json_versionado('ranking', 'libro')
+async def ranking_libros(request):
+    por = request.GET.get('por', 'global')
+    if por not in rankings.TIPOS:
+        return JsonResponse({'error': f"'por' debe ser uno de: {', '.join(rankings.TIPOS)}."}, status=400)
+    clave = request.GET.get('clave', '').strip()
+    filas = RankingLibro.objects.filter(tipo=por)
+    if por != 'global' and not clave:
+        claves = filas.order_by('clave').values_list('clave', flat=True).distinct()
+        return {'por': por, 'claves': [clave async for clave in claves]}
+    try:
+        limite = min(max(int(request.GET.get('limite', 10)), 1), rankings.TOP_N)
+    except ValueError:
+        limite = 10
+    filas = filas.filter(clave=clave, posicion__lte=limite).order_by('posicion').values_list(
+        'posicion', 'puntuacion', 'libro_id', 'libro__titulo', 'libro__autores_nombres',
+        'libro__anio_publicacion', 'libro__idioma', 'libro__estadisticas__calificacion_promedio',
+        'libro__estadisticas__num_calificaciones',
+    )
+    campos = ('posicion', 'puntuacion', *CAMPOS_LIBRO, 'calificacion_promedio', 'num_calificaciones')
+    return {'por': por, 'clave': clave, 'results': [dict(zip(campos, fila)) async for fila in filas]}
+
+# Libros similares precalculados (ver similares.py): una consulta por el
+# índice (libro, posicion). ?limite=N
+@login_required
+@json_versionado('similares', 'libro')
+async def libros_similares(request, libro_id):
+    try:
+        limite = min(max(int(request.GET.get('limite', 10)), 1), similares.TOP_K)
+    except ValueError:
+        limite = 10
+    filas = LibroSimilar.objects.filter(libro_id=libro_id, posicion__lte=limite).order_by('posicion').values_list(
+        'puntuacion', 'similar_id', 'similar__titulo', 'similar__autores_nombres',
+        'similar__anio_publicacion', 'similar__idioma',
+    )
+    resultados = [dict(zip(('puntuacion', *CAMPOS_LIBRO), fila)) async for fila in filas]
+    # Sin vecinos: solo entonces se comprueba que el libro exista
+    if not resultados and not await Libro.objects.filter(id=libro_id).aexists():
+        raise Http404('Libro no encontrado')
+    return {'libro': libro_id, 'results': resultados}
+
+@login_required
+async def obtener_libro(request, libro_id):
+    libro = await aget_object_or_404(Libro, id=libro_id)
     data = {
         'id': libro.id,
         'titulo': libro.titulo,
         'anio_publicacion': libro.anio_publicacion,
         'idioma': libro.idioma,
-        'autores': [{'id': autor.id, 'nombre': autor.nombre} for autor in autores],
+        'autores': [autor async for autor in libro.autores.values('id', 'nombre')],
     }
     return JsonResponse(data)
 
 @login_required
 @require_POST
+@escritura_atomica
 def agregar_libro(request):
     if request.headers.get('x-requested-with') != 'XMLHttpRequest':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
@@ -160,6 +280,7 @@ def agregar_libro(request):
 
 @login_required
 @require_POST
+@escritura_atomica
 def editar_libro(request, libro_id):
     if not request.user.is_staff:
         return JsonResponse({'error': 'No tienes permiso para editar libros.'}, status=403)
@@ -173,21 +294,25 @@ def editar_libro(request, libro_id):
         autor_ids = data.get('autores', [])
         if not (titulo and anio_publicacion and idioma and autor_ids):
             return JsonResponse({'error': 'Todos los campos son obligatorios'}, status=400)
-        autores = Autor.objects.filter(id__in=autor_ids)
-        if not autores.exists():
+        # Se leen una vez: comprobar que existen y pasarlos a autores.set()
+        autores = list(Autor.objects.filter(id__in=autor_ids))
+        if not autores:
             return JsonResponse({'error': 'Selecciona al menos un autor válido'}, status=400)
         libro = get_object_or_404(Libro, id=libro_id)
         libro.titulo = titulo
         libro.anio_publicacion = anio_publicacion
         libro.idioma = idioma
+        # Solo los campos editados: un save() completo reescribiría
+        # autores_nombres con el valor viejo que tiene la instancia en memoria
+        libro.save(update_fields=['titulo', 'anio_publicacion', 'idioma'])
         libro.autores.set(autores)
-        libro.save()
         return JsonResponse({'mensaje': 'Libro actualizado correctamente'})
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Datos inválidos.'}, status=400)
 
 @login_required
 @require_POST
+@escritura_atomica
 def eliminar_libro(request, libro_id):
     if not request.user.is_staff:
         return JsonResponse({'error': 'No tienes permiso para eliminar libros.'}, status=403)
@@ -200,15 +325,50 @@ def eliminar_libro(request, libro_id):
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=400)
 
+# Operaciones en lote: se validan todas y se aplican juntas en una transacción
+def _procesar_lote(request, clase):
+    if request.headers.get('x-requested-with') != 'XMLHttpRequest':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    try:
+        lote = clase(lotes.leer_operaciones(json.loads(request.body)))
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Datos inválidos.'}, status=400)
+    except lotes.LoteInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    if lote.requiere_staff and not request.user.is_staff:
+        return JsonResponse({'error': 'Solo el personal puede actualizar o eliminar en lote.'}, status=403)
+    if not lote.validar():
+        return JsonResponse({'error': 'El lote contiene operaciones inválidas; no se aplicó ninguna.',
+                             'resultados': lote.resultados}, status=400)
+    lote.aplicar()
+    return JsonResponse({'resultados': lote.resultados})
+
+@login_required
+@require_POST
+@escritura_atomica
+def lote_libros(request):
+    return _procesar_lote(request, lotes.LoteLibros)
+
+@login_required
+@require_POST
+@escritura_atomica
+def lote_autores(request):
+    return _procesar_lote(request, lotes.LoteAutores)
+
 # Vistas para Comentarios
 @login_required
-def obtener_comentarios(request, libro_id):
-    libro = get_object_or_404(Libro, id=libro_id)
+@json_versionado('comentario', 'usuario')
+async def obtener_comentarios(request, libro_id):
+    libro = await aget_object_or_404(Libro, id=libro_id)
     comentarios = libro.comentarios.all().values('id', 'usuario__username', 'texto', 'fecha')
-    return JsonResponse(list(comentarios), safe=False)
+    try:
+        return await paginacion.apaginar(comentarios, request.GET)
+    except paginacion.CursorInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
 @login_required
 @require_POST
+@escritura_atomica
 def agregar_comentario(request, libro_id):
     if request.headers.get('x-requested-with') != 'XMLHttpRequest':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
@@ -233,6 +393,7 @@ def agregar_comentario(request, libro_id):
 
 @login_required
 @require_POST
+@escritura_atomica
 def editar_comentario(request, comentario_id):
     if request.headers.get('x-requested-with') != 'XMLHttpRequest':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
@@ -252,6 +413,7 @@ def editar_comentario(request, comentario_id):
 
 @login_required
 @require_POST
+@escritura_atomica
 def eliminar_comentario(request, comentario_id):
     if request.headers.get('x-requested-with') != 'XMLHttpRequest':
         return JsonResponse({'error': 'Método no permitido'}, status=405)
@@ -265,12 +427,95 @@ def eliminar_comentario(request, comentario_id):
         return JsonResponse({'error': str(e)}, status=400)
 
 # Nueva Vista para Obtener Todos los Comentarios
+CAMPOS_COMENTARIO = ('id', 'libro__titulo', 'usuario__username', 'texto', 'fecha')
+
 @login_required
-def obtener_todos_comentarios(request):
-    comentarios = Comentario.objects.select_related('libro', 'usuario').all().values(
-        'id', 'libro__titulo', 'usuario__username', 'texto', 'fecha'
-    )
-    return JsonResponse(list(comentarios), safe=False)
+@json_versionado('comentario', 'libro', 'usuario')
+async def obtener_todos_comentarios(request):
+    comentarios = Comentario.objects.select_related('libro', 'usuario').all().values(*CAMPOS_COMENTARIO)
+    # En NDJSON se transmiten todos los comentarios, del más reciente al más antiguo
+    if streaming.quiere_ndjson(request):
+        return streaming.responder(request, comentarios.order_by('-fecha', '-id'))
+    try:
+        return await paginacion.apaginar(comentarios, request.GET)
+    except paginacion.CursorInvalido as e:
+        return JsonResponse({'error': str(e)}, status=400)
+
+
+# Cambios del catálogo posteriores a ?desde=<seq>, para refrescar las tablas
+# sin volver a pedir los listados (ver cambios.py). Sin 'desde' devuelve solo
+# la secuencia actual
+@login_required
+async def obtener_cambios(request):
+    if 'desde' not in request.GET:
+        return JsonResponse({'hasta': await sync_to_async(cambios.ultima_secuencia)()})
+    try:
+        desde = int(request.GET['desde'])
+    except ValueError:
+        return JsonResponse({'error': "'desde' debe ser un número de secuencia."}, status=400)
+    hasta, mas, recargar, por_modelo = await sync_to_async(cambios.leer)(desde)
+    if recargar:
+        return JsonResponse({'hasta': hasta, 'mas': False, 'recargar': True})
+    datos = {'hasta': hasta, 'mas': mas, 'recargar': False}
+    for modelo, nombre, filas in (
+        ('autor', 'autores', Autor.objects.values('id', 'nombre')),
+        ('libro', 'libros', Libro.objects.values(*CAMPOS_LIBRO)),
+        ('comentario', 'comentarios', Comentario.objects.values(*CAMPOS_COMENTARIO)),
+    ):
+        acciones = por_modelo[modelo]
+        guardados = [pk for pk, accion in acciones.items() if accion == cambios.GUARDADO]
+        actualizados = [fila async for fila in filas.filter(id__in=guardados)] if guardados else []
+        # Lo que ya no existe cuenta como eliminado aunque su última entrada sea anterior
+        vigentes = {fila['id'] for fila in actualizados}
+        datos[nombre] = {'actualizados': actualizados, 'eliminados': [pk for pk in acciones if pk not in vigentes]}
+    return JsonResponse(datos)
+
+
+# Canal de eventos (Server-Sent Events) con los cambios del catálogo; solo
+# bajo ASGI, ver eventos.py
+@login_required
+async def eventos_catalogo(request):
+    return eventos.responder(request)
+
+
+# Token firmado de corta duración para leer la API sin sesión
+# (cabecera "Authorization: Bearer <token>", ver autenticacion.py)
+@login_required
+@require_POST
+def token_api(request):
+    if request.headers.get('x-requested-with') != 'XMLHttpRequest':
+        return JsonResponse({'error': 'Método no permitido'}, status=405)
+    if getattr(request.user, 'token_api', False):
+        return JsonResponse({'error': 'Un token no puede emitir otro token.'}, status=403)
+    return JsonResponse({
+        'token': emitir_token(request.user),
+        'expira_en': settings.MI_APP_TOKEN_API_SEGUNDOS,
+    })
+
+# Métricas por vista en formato de texto de Prometheus (solo personal)
+@login_required
+def metricas(request):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No tienes permiso para ver las métricas.'}, status=403)
+    return HttpResponse(REGISTRO.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# Descarga de una tabla del catálogo (solo personal), transmitida por bloques:
+# ?formato=csv|ndjson|parquet|arrow&compresion=gzip|zstd|br (ver exportacion.py)
+@login_required
+def exportar_catalogo(request, tabla):
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'No tienes permiso para exportar el catálogo.'}, status=403)
+    try:
+        salida = exportacion.Exportacion(
+            tabla, request.GET.get('formato', 'csv'), request.GET.get('compresion') or None
+        )
+    except exportacion.ExportacionInvalida as error:
+        return JsonResponse({'error': str(error)}, status=400)
+    # Bajo ASGI un iterador síncrono se consumiría entero antes de enviarse
+    contenido = exportacion.aiterar(salida) if isinstance(request, ASGIRequest) else iter(salida)
+    respuesta = StreamingHttpResponse(contenido, content_type=salida.tipo_contenido)
+    respuesta['Content-Disposition'] = f'attachment; filename="{salida.nombre_archivo}"'
+    return respuesta
 
 
 from django.shortcuts import render
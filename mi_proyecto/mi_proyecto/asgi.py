@@ -18,5 +18,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mi_proyecto.settings')
 
 # Llama a 'get_asgi_application' para crear la aplicación ASGI
+# Bajo ASGI (p. ej. uvicorn mi_proyecto.asgi:application) /eventos/ mantiene
+# abiertas las conexiones SSE del catálogo; bajo WSGI responde 204 (ver mi_app/eventos.py)
 # Esto expone la aplicación ASGI que se usará para servir el proyecto en entornos asincrónicos
 application = get_asgi_application()
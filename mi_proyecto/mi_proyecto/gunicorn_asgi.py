@@ -0,0 +1,29 @@
+# Configuración de gunicorn con workers de uvicorn (ASGI).
+#
+#   MI_APP_CACHE_URL=redis://127.0.0.1:6379/1 DJANGO_SETTINGS_MODULE=mi_proyecto.settings_asgi \
+#       gunicorn mi_proyecto.asgi:application -c mi_proyecto/gunicorn_asgi.py
+#
+# Cada worker es un proceso con un bucle de eventos que atiende muchas
+# peticiones concurrentes, así que bastan pocos workers (uno o dos por núcleo).
+# Varios workers necesitan una caché compartida (MI_APP_CACHE_URL, ver
+# settings_asgi.py); sin ella se arranca uno solo y pedir más es un error.
+# Para comparar con WSGI:
+#   gunicorn mi_proyecto.wsgi:application -w 4 --bind 127.0.0.1:8000
+#   python manage.py benchmark_http --url http://127.0.0.1:8000/libros/ --concurrencia 50
+import multiprocessing
+import os
+
+bind = os.environ.get('MI_APP_BIND', '127.0.0.1:8000')
+_cache_compartida = bool(os.environ.get('MI_APP_CACHE_URL'))
+workers = int(os.environ.get('MI_APP_WORKERS', multiprocessing.cpu_count() if _cache_compartida else 1))
+if workers > 1 and not _cache_compartida:
+    raise RuntimeError(
+        "MI_APP_WORKERS > 1 sin MI_APP_CACHE_URL: cada worker tendría su propia caché y serviría "
+        "respuestas viejas tras las escrituras atendidas por otro. Configura Redis o Memcached."
+    )
+worker_class = 'uvicorn.workers.UvicornWorker'
+# Los listados grandes se transmiten por bloques; no cortar respuestas largas
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
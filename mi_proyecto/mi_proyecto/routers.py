@@ -0,0 +1,115 @@
+# Enrutado de lecturas a réplicas y de escrituras a la base primaria.
+#
+# EnrutadoMiddleware marca cada petición: las vistas de solo lectura
+# (obtener_* y buscar_*) leen de una réplica de REPLICAS_LECTURA; todo lo
+# demás (admin, CRUD, comandos de gestión) usa 'default'. Para que un usuario
+# vea siempre sus propias escrituras:
+#   - en cuanto la petición escribe, el resto de sus lecturas van a la primaria;
+#   - tras una petición que escribe se envía una cookie y, mientras dure
+#     (REPLICAS_FIJAR_PRIMARIA_SEGUNDOS, algo más que el retraso de
+#     replicación), las peticiones de ese navegador leen de la primaria.
+#
+# Ajustes:
+#   DATABASE_ROUTERS = ['mi_proyecto.routers.LecturaEscrituraRouter']
+#   REPLICAS_LECTURA = ['replica']            alias de DATABASES que son réplicas
+#   REPLICAS_FIJAR_PRIMARIA_SEGUNDOS = 5
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+PRIMARIA = 'default'
+COOKIE_PRIMARIA = 'leer_primaria'
+PREFIJOS_LECTURA = ('obtener_', 'buscar_')
+# Solo los datos del catálogo se leen de réplicas: sesiones y usuarios se leen
+# justo después de escribirse (inicio de sesión) y van siempre a la primaria
+APPS_EN_REPLICA = ('mi_app',)
+
+
+class _Estado:
+    def __init__(self, fijada):
+        self.replica = None
+        # La cookie de una escritura reciente fija la petición a la primaria
+        self.fijada = fijada
+        self.escribio = False
+
+
+# Estado de la petición en curso. Es un objeto mutable para que las vistas
+# async, que consultan desde hilos de sync_to_async con una copia del
+# contexto, marquen la escritura en el mismo objeto que ve el middleware.
+_estado_actual = ContextVar('mi_proyecto_enrutado', default=None)
+
+
+def replicas():
+    return list(getattr(settings, 'REPLICAS_LECTURA', []))
+
+
+class LecturaEscrituraRouter:
+    def db_for_read(self, model, **hints):
+        estado = _estado_actual.get()
+        if estado is None or estado.replica is None or estado.fijada or estado.escribio:
+            return PRIMARIA
+        if model._meta.app_label not in APPS_EN_REPLICA:
+            return PRIMARIA
+        return estado.replica
+
+    def db_for_write(self, model, **hints):
+        estado = _estado_actual.get()
+        if estado is not None:
+            estado.escribio = True
+        return PRIMARIA
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primaria y réplicas tienen los mismos datos
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Las réplicas reciben el esquema por replicación, no por migrate
+        return db not in replicas()
+
+
+class EnrutadoMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        estado, token = self._iniciar(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _estado_actual.reset(token)
+        return self._terminar(estado, response)
+
+    async def __acall__(self, request):
+        estado, token = self._iniciar(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _estado_actual.reset(token)
+        return self._terminar(estado, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        estado = _estado_actual.get()
+        disponibles = replicas()
+        nombre = request.resolver_match.url_name or ''
+        if estado is not None and disponibles and nombre.startswith(PREFIJOS_LECTURA):
+            estado.replica = random.choice(disponibles)
+        return None
+
+    def _iniciar(self, request):
+        estado = _Estado(fijada=COOKIE_PRIMARIA in request.COOKIES)
+        return estado, _estado_actual.set(estado)
+
+    def _terminar(self, estado, response):
+        if estado.escribio:
+            segundos = getattr(settings, 'REPLICAS_FIJAR_PRIMARIA_SEGUNDOS', 5)
+            response.set_cookie(COOKIE_PRIMARIA, '1', max_age=segundos, httponly=True, samesite='Lax')
+        return response
@@ -26,11 +26,14 @@ INSTALLED_APPS = [
 # Middleware
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'mi_app.metricas.MetricasMiddleware',  # Consultas, tiempos y bytes por vista (/metrics/)
+    'mi_proyecto.routers.EnrutadoMiddleware',  # Lecturas a réplicas (ver routers.py)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',  # Para soporte multiidioma
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'mi_app.autenticacion.TokenApiMiddleware',  # Tokens de lectura para la API (ver autenticacion.py)
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -66,6 +69,56 @@ DATABASES = {
     }
 }
 
+# Réplicas de lectura para las vistas obtener_*/buscar_* (ver mi_proyecto/routers.py).
+# Sin réplicas configuradas todo va a 'default'; perfiles: settings_postgres.py
+# y settings_replicas_local.py
+DATABASE_ROUTERS = ['mi_proyecto.routers.LecturaEscrituraRouter']
+REPLICAS_LECTURA = []
+REPLICAS_FIJAR_PRIMARIA_SEGUNDOS = 5
+
+# Caché (respuestas JSON versionadas de mi_app). En producción con varios
+# procesos conviene un backend compartido como Redis o Memcached
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mi_app',
+    }
+}
+MI_APP_CACHE_RESPUESTAS_SEGUNDOS = 3600
+# Las respuestas se guardan ya comprimidas (gzip; Brotli y zstd si están los
+# paquetes brotli/zstandard). Un listado mayor que esto se envía sin guardarse
+MI_APP_COMPRESION_MAX_BYTES = 32 * 1024 * 1024
+
+# Métricas por vista (ver mi_app/metricas.py)
+MI_APP_SERVER_TIMING = DEBUG
+MI_APP_PRESUPUESTO_CONSULTAS = 20
+# Los lotes hacen unas pocas consultas por conjunto más el refresco de
+# rankings y similares al confirmar: unas 60 con pocos libros y algo más de
+# 100 con MAX_OPERACIONES
+MI_APP_PRESUPUESTOS_POR_VISTA = {
+    'mi_app:lote_libros': 120,
+    'mi_app:lote_autores': 30,
+}
+
+# Autenticación sin consultas en el caso común (ver mi_app/autenticacion.py):
+# sesiones leídas de la caché, usuario resuelto en caché y tokens de lectura
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+AUTHENTICATION_BACKENDS = ['mi_app.autenticacion.UsuarioEnCacheBackend']
+MI_APP_USUARIO_CACHE_SEGUNDOS = 300
+MI_APP_TOKEN_API_SEGUNDOS = 300
+
+# Admin a escala para libros y comentarios: totales acotados o estimados y
+# paginación por cursor (ver mi_app/admin.py)
+MI_APP_ADMIN_A_ESCALA = True
+MI_APP_ADMIN_MAX_CONTEO = 10000
+
+# Eventos de cambios del catálogo por SSE, solo bajo ASGI (ver mi_app/eventos.py)
+MI_APP_EVENTOS_INTERVALO = 1.0
+MI_APP_EVENTOS_LATIDO = 15
+# Antigüedad mínima de una entrada de /cambios/ para entregarse; None: 0 en
+# SQLite y cambios.MARGEN_SEGUNDOS en el resto (ver mi_app/cambios.py)
+MI_APP_CAMBIOS_MARGEN_SEGUNDOS = None
+
 # Validadores de contraseñas
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
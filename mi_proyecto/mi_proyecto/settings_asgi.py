@@ -0,0 +1,46 @@
+# Perfil de despliegue ASGI (uvicorn).
+#
+# Uso:
+#   pip install uvicorn gunicorn redis
+#   MI_APP_CACHE_URL=redis://127.0.0.1:6379/1 DJANGO_SETTINGS_MODULE=mi_proyecto.settings_asgi \
+#       gunicorn mi_proyecto.asgi:application -c mi_proyecto/gunicorn_asgi.py
+#
+# o, en un solo proceso para desarrollo:
+#   DJANGO_SETTINGS_MODULE=mi_proyecto.settings_asgi uvicorn mi_proyecto.asgi:application
+#
+# Las vistas JSON de solo lectura son ``async def``: mientras esperan a la base
+# de datos el bucle de eventos atiende otras peticiones. Las vistas síncronas
+# (formularios, escrituras) siguen funcionando; Django las ejecuta en un hilo.
+import os
+
+from .settings import *  # noqa: F401,F403
+
+DEBUG = False
+
+# En ASGI cada consulta async se ejecuta en un hilo de sync_to_async y las
+# conexiones persistentes no se cierran al final de la petición desde ese hilo;
+# por eso se abre y cierra la conexión por petición (o se usa un pooler externo)
+for _alias in DATABASES:  # noqa: F405
+    DATABASES[_alias]['CONN_MAX_AGE'] = 0  # noqa: F405
+
+# Sin Server-Timing en producción; las métricas siguen en /metrics/
+MI_APP_SERVER_TIMING = False
+
+# Caché compartida entre workers (redis:// o rediss://; cualquier otra URL se
+# toma como host:puerto de Memcached). Las versiones de las respuestas, los
+# usuarios en caché, las sesiones y la versión del índice de autocompletado
+# viven ahí: con LocMem cada worker tendría las suyas y una escritura atendida
+# por uno dejaría a los demás sirviendo datos viejos. Sin MI_APP_CACHE_URL se
+# queda la LocMem de settings.py y gunicorn_asgi.py arranca un solo worker.
+MI_APP_CACHE_URL = os.environ.get('MI_APP_CACHE_URL')
+if MI_APP_CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': (
+                'django.core.cache.backends.redis.RedisCache'
+                if MI_APP_CACHE_URL.startswith(('redis://', 'rediss://'))
+                else 'django.core.cache.backends.memcached.PyMemcacheCache'
+            ),
+            'LOCATION': MI_APP_CACHE_URL,
+        }
+    }
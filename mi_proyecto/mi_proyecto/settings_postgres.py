@@ -0,0 +1,44 @@
+# Perfil PostgreSQL: una primaria para escrituras y una o más réplicas de lectura.
+#
+#   DJANGO_SETTINGS_MODULE=mi_proyecto.settings_postgres python manage.py migrate
+#
+# Variables de entorno:
+#   PG_BASE, PG_USUARIO, PG_CLAVE, PG_PUERTO      comunes a todas las conexiones
+#   PG_PRIMARIA                                   host de la primaria
+#   PG_REPLICAS                                   hosts de réplica separados por comas
+#   PG_CONN_MAX_AGE                               segundos de vida de cada conexión (60)
+#
+# Las conexiones son persistentes (CONN_MAX_AGE) y se comprueban antes de
+# reutilizarse (CONN_HEALTH_CHECKS), así una réplica reiniciada no deja
+# conexiones rotas en los workers. Con el perfil ASGI conviene CONN_MAX_AGE=0
+# y un pooler (PgBouncer) delante.
+#
+# La búsqueda de texto completo de mi_app usa FTS5 de SQLite; en PostgreSQL
+# recurre automáticamente a icontains.
+import os
+
+from .settings import *  # noqa: F401,F403
+
+
+def _conexion(host):
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('PG_BASE', 'biblioteca'),
+        'USER': os.environ.get('PG_USUARIO', 'biblioteca'),
+        'PASSWORD': os.environ.get('PG_CLAVE', ''),
+        'HOST': host,
+        'PORT': os.environ.get('PG_PUERTO', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('PG_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+    }
+
+
+DATABASES = {'default': _conexion(os.environ.get('PG_PRIMARIA', 'localhost'))}
+
+REPLICAS_LECTURA = []
+for _numero, _host in enumerate(filter(None, os.environ.get('PG_REPLICAS', '').split(',')), 1):
+    _alias = f'replica_{_numero}'
+    DATABASES[_alias] = _conexion(_host.strip())
+    # En los tests las réplicas apuntan a la base de pruebas de la primaria
+    DATABASES[_alias]['TEST'] = {'MIRROR': 'default'}
+    REPLICAS_LECTURA.append(_alias)
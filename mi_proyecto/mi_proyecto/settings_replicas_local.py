@@ -0,0 +1,23 @@
+# Perfil local con dos bases SQLite: db.sqlite3 hace de primaria y
+# db_replica.sqlite3 de réplica. Sirve para probar el enrutado sin PostgreSQL.
+#
+# SQLite no replica: hay que copiar el archivo a mano tras migrar o importar
+#   cp db.sqlite3 db_replica.sqlite3
+# y mientras tanto la réplica muestra datos "atrasados", que es justo lo que
+# permite ver la fijación a la primaria después de escribir.
+#
+#   python manage.py test mi_app --settings=mi_proyecto.settings_replicas_local
+from .settings import *  # noqa: F401,F403
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',  # noqa: F405
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_replica.sqlite3',  # noqa: F405
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+REPLICAS_LECTURA = ['replica']
@@ -0,0 +1,45 @@
+# Perfil SQLite para despliegues pequeños con escrituras concurrentes.
+#
+#   DJANGO_SETTINGS_MODULE=mi_proyecto.settings_sqlite_wal python manage.py runserver
+#
+# En cada conexión nueva:
+#   journal_mode=WAL      los lectores no bloquean al escritor ni al revés
+#   synchronous=NORMAL    en WAL es seguro ante caídas del proceso; solo una caída
+#                         del sistema puede perder las últimas transacciones
+#   busy_timeout          espera (ms) a que se libere el bloqueo en lugar de fallar
+#   mmap_size/cache_size  lecturas desde memoria mapeada y caché de páginas mayor
+#   temp_store=MEMORY     ordenaciones e índices temporales en memoria
+#
+# transaction_mode=IMMEDIATE toma el bloqueo de escritura al abrir la
+# transacción, así una transacción no falla al pasar de lectura a escritura
+# (el caso que busy_timeout no cubre). Las vistas de escritura además se
+# reintentan con espera creciente (mi_app/reintentos.py).
+#
+# Para comparar con el perfil por defecto:
+#   python manage.py benchmark_concurrencia
+#   python manage.py benchmark_concurrencia --settings=mi_proyecto.settings_sqlite_wal
+import os
+
+from .settings import *  # noqa: F401,F403
+
+_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+_MMAP_BYTES = int(os.environ.get('SQLITE_MMAP_BYTES', 256 * 1024 * 1024))
+_CACHE_KIB = int(os.environ.get('SQLITE_CACHE_KIB', 64 * 1024))
+
+DATABASES['default']['OPTIONS'] = {  # noqa: F405
+    'init_command': ';'.join([
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        f'PRAGMA busy_timeout={_BUSY_TIMEOUT_MS}',
+        f'PRAGMA mmap_size={_MMAP_BYTES}',
+        # Negativo: tamaño en KiB en lugar de en páginas
+        f'PRAGMA cache_size=-{_CACHE_KIB}',
+        'PRAGMA temp_store=MEMORY',
+    ]),
+    'transaction_mode': 'IMMEDIATE',
+    # Segundos que el driver de Python espera un bloqueo (equivalente a busy_timeout)
+    'timeout': _BUSY_TIMEOUT_MS / 1000,
+}
+# Conexiones persistentes: los pragmas se aplican una vez por conexión
+DATABASES['default']['CONN_MAX_AGE'] = 60  # noqa: F405
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True  # noqa: F405